@@ -1,30 +1,34 @@
 import os
-import uuid
-import requests
-from typing import Union, List, Dict, Any
+import time
+import asyncio
+import json
+import threading
+import itertools
+import hmac
+from typing import Union, List, Dict, Any, Tuple
 from dotenv import load_dotenv
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
-from docx import Document
 
-# LangChain - OpenAI
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+# LƯU Ý KHỞI ĐỘNG NHANH: python-docx, pandas, langchain_openai, requests... chỉ import
+# khi dùng lần đầu (hoặc trong warmup nền), để import api.py không mất vài giây.
+
+from services.result_ops import parse_followup, apply_ops, answer_followup
+from services.session_store import save_last_result, get_last_result
+from services.query_cache import get_cached_sql, set_cached_sql, get_cached_result, set_cached_result
+from services.admission import (
+    AdmissionRejected, client_limiter, client_address, batch_cost, llm_gate, hrm_gate, admission_stats,
+    PRIORITY_INTERACTIVE, PRIORITY_BATCH,
+)
 
 # ==========================================================
 # 1. SETUP & CẤU HÌNH
 # ==========================================================
 load_dotenv()
 
-# BẮT BUỘC phải có OpenAI API Key
-if not os.environ.get("OPENAI_API_KEY"):
-    raise RuntimeError("❌ Chưa cấu hình OPENAI_API_KEY")
-
-HRM_API_URL = "https://hrm.icss.com.vn/ICSS/api/execute-sql"
-
 app = FastAPI(title="ICS HRM SQL Chatbot API", version="3.0 - OpenAI")
 
 app.add_middleware(
@@ -35,23 +39,66 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Tạo thư mục lưu file tạm
-EXPORT_DIR = "./static/reports"
-if not os.path.exists(EXPORT_DIR):
-    os.makedirs(EXPORT_DIR)
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """Quá tải -> 429 + Retry-After (client tự thử lại, không phải lỗi 500)"""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+# Thư mục lưu file báo cáo (dùng chung giữa các worker)
+from services.report_store import (
+    EXPORT_DIR, atomic_save, register_report, mark_report_pending, mark_report_failed,
+    new_report_filename, get_report, sign_download, verify_download,
+)
+from services.pipeline import StageGroup
+from services.speculation import question_history, speculator, speculation_stats
+from utils import metrics
+from utils.sql_stream import SqlStreamDetector
+from utils.relative_dates import canonicalize_sql
+from services.watch import (
+    watch_scheduler, create_watch, get_watch, delete_watch, get_events, watch_stats,
+)
+from services.schema_service import schema_service, start_schema_refresher
+from services.sql_templates import sql_templates, template_stats
+from services.entity_index import entity_index, build_entity_hint, start_entity_refresher, entity_stats
+from services.answer_formatter import render_local_answer, answer_stats
+from utils.wire_format import to_columnar, encode_body, compress_body, MSGPACK_TYPES
+from utils.row_stream import RowSet, ingest_json
+from services.query_log import log_query, query_stats
+from services.cache_warmer import cache_warmer, record_question, warm_stats
+from services.answer_cache import answer_cache, answer_cache_stats
+from services.shared_cache import make_key
+from services.hrm_backends import (
+    HrmBackend, get_backend, all_backends, is_group_question, merge_results, backend_stats,
+    DEFAULT_BACKEND, GROUP_SCOPE, HRM_FANOUT_TIMEOUT,
+)
 
-from docx.shared import Inches, Pt, RGBColor
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.enum.table import WD_TABLE_ALIGNMENT
 from datetime import datetime
 
 def create_word_report(data, title="BÁO CÁO HRM", filename_prefix="report", question="", summary=""):
     """Sinh file .docx từ dữ liệu SQL - Định dạng báo cáo khoa học"""
     if not data: return None
+
+    doc, summary_para = build_word_report(data, title=title, question=question, with_summary=bool(summary))
+    fill_report_summary(summary_para, summary)
+    return save_word_report(doc, new_report_filename(filename_prefix, "docx"), question)
+
+def build_word_report(data, title="BÁO CÁO HRM", question="", with_summary=True):
+    """
+    Dựng tài liệu Word (tiêu đề, câu hỏi, bảng dữ liệu) nhưng CHƯA ghi tóm tắt.
+    Trả về (doc, đoạn giữ chỗ tóm tắt) để ghép câu trả lời của AI vào khi có.
+    """
+    from docx import Document
+    from docx.shared import Pt, RGBColor
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    from docx.enum.table import WD_TABLE_ALIGNMENT
     
-    # Đảm bảo data là list
-    if isinstance(data, dict):
-        data = [data]
+    # Đảm bảo data là RowSet (header cột + dòng tuple, duyệt dần kể cả phần nằm ở file tạm)
+    if not isinstance(data, RowSet):
+        data = RowSet.from_records(data)
     
     # 1. Khởi tạo file Word
     doc = Document()
@@ -78,19 +125,19 @@ def create_word_report(data, title="BÁO CÁO HRM", filename_prefix="report", qu
         q_run.font.size = Pt(11)
         doc.add_paragraph()
     
-    # === PHẦN TÓM TẮT KẾT QUẢ ===
-    if summary:
+    # === PHẦN TÓM TẮT KẾT QUẢ (điền sau bằng fill_report_summary) ===
+    summary_para = None
+    if with_summary:
         doc.add_heading("2. Tóm tắt kết quả", level=1)
-        summary_para = doc.add_paragraph(summary)
+        summary_para = doc.add_paragraph()
         summary_para.paragraph_format.space_after = Pt(12)
         doc.add_paragraph()
     
     # === PHẦN BẢNG DỮ LIỆU CHI TIẾT ===
-    section_num = 3 if question and summary else (2 if question or summary else 1)
+    section_num = 3 if question and with_summary else (2 if question or with_summary else 1)
     doc.add_heading(f"{section_num}. Dữ liệu chi tiết ({len(data)} bản ghi)", level=1)
     
-    # Lấy headers từ keys của dòng đầu tiên
-    headers = list(data[0].keys())
+    headers = data.columns
     
     table = doc.add_table(rows=1, cols=len(headers))
     table.style = 'Table Grid'
@@ -109,8 +156,7 @@ def create_word_report(data, title="BÁO CÁO HRM", filename_prefix="report", qu
     # Ghi dữ liệu
     for item in data:
         row_cells = table.add_row().cells
-        for i, h in enumerate(headers):
-            cell_value = item.get(h, '')
+        for i, cell_value in enumerate(item):
             row_cells[i].text = str(cell_value) if cell_value is not None else ''
             # Định dạng cell
             for paragraph in row_cells[i].paragraphs:
@@ -131,11 +177,17 @@ def create_word_report(data, title="BÁO CÁO HRM", filename_prefix="report", qu
     info_run.font.size = Pt(9)
     info_run.font.color.rgb = RGBColor(128, 128, 128)
             
-    # 3. Lưu file
-    filename = f"{filename_prefix}_{uuid.uuid4().hex[:6]}.docx"
-    filepath = os.path.join(EXPORT_DIR, filename)
-    doc.save(filepath)
-    
+    return doc, summary_para
+
+def fill_report_summary(summary_para, summary: str):
+    """Ghép phần tóm tắt vào đoạn giữ chỗ"""
+    if summary_para is not None:
+        summary_para.text = summary or "Xem dữ liệu chi tiết bên dưới."
+
+def save_word_report(doc, filename: str, question: str = "") -> str:
+    """Lưu file .docx (ghi nguyên tử) và ghi vào chỉ mục báo cáo"""
+    filepath = atomic_save(doc.save, filename)
+    register_report(filepath, question)
     return filepath
 
 def create_pdf_report(data, title="BAO CAO HRM", filename_prefix="report"):
@@ -158,9 +210,8 @@ def create_pdf_report(data, title="BAO CAO HRM", filename_prefix="report"):
         safe_str = row_str.encode('latin-1', 'replace').decode('latin-1') 
         pdf.cell(0, 10, txt=safe_str, ln=1)
         
-    filename = f"{filename_prefix}_{uuid.uuid4().hex[:6]}.pdf"
-    filepath = os.path.join(EXPORT_DIR, filename)
-    pdf.output(filepath)
+    filepath = atomic_save(pdf.output, new_report_filename(filename_prefix, "pdf"))
+    register_report(filepath)
     
     return filepath
 
@@ -169,6 +220,9 @@ def create_pdf_report(data, title="BAO CAO HRM", filename_prefix="report"):
 # ==========================================================
 class ChatRequest(BaseModel):
     question: str
+    session_id: Union[str, None] = None  # Dùng cho câu hỏi nối tiếp (sắp xếp/lọc kết quả trước)
+    compact: bool = False  # data dạng cột {columns, rows} + orjson/msgpack + nén (kết quả lớn)
+    tenant: Union[str, None] = None  # HRM của công ty nào (mặc định: header X-Tenant / HRM_DEFAULT_BACKEND)
 
 
 class ChatResponse(BaseModel):
@@ -176,46 +230,38 @@ class ChatResponse(BaseModel):
     data: Union[List, Dict, Any, None]
     answer: str
     download_url: Union[str, None] = None
+    total_rows: Union[int, None] = None  # Tổng số dòng khi data chỉ chứa RESPONSE_MAX_ROWS dòng đầu
+    missing_backends: Union[Dict[str, str], None] = None  # Câu hỏi cấp tập đoàn: công ty chưa có dữ liệu (lý do)
 
 
 # ==========================================================
-# 3. KHỞI TẠO LLM (OPENAI)
+# 3. KHỞI TẠO LLM (OPENAI) - tạo khi dùng lần đầu
 # ==========================================================
-llm = ChatOpenAI(
-    model="gpt-4o-mini",   # ✅ Nhanh – rẻ – ổn cho SQL + RAG
-    temperature=0,
-    max_tokens=600   # đủ cho SQL + trả lời
-)
+_llm = None
+_llm_lock = threading.Lock()
+
+def get_llm():
+    """Tạo ChatOpenAI lần đầu được gọi (import api.py không cần API key)"""
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                # BẮT BUỘC phải có OpenAI API Key
+                if not os.environ.get("OPENAI_API_KEY"):
+                    raise RuntimeError("❌ Chưa cấu hình OPENAI_API_KEY")
+                from langchain_openai import ChatOpenAI
+                _llm = ChatOpenAI(
+                    model="gpt-4o-mini",   # ✅ Nhanh – rẻ – ổn cho SQL + RAG
+                    temperature=0,
+                    max_tokens=600   # đủ cho SQL + trả lời
+                )
+    return _llm
 # ==========================================================
 # 2. SCHEMA & LUẬT NGHIỆP VỤ (Nguồn: HRM_SCHEMA.docx)
+#    Phần schema chi tiết sinh tự động từ information_schema (services/schema_service.py)
 # ==========================================================
-HRM_SCHEMA_RAW = """
--- CHẤM CÔNG [Source: 7] --
-BẢNG cham_cong: id, nhan_vien_id, ngay (date), check_in (time), check_out (time).
-
--- NHÂN SỰ [Source: 12] --
-BẢNG nhanvien: id, ho_ten, email, so_dien_thoai, phong_ban_id, chuc_vu, vai_tro, luong_co_ban, trang_thai_lam_viec, ngay_vao_lam.
-BẢNG phong_ban: id, ten_phong, truong_phong_id [Source: 13].
-
--- LƯƠNG & KPI [Source: 10, 11] --
-BẢNG luong: id, nhan_vien_id, thang, nam, luong_co_ban, phu_cap, khoan_tru.
-BẢNG luu_kpi: id, nhan_vien_id, thang, nam, diem_kpi, xep_loai.
-BẢNG ngay_phep_nam: id, nhan_vien_id, nam, tong_ngay_phep, ngay_phep_con_lai.
-
--- DỰ ÁN & CÔNG VIỆC [Source: 7, 8, 9] --
-BẢNG du_an: id, ten_du_an, lead_id (PM), phong_ban (varchar), trang_thai_duan, ngay_ket_thuc.
-BẢNG cong_viec: id, ten_cong_viec, nguoi_giao_id, han_hoan_thanh, trang_thai, muc_do_uu_tien, du_an_id.
-BẢNG cong_viec_nguoi_nhan: id, cong_viec_id, nhan_vien_id.
-BẢNG cong_viec_tien_do: id, cong_viec_id, phan_tram.
-
--- TÀI LIỆU & HỆ THỐNG [Source: 14] --
-BẢNG tai_lieu: id, ten_tai_lieu, mo_ta, link_tai_lieu, nguoi_tao_id.
-BẢNG thong_bao: id, tieu_de, noi_dung, nguoi_nhan_id.
-
-"""
-
-# Kết hợp Schema thô với Luật nghiệp vụ (Enhanced Schema)
-HRM_SCHEMA_ENHANCED = f"""
+# Luật nghiệp vụ; schema thật được ghép vào sau bởi get_schema_prompt()
+HRM_RULES = """
 DANH SÁCH BẢNG VÀ LUẬT NGHIỆP VỤ BẮT BUỘC (DATA TRUTH):
 
 1. **QUY TẮC ĐI MUỘN (08:06 RULE) - BẮT BUỘC:**
@@ -309,7 +355,7 @@ DANH SÁCH BẢNG VÀ LUẬT NGHIỆP VỤ BẮT BUỘC (DATA TRUTH):
       - Bắt buộc JOIN bảng `nhanvien` (alias `nv`).
       - Điều kiện: `du_an.lead_id = nv.id`.
       - Lấy cột: `nv.ho_ten`.
-    - **Logic lọc trạng thái:** Dùng `trang_thai LIKE '%Ngưng%'` hoặc `LIKE '%Dừng%'`.
+    - **Logic lọc trạng thái:** Dùng `trang_thai_duan LIKE '%Ngưng%'` hoặc `LIKE '%Dừng%'`.
     - **Logic tiến độ:** Vẫn giữ nguyên công thức tính AVG từ bảng `cong_viec` để biết dự án dừng ở mức nào.
 
 13. **LUẬT HIỆU SUẤT NHÂN SỰ (PERFORMANCE):**
@@ -323,7 +369,7 @@ DANH SÁCH BẢNG VÀ LUẬT NGHIỆP VỤ BẮT BUỘC (DATA TRUTH):
    - Tuyệt đối không dùng `du_an.trang_thai` (sẽ gây lỗi SQL).
 
 11. **LUẬT DỰ ÁN TẠM NGƯNG:**
-    - Khi lọc dự án tạm ngưng, dùng điều kiện: `d.trang_thai_du_an LIKE '%Ngưng%'`.
+    - Khi lọc dự án tạm ngưng, dùng điều kiện: `d.trang_thai_duan LIKE '%Ngưng%'`.
     - Vẫn tính toán tiến độ trung bình từ `cong_viec` để hiển thị mức độ dở dang.
 
 12. **LUẬT XÁC ĐỊNH CÔNG VIỆC TRỄ HẠN (OVERDUE RULE):**
@@ -369,15 +415,13 @@ DANH SÁCH BẢNG VÀ LUẬT NGHIỆP VỤ BẮT BUỘC (DATA TRUTH):
     - **Điều kiện:** Tìm kiếm trong cột `chuc_vu` hoặc `vai_tro`.
     - **Từ khóa lọc:** Sử dụng `LIKE '%Giám đốc%'`, `LIKE '%CEO%'`, hoặc `LIKE '%Chủ tịch%'`.
     - **SQL mẫu:** `SELECT ho_ten, chuc_vu, email FROM nhanvien WHERE chuc_vu LIKE '%Giám đốc%' OR chuc_vu LIKE '%CEO%'`.
-    
-SCHEMA CHI TIẾT:
-{HRM_SCHEMA_RAW}
 """
 
+def get_schema_prompt() -> str:
+    """Luật nghiệp vụ + schema chi tiết theo version schema hiện tại"""
+    return schema_service.prompt(HRM_RULES)
+
 # ==========================================================
-import pandas as pd
-import re
-from langchain_core.prompts import PromptTemplate
 # Nhớ import các hàm tạo file chúng ta đã viết ở bước trước
 # from report_generator import create_word_report, create_pdf_report (hoặc để chung file cũng được)
 
@@ -387,7 +431,7 @@ def generate_sql_from_llm(question):
     Gửi Schema và câu hỏi cho AI để nhận lại câu lệnh SQL
     """
     template = f"""
-    {HRM_SCHEMA_ENHANCED}
+    {get_schema_prompt()}
     
     Dựa trên quy tắc và schema trên, hãy viết câu lệnh SQL để trả lời câu hỏi: "{question}"
     
@@ -402,8 +446,9 @@ def generate_sql_from_llm(question):
     # return response.content.strip().replace("```sql", "").replace("```", "")
     
     # [CODE MẪU CHO LANGCHAIN]:
+    from langchain_core.prompts import PromptTemplate
     prompt = PromptTemplate.from_template(template)
-    chain = prompt | llm 
+    chain = prompt | get_llm() 
     sql = chain.invoke({})
     
     # Làm sạch chuỗi SQL (xóa markdown thừa nếu có)
@@ -428,7 +473,7 @@ def generate_natural_response(question, data):
     Nếu dữ liệu là danh sách dài, hãy chỉ tóm tắt các con số quan trọng (Tổng số, Top đầu...).
     """
     
-    return llm.invoke(prompt).content
+    return get_llm().invoke(prompt).content
 
 # --- 3. HÀM XỬ LÝ CHÍNH (MAIN HANDLER) ---
 def handle_query(question):
@@ -502,7 +547,7 @@ def handle_query(question):
 # ==========================================================
 
 # --- PROMPT 1: SINH SQL (Kèm Few-Shot Learning) ---
-SQL_PROMPT = ChatPromptTemplate.from_template("""
+SQL_PROMPT_TEMPLATE = """
 Bạn là SQL Generation Engine. Nhiệm vụ: Chuyển câu hỏi thành SQL Server/MySQL query tối ưu.
 
 ⛔ BỘ LUẬT CẤM (CRITICAL RULES):
@@ -530,7 +575,7 @@ User: "Lương cơ bản của Nam là bao nhiêu?"
   -> SQL: SELECT ten_du_an, ngay_ket_thuc FROM du_an WHERE ngay_ket_thuc < CURRENT_DATE AND trang_thai_duan != 'Đã hoàn thành'
 
 - User: "Liệt kê các dự án quá hạn và tên người quản lý?"
-  -> SQL: SELECT d.ten_du_an, n.ho_ten, d.ngay_ket_thuc FROM du_an d JOIN nhanvien n ON d.lead_id = n.id WHERE d.ngay_ket_thuc < CURRENT_DATE AND d.trang_thai_du_an != 'Đã hoàn thành'
+  -> SQL: SELECT d.ten_du_an, n.ho_ten, d.ngay_ket_thuc FROM du_an d JOIN nhanvien n ON d.lead_id = n.id WHERE d.ngay_ket_thuc < CURRENT_DATE AND d.trang_thai_duan != 'Đã hoàn thành'
 
 - User: "Tiến độ hiện tại của công việc 'Lên phương án hợp tác với TPX' đến đâu rồi?"
   -> SQL: SELECT td.phan_tram, td.thoi_gian_cap_nhat FROM cong_viec_tien_do td JOIN cong_viec cv ON td.cong_viec_id = cv.id WHERE cv.ten_cong_viec LIKE '%Lên phương án hợp tác với TPX%' ORDER BY td.thoi_gian_cap_nhat DESC LIMIT 1
@@ -545,7 +590,7 @@ User: "Liệt kê các công việc đã hoàn thành trên 50%?"
   -> SQL: SELECT COUNT(cv.id) AS so_luong FROM cong_viec cv JOIN cong_viec_tien_do td ON cv.id = td.cong_viec_id WHERE td.phan_tram > 50 AND td.thoi_gian_cap_nhat = (SELECT MAX(thoi_gian_cap_nhat) FROM cong_viec_tien_do WHERE cong_viec_id = cv.id)                        
 
 User: "Thống kê số lượng dự án theo từng trạng thái?"
-  -> SQL: SELECT trang_thai_du_an, COUNT(id) FROM du_an GROUP BY trang_thai_du_an
+  -> SQL: SELECT trang_thai_duan, COUNT(id) FROM du_an GROUP BY trang_thai_duan
                                               
 User: "Liệt kê những dự án đã hoàn thành trên 80%?"
   -> SQL: SELECT d.ten_du_an, AVG(td.phan_tram) as tien_do_tb FROM du_an d JOIN cong_viec cv ON d.id = cv.du_an_id JOIN cong_viec_tien_do td ON cv.id = td.cong_viec_id WHERE td.thoi_gian_cap_nhat = (SELECT MAX(thoi_gian_cap_nhat) FROM cong_viec_tien_do WHERE cong_viec_id = cv.id) GROUP BY d.id, d.ten_du_an HAVING AVG(td.phan_tram) > 80          
@@ -571,17 +616,17 @@ User: "Liệt kê những dự án đã hoàn thành trên 80%?"
   -> SQL: SELECT trang_thai_duan, COUNT(id) as so_luong FROM du_an GROUP BY trang_thai_duan
 
 - User: "Có bao nhiêu dự án đang ở trạng thái 'Đang thực hiện'?"
-  -> SQL: SELECT COUNT(id) as so_luong FROM du_an WHERE trang_thai_du_an LIKE '%Đang thực hiện%'                                                                                          
+  -> SQL: SELECT COUNT(id) as so_luong FROM du_an WHERE trang_thai_duan LIKE '%Đang thực hiện%'                                                                                          
 
 - User: "Những dự án nào đang bị tạm ngưng và ai là quản lý?"
-  -> SQL: SELECT d.ten_du_an, d.trang_thai, COALESCE(AVG(td.phan_tram), 0) as tien_do_luc_dung, nv.ho_ten as quan_ly_du_an
+  -> SQL: SELECT d.ten_du_an, d.trang_thai_duan, COALESCE(AVG(td.phan_tram), 0) as tien_do_luc_dung, nv.ho_ten as quan_ly_du_an
           FROM du_an d 
           LEFT JOIN cong_viec cv ON d.id = cv.du_an_id 
           LEFT JOIN cong_viec_tien_do td ON cv.id = td.cong_viec_id 
           AND td.thoi_gian_cap_nhat = (SELECT MAX(thoi_gian_cap_nhat) FROM cong_viec_tien_do WHERE cong_viec_id = cv.id)
           LEFT JOIN nhanvien nv ON d.lead_id = nv.id
-          WHERE d.trang_thai LIKE '%Ngưng%' OR d.trang_thai LIKE '%Dừng%'
-          GROUP BY d.id, d.ten_du_an, d.trang_thai, nv.ho_ten
+          WHERE d.trang_thai_duan LIKE '%Ngưng%' OR d.trang_thai_duan LIKE '%Dừng%'
+          GROUP BY d.id, d.ten_du_an, d.trang_thai_duan, nv.ho_ten
 
 # --- Kịch bản: Hỏi thông tin Lead của một dự án cụ thể ---
 - User: "Ai đang phụ trách dự án 'Oracle Cloud' và tiến độ thế nào?"
@@ -667,10 +712,10 @@ CÂU HỎI:
 {question}
 
 SQL OUTPUT (Only SQL):
-""")
+"""
 
 # --- PROMPT 2: ĐỌC BÁO CÁO (Humanize Answer) ---
-ANSWER_PROMPT = ChatPromptTemplate.from_template("""
+ANSWER_PROMPT_TEMPLATE = """
 Bạn là trợ lý HRM thông minh.
 Nhiệm vụ: Đọc dữ liệu JSON và trả lời câu hỏi của người dùng.
 
@@ -715,34 +760,140 @@ GIỌNG ĐIỆU:
 Tự nhiên, thân thiện, chuyên nghiệp, giống trợ lý nội bộ doanh nghiệp.
 
 TRẢ LỜI:
-""")
+"""
+# Đổi prompt trả lời -> version đổi -> câu trả lời đã cache theo prompt cũ tự hết hiệu lực
+ANSWER_PROMPT_VERSION = make_key(ANSWER_PROMPT_TEMPLATE)[:8]
+
+_chains = {}
+
+def get_sql_chain():
+    """Chain sinh SQL: SQL_PROMPT | llm | StrOutputParser (tạo 1 lần cho mỗi llm)"""
+    return _get_chain("sql", SQL_PROMPT_TEMPLATE)
+
+def get_answer_chain():
+    """Chain đọc dữ liệu và trả lời: ANSWER_PROMPT | llm | StrOutputParser"""
+    return _get_chain("answer", ANSWER_PROMPT_TEMPLATE)
+
+def _get_chain(name: str, template: str):
+    llm = get_llm()
+    cached = _chains.get(name)
+    if cached is None or cached[0] is not llm:
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_core.output_parsers import StrOutputParser
+        cached = (llm, ChatPromptTemplate.from_template(template) | llm | StrOutputParser())
+        _chains[name] = cached
+    return cached[1]
 
 
 # ==========================================================
 # 4.5. DOWNLOAD FILE ENDPOINT
 # ==========================================================
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
+from email.utils import formatdate, parsedate_to_datetime
 import os
+import stat
 
-@app.get("/download/{filename}")
-async def download_file(filename: str):
-    """Serve exported files (docx/pdf) for download"""
-    # Security: Validate filename to prevent directory traversal
-    if "../" in filename or "..\\" in filename:
-        raise HTTPException(status_code=400, detail="Invalid filename")
-    
-    filepath = os.path.join(EXPORT_DIR, filename)
-    
-    # Check if file exists
-    if not os.path.exists(filepath):
+# Đặt sau nginx: DOWNLOAD_ACCEL_PREFIX=/protected-reports/ -> nginx tự gửi file bằng sendfile
+DOWNLOAD_ACCEL_PREFIX = os.environ.get("DOWNLOAD_ACCEL_PREFIX", "")
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+def _parse_range(range_header: str, size: int):
+    """'bytes=a-b' -> (start, end) | None (không dùng Range) | "invalid" (416). Nhiều khoảng -> trả cả file"""
+    if not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start_text, _, end_text = range_header[6:].strip().partition("-")
+    try:
+        if start_text == "":
+            length = int(end_text)  # bytes=-500: 500 byte cuối
+            if length <= 0:
+                return "invalid"
+            return max(0, size - length), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return "invalid"
+    return start, min(end, size - 1)
+
+def _iter_file_range(filepath: str, start: int, end: int):
+    with open(filepath, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+@app.api_route("/download/{token}", methods=["GET", "HEAD"])
+async def download_file(token: str, request: Request):
+    """Serve exported files (docx/pdf) for download - token ký có hạn dùng, hỗ trợ 304 và Range"""
+    filename, status = verify_download(token)  # secret đã nạp sẵn trong RAM sau lần đầu
+    if status == "expired":
+        raise HTTPException(status_code=410, detail="Link tải đã hết hạn")
+    if filename is None:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    info = await asyncio.to_thread(get_report, filename)
+    if not info or info.get("status") != "ready":
+        if info and info.get("status") == "pending":
+            # Báo cáo vẫn đang được dựng ở nền
+            return JSONResponse(status_code=202, content={"detail": "Báo cáo đang được tạo"},
+                                headers={"Retry-After": "1"})
         raise HTTPException(status_code=404, detail="File not found")
-    
-    # Return file for download
-    return FileResponse(
-        filepath,
-        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        filename=filename
-    )
+
+    size, etag = info["size"], info["etag"]
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(info["mtime"], usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=86400, immutable",  # Tên file không bao giờ bị ghi đè
+    }
+
+    # Trình duyệt / proxy đã có bản giống hệt -> 304, không gửi lại nội dung
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        if etag in [t.strip() for t in if_none_match.split(",")] or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=headers)
+    elif request.headers.get("if-modified-since"):
+        try:
+            if parsedate_to_datetime(request.headers["if-modified-since"]).timestamp() >= int(info["mtime"]):
+                return Response(status_code=304, headers=headers)
+        except (TypeError, ValueError):
+            pass
+
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    filepath = os.path.join(EXPORT_DIR, filename)
+    media_type = info["media_type"]
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if request.headers.get("range") and (not if_range or if_range == etag):
+        byte_range = _parse_range(request.headers["range"], size)
+    if byte_range == "invalid":
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if DOWNLOAD_ACCEL_PREFIX:
+        # nginx đọc file bằng sendfile (zero-copy), tự xử lý Range; app chỉ kiểm tra quyền + metadata
+        headers["X-Accel-Redirect"] = DOWNLOAD_ACCEL_PREFIX.rstrip("/") + "/" + filename
+        return Response(media_type=media_type, headers=headers)
+
+    if byte_range is not None:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        if request.method == "HEAD":
+            return Response(status_code=206, media_type=media_type, headers=headers)
+        return StreamingResponse(_iter_file_range(filepath, start, end), status_code=206,
+                                 media_type=media_type, headers=headers)
+
+    # Metadata lấy từ chỉ mục (không stat file); FileResponse dùng đường gửi file của server (pathsend) nếu có
+    stat_result = os.stat_result((stat.S_IFREG | 0o644, 0, 0, 1, 0, 0, size, info["mtime"], info["mtime"], info["mtime"]))
+    headers.pop("Content-Disposition")
+    return FileResponse(filepath, media_type=media_type, filename=filename, headers=headers,
+                        stat_result=stat_result)
 
 # ==========================================================
 # 4. HELPER FUNCTIONS (Xử lý & Gọi API)
@@ -760,43 +911,367 @@ def validate_sql(sql: str) -> str:
     
     return sql_clean
 
-def execute_sql_api(sql: str) -> Any:
-    """Gọi API HRM để lấy dữ liệu"""
-    if not sql: return None
+# Giới hạn số dòng đưa vào prompt tóm tắt / trả về client (toàn bộ dữ liệu vẫn có trong file báo cáo)
+ANSWER_MAX_ROWS = int(os.environ.get("ANSWER_MAX_ROWS", "200"))
+RESPONSE_MAX_ROWS = int(os.environ.get("RESPONSE_MAX_ROWS", "5000"))
+
+def get_hrm_session(backend: Union[HrmBackend, None] = None):
+    """HTTP session tới HRM (tạo lần đầu, giữ kết nối keep-alive cho các lần sau)"""
+    return (backend or get_backend()).session()
 
-    # Log query ra terminal để debug
-    print(f"\n[DEBUG SQL]: {sql}")
+def request_scope(question: str, request: Request, tenant: Union[str, None] = None) -> Tuple[HrmBackend, bool, str]:
+    """(backend của tenant, có phải câu hỏi cấp tập đoàn, scope dùng cho key cache)"""
+    backend = get_request_backend(request, tenant)
+    group = is_group_question(question)
+    return backend, group, GROUP_SCOPE if group else backend.id
 
+def get_request_backend(request: Request, tenant: Union[str, None] = None) -> HrmBackend:
+    """HRM của tenant gửi request (trường tenant / header X-Tenant, mặc định HRM_DEFAULT_BACKEND)"""
+    tenant = tenant or request.headers.get("x-tenant")
+    try:
+        return get_backend(tenant)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Không có HRM nào cho tenant '{tenant}'")
+
+HRM_STREAM_CHUNK_SIZE = 64 * 1024
+
+def fetch_rows(sql: str, question: str = "", backend: Union[HrmBackend, None] = None) -> Union[RowSet, str, None]:
+    """
+    Gọi API HRM, đọc body dạng stream -> RowSet (tuple + header, phần lớn ghi ra file tạm).
+    Body không phải JSON -> trả text như cũ; lỗi -> chuỗi bắt đầu bằng "Lỗi".
+    Mỗi lần gọi được ghi vào query log (thời gian, số dòng, byte, lỗi).
+    """
+    if not sql: return None
+
+    backend = backend or get_backend()
+    started = time.perf_counter()
+    result = _fetch_rows(sql, backend)
+    is_rows = isinstance(result, RowSet)
+    log_query(sql, question, time.perf_counter() - started, backend=backend.id,
+              rows=len(result) if is_rows else None,
+              nbytes=result.nbytes if is_rows else None,
+              error=result if isinstance(result, str) and result.startswith("Lỗi") else None)
+    return result
+
+def _fetch_rows(sql: str, backend: HrmBackend) -> Union[RowSet, str]:
     try:
         payload = {"command": sql}
-        res = requests.post(HRM_API_URL, json=payload, timeout=30)
-        
-        if res.status_code == 200:
+        with backend.session().post(backend.url, json=payload, timeout=backend.timeout, stream=True) as res:
+            if res.status_code != 200:
+                print(f"❌ API Error {res.status_code}: {res.text}")
+                return f"Lỗi từ hệ thống dữ liệu: {res.text}"
+
+            chunks = res.iter_content(HRM_STREAM_CHUNK_SIZE)
+            first = next((c for c in chunks if c), b"")
+            if not first.lstrip(b"\xef\xbb\xbf \t\r\n")[:1] in (b"[", b"{"):
+                # Không phải JSON -> trả nguyên văn
+                return (first + b"".join(chunks)).decode(res.encoding or "utf-8", errors="replace")
             try:
-                # Ưu tiên trả về JSON object
-                return res.json()
-            except:
-                return res.text
-        else:
-            print(f"❌ API Error {res.status_code}: {res.text}")
-            return f"Lỗi từ hệ thống dữ liệu: {res.text}"
+                rows = ingest_json(itertools.chain([first], chunks))
+            except ValueError as e:
+                print(f"❌ JSON HRM không hợp lệ: {e}")
+                return "Lỗi từ hệ thống dữ liệu: dữ liệu trả về không hợp lệ."
     except Exception as e:
         print(f"❌ Connection Error: {e}")
         return "Lỗi kết nối đến máy chủ dữ liệu."
 
+    metrics.incr("hrm.rows", len(rows))
+    metrics.incr("hrm.bytes", rows.nbytes)
+    if rows.spilled:
+        metrics.incr("hrm.spilled")
+    if rows.truncated:
+        metrics.incr("hrm.truncated")
+        print(f"⚠️ Kết quả vượt {len(rows)} dòng -> đã dừng đọc")
+    return rows
+
+def execute_sql_api(sql: str) -> Any:
+    """Gọi API HRM để lấy dữ liệu (list dict - cho các luồng nền cần toàn bộ bản ghi)"""
+    data = fetch_rows(sql)
+    return data.records() if isinstance(data, RowSet) else data
+
+async def execute_sql_cached(sql: str, priority: int = PRIORITY_INTERACTIVE, question: str = "",
+                             backend: Union[HrmBackend, None] = None, fresh: bool = False) -> Any:
+    """
+    Chạy SQL qua HRM -> RowSet, dùng lại kết quả vừa chạy gần đây nếu có (cache dùng chung).
+    fresh=True: luôn hỏi HRM (watch cần dữ liệu mới nhất), kết quả vẫn được ghi lại vào cache.
+    """
+    backend = backend or get_backend()
+    cached = None if fresh else await asyncio.to_thread(get_cached_result, sql, backend.id)
+    if cached is not None:
+        metrics.incr("result_cache.hit")
+        return RowSet.from_cached(cached)
+    async with hrm_gate.slot(priority):
+        data_result = await asyncio.to_thread(fetch_rows, sql, question, backend)
+    # Chỉ cache kết quả nằm gọn trong RAM (dạng cột); kết quả đã tràn ra file tạm thì không
+    if isinstance(data_result, RowSet) and not data_result.spilled and not data_result.truncated:
+        await asyncio.to_thread(set_cached_result, sql, data_result.to_compact(), backend.id)
+    return data_result
+
+async def execute_sql_fanout(sql: str, priority: int = PRIORITY_INTERACTIVE,
+                             question: str = "") -> Tuple[Any, Dict[str, str]]:
+    """
+    Câu hỏi cấp tập đoàn: chạy cùng SQL song song trên mọi HRM, gộp kết quả tại chỗ.
+    Backend quá hạn / lỗi bị bỏ qua -> (kết quả một phần, {tên công ty: lý do thiếu})
+    """
+    backends = all_backends()
+
+    async def _run(backend: HrmBackend):
+        return await asyncio.wait_for(execute_sql_cached(sql, priority, question, backend),
+                                      min(backend.timeout, HRM_FANOUT_TIMEOUT))
+
+    outcomes = await asyncio.gather(*[_run(b) for b in backends], return_exceptions=True)
+    results, missing = [], {}
+    for backend, outcome in zip(backends, outcomes):
+        if isinstance(outcome, asyncio.TimeoutError):
+            missing[backend.name] = "quá thời gian chờ"
+        elif isinstance(outcome, BaseException):
+            missing[backend.name] = str(outcome) or type(outcome).__name__
+        elif isinstance(outcome, str) or outcome is None:
+            missing[backend.name] = outcome or "không có dữ liệu"
+        else:
+            results.append((backend, outcome))
+    metrics.incr("hrm.fanout")
+    if missing:
+        metrics.incr("hrm.fanout_partial")
+        print(f"⚠️ Fan-out thiếu dữ liệu: {missing}")
+    if not results:
+        return "Lỗi: không HRM nào trả được dữ liệu.", missing
+    return merge_results(sql, results), missing
+
+async def execute_routed(sql: str, priority: int, question: str, backend: HrmBackend,
+                         group: bool) -> Tuple[Any, Dict[str, str]]:
+    """HRM của tenant, hoặc fan-out mọi HRM cho câu hỏi cấp tập đoàn -> (kết quả, backend thiếu)"""
+    if group:
+        return await execute_sql_fanout(sql, priority, question)
+    return await execute_sql_cached(sql, priority, question, backend), {}
+
+async def warm_question(question: str) -> None:
+    """
+    Làm nóng 1 câu hỏi cao điểm trên HRM mặc định: SQL (cache hoặc LLM) rồi chạy sẵn kết quả.
+    Chạy trước giờ hỏi WARM_LEAD_SECONDS (< RESULT_CACHE_TTL) nên kết quả còn hạn khi request tới.
+    """
+    sql = await asyncio.to_thread(get_cached_sql, question)
+    if sql is None:
+        async with llm_gate.slot(PRIORITY_BATCH):
+            sql = validate_sql(await generate_sql_text(question))
+        if not sql:
+            return
+        sql, sql_periods = canonicalize_sql(sql)
+        await asyncio.to_thread(set_cached_sql, question, sql, sql_periods)
+    if "NO_DATA" not in sql:
+        await execute_sql_cached(sql, PRIORITY_BATCH, question)
+
+def missing_note(missing: Dict[str, str]) -> str:
+    if not missing:
+        return ""
+    return "\n\n⚠️ Kết quả chưa gồm: " + "; ".join(f"{name} ({reason})" for name, reason in missing.items())
+
+def response_rows(data_result: Any) -> Any:
+    """Dữ liệu trả về client: tối đa RESPONSE_MAX_ROWS dòng đầu (tổng số dòng nằm ở total_rows)"""
+    if isinstance(data_result, RowSet):
+        return data_result.records(RESPONSE_MAX_ROWS)
+    return data_result
+
+# Bật để đo: vẫn nhận hết output LLM ở nền (như trước đây) và ghi lại thời gian tiết kiệm được
+SQL_STREAM_MEASURE = os.environ.get("SQL_STREAM_MEASURE", "0") == "1"
+
+async def generate_sql_text(question: str, entity_hints: bool = True) -> str:
+    """
+    Sinh SQL dạng stream: dừng nhận token ngay khi đã có đủ 1 câu lệnh hoàn chỉnh
+    (phần giải thích / markdown phía sau bị hủy), để validate + gọi HRM bắt đầu sớm nhất.
+    """
+    started = time.perf_counter()
+    detector = SqlStreamDetector()
+    # Không dùng stop=";" phía provider: dấu ; trong chuỗi '...' sẽ cắt nhầm câu lệnh,
+    # SqlStreamDetector đã nhận ra dấu ; kết thúc (ngoài chuỗi) và đóng stream
+    chain = get_sql_chain()
+    # Tên người / phòng / dự án đã biết -> đổi sẵn ra id để LLM dùng `id = N` thay cho LIKE
+    # (chỉ mục lấy từ HRM mặc định -> id không dùng được cho HRM công ty khác)
+    entity_hint = build_entity_hint(entity_index.resolve(question)) if entity_hints else ""
+    stream = chain.astream({
+        "schema": get_schema_prompt(),
+        "question": question + entity_hint
+    })
+    stopped_early = False
+    try:
+        async for chunk in stream:
+            if detector.feed(chunk):
+                stopped_early = True
+                break
+    finally:
+        if not (SQL_STREAM_MEASURE and stopped_early):
+            await stream.aclose()  # Đóng stream -> hủy phần sinh còn lại phía provider
+
+    elapsed = time.perf_counter() - started
+    metrics.incr("sql_stream.calls")
+    metrics.incr("sql_stream.seconds_to_statement", elapsed)
+    if stopped_early:
+        metrics.incr("sql_stream.early_stop")
+        if SQL_STREAM_MEASURE:
+            asyncio.ensure_future(_drain_and_measure(stream, started, elapsed))
+    return detector.statement()
+
+async def _drain_and_measure(stream, started: float, statement_seconds: float):
+    """Đọc nốt output như cách cũ để biết mỗi câu tiết kiệm được bao nhiêu giây"""
+    try:
+        async for _ in stream:
+            pass
+    finally:
+        await stream.aclose()
+    saved = time.perf_counter() - started - statement_seconds
+    metrics.incr("sql_stream.shadow_samples")
+    metrics.incr("sql_stream.saved_seconds", saved)
+
+ANSWER_STAGE_TIMEOUT = float(os.environ.get("ANSWER_STAGE_TIMEOUT", "60"))
+REPORT_STAGE_TIMEOUT = float(os.environ.get("REPORT_STAGE_TIMEOUT", "10"))
+
+async def generate_answer(question: str, data_result: Any, priority: int = PRIORITY_INTERACTIVE) -> str:
+    """Kết quả đơn giản -> trả lời bằng template; còn lại gửi cả Data rỗng cho AI để nó "chém gió" dựa trên Prompt mới"""
+    data_text, local_answer = str(data_result), None
+    if isinstance(data_result, RowSet):
+        # Kết quả lớn: AI chỉ thấy ANSWER_MAX_ROWS dòng đầu + tổng số dòng
+        data_text = data_result.preview_text(ANSWER_MAX_ROWS)
+        if len(data_result) <= ANSWER_MAX_ROWS:
+            local_answer = render_local_answer(question, data_result.records())
+    else:
+        local_answer = render_local_answer(question, data_result)
+    if local_answer is not None:
+        metrics.incr("answer.local")
+        return local_answer
+
+    async def _llm() -> str:
+        metrics.incr("answer.llm")
+        async with llm_gate.slot(priority):
+            return await get_answer_chain().ainvoke({
+                "question": question,
+                "data": data_text
+            })
+
+    # Cùng câu hỏi (đã chuẩn hóa) + cùng dữ liệu -> dùng lại câu trả lời đã sinh
+    key = await asyncio.to_thread(answer_cache.key, question, data_result, ANSWER_PROMPT_VERSION)
+    return await answer_cache.get_or_generate(key, _llm)
+
+async def build_report_stage(data, question: str, filename: str, summary_task: "asyncio.Future") -> str:
+    """Stage xuất Word: dựng bảng song song lúc AI viết tóm tắt, ghép tóm tắt vào khi có rồi mới lưu"""
+    try:
+        doc, summary_para = await asyncio.to_thread(
+            build_word_report, data, "BÁO CÁO TRUY VẤN HRM", question
+        )
+        try:
+            summary = await asyncio.wait_for(asyncio.shield(summary_task), ANSWER_STAGE_TIMEOUT)
+        except Exception:
+            summary = ""  # Tóm tắt lỗi/chậm -> báo cáo vẫn có dữ liệu chi tiết
+        fill_report_summary(summary_para, summary)
+        return await asyncio.to_thread(save_word_report, doc, filename, question)
+    except Exception as e:
+        print(f"Error creating word report: {e}")
+        await asyncio.to_thread(mark_report_failed, filename)
+        raise
+
+def is_export_request(question: str) -> bool:
+    """Người dùng có yêu cầu xuất file báo cáo không"""
+    q_lower = question.lower()
+    return "word" in q_lower or "docx" in q_lower or "văn bản" in q_lower or "xuất" in q_lower or "file" in q_lower
+
+def get_client_id(request: Request) -> str:
+    """Định danh client cho rate limit (IP gốc từ X-Forwarded-For chỉ khi đi qua proxy tin cậy)"""
+    return client_address(request.client.host if request.client else None, request.headers.get("x-forwarded-for"))
+
+def get_priority(request: Request, question: str) -> int:
+    """UI tương tác được ưu tiên hơn traffic batch / xuất file"""
+    if request.headers.get("x-priority", "").lower() == "batch" or is_export_request(question):
+        return PRIORITY_BATCH
+    return PRIORITY_INTERACTIVE
+
 # ==========================================================
 # 5. MAIN ENDPOINT (Luồng xử lý chính)
 # ==========================================================
+def compact_response(resp: ChatResponse, request: Request) -> Response:
+    """ChatResponse ở định dạng gọn: data dạng cột, serialize theo Accept, nén theo Accept-Encoding"""
+    payload = {
+        "sql": resp.sql,
+        "data": to_columnar(resp.data),
+        "answer": resp.answer,
+        "download_url": resp.download_url,
+        "total_rows": resp.total_rows,
+        "missing_backends": resp.missing_backends,
+        "format": "columnar",
+    }
+    body, media_type = encode_body(payload, request.headers.get("accept", ""))
+    body, encoding = compress_body(body, request.headers.get("accept-encoding", ""))
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(req: ChatRequest):
+async def chat_endpoint(req: ChatRequest, request: Request):
+    started = time.perf_counter()
+    # Định tuyến: HRM của tenant, hoặc mọi HRM với câu hỏi cấp tập đoàn (tenant lạ -> 400)
+    route = request_scope(req.question, request, req.tenant)
+    resp = await _chat(req, request, route)
+    if route[2] == DEFAULT_BACKEND:
+        # Độ trễ request đầu tiên của câu hỏi cao điểm (đo hiệu quả làm nóng cache)
+        await asyncio.to_thread(cache_warmer.observe, req.question, time.perf_counter() - started)
+    if req.compact or any(t in request.headers.get("accept", "") for t in MSGPACK_TYPES):
+        return compact_response(resp, request)
+    return resp
+
+async def _chat(req: ChatRequest, request: Request, route: Tuple[HrmBackend, bool, str]) -> ChatResponse:
     try:
-        # BƯỚC 1: SINH SQL
-        sql_chain = SQL_PROMPT | llm | StrOutputParser()
-        raw_sql = sql_chain.invoke({
-            "schema": HRM_SCHEMA_ENHANCED,
-            "question": req.question
-        })
-        sql = validate_sql(raw_sql)
+        client_limiter.check(get_client_id(request))
+        priority = get_priority(request, req.question)
+
+        # BƯỚC 0: CÂU HỎI NỐI TIẾP -> xử lý ngay trên kết quả trước (không gọi LLM/HRM)
+        last = await asyncio.to_thread(get_last_result, req.session_id)
+        if last:
+            ops = parse_followup(req.question, last["columns"], last["data"])
+            if ops:
+                data_result = await asyncio.to_thread(apply_ops, last["data"], ops)
+                await asyncio.to_thread(save_last_result, req.session_id, req.question, last["sql"], data_result)
+                return ChatResponse(
+                    sql=last["sql"],
+                    data=data_result,
+                    answer=answer_followup(ops, data_result),
+                    download_url=None
+                )
+
+        backend, group, scope = route
+        # Chỉ mục tên -> id, template, lịch sử đoán trước, lịch làm nóng đều học từ HRM mặc định
+        local_knowledge = scope == DEFAULT_BACKEND
+        if local_knowledge:
+            await asyncio.to_thread(record_question, req.question)
+
+        # BƯỚC 1: SINH SQL (ưu tiên cache câu hỏi -> SQL dùng chung giữa các worker)
+        sql = await asyncio.to_thread(get_cached_sql, req.question, scope)
+        spec_hit, spec_data = False, None
+        learn_sql = None
+        if sql is None:
+            # Cùng họ với câu hỏi đã học (chỉ khác tên / số / ngày) -> điền template, bỏ qua LLM
+            template = await asyncio.to_thread(sql_templates.match, req.question) if local_knowledge else None
+            if sql_templates.should_use(template):
+                sql = validate_sql(template.sql)
+                metrics.incr("template.used")
+            else:
+                # Câu hỏi gần giống câu cũ -> chạy trước SQL cũ trên HRM trong lúc chờ LLM
+                speculation = await speculator.start(
+                    req.question, lambda cand_sql: execute_sql_cached(canonicalize_sql(cand_sql)[0], PRIORITY_BATCH, req.question)
+                ) if local_knowledge else None
+                async with llm_gate.slot(priority):
+                    raw_sql = await generate_sql_text(req.question, entity_hints=local_knowledge)
+                sql = validate_sql(raw_sql)
+                spec_hit, spec_data = await speculator.resolve(speculation, sql)
+                if template and sql:
+                    # Đo độ chính xác template so với LLM
+                    await asyncio.to_thread(sql_templates.record_shadow, template, sql)
+                learn_sql = sql if local_knowledge else None
+            if sql:
+                # Lịch sử giữ SQL gốc (CURDATE()...) để đoán trước đúng cả ngày hôm sau
+                if "NO_DATA" not in sql and local_knowledge:
+                    await asyncio.to_thread(question_history.add, req.question, sql)
+                # CURDATE() -> ngày cụ thể: cache kết quả không bị lẫn sang ngày mới
+                sql, sql_periods = canonicalize_sql(sql)
+                await asyncio.to_thread(set_cached_sql, req.question, sql, sql_periods, scope)
 
         # Nếu AI phát hiện câu hỏi ngoài lề (thời tiết, bóng đá...)
         if "NO_DATA" in sql:
@@ -808,53 +1283,371 @@ async def chat_endpoint(req: ChatRequest):
             )
 
         # BƯỚC 2: CHẠY SQL
+        missing = {}
         if not sql:
-            data_result = None
+            data_result = response_data = None
             final_answer = "Xin lỗi, tôi không thể hiểu yêu cầu này."
             download_url = None
         else:
-            data_result = execute_sql_api(sql)
+            if spec_hit:
+                data_result = spec_data
+            else:
+                data_result, missing = await execute_routed(sql, priority, req.question, backend, group)
+            response_data = response_rows(data_result)
             download_url = None
             
-            # BƯỚC 3: SINH CÂU TRẢ LỜI TRƯỚC
+            # BƯỚC 3: CÁC STAGE ĐỘC LẬP CHẠY SONG SONG
+            # (sinh câu trả lời || dựng bảng báo cáo || ghi cache phiên), tóm tắt ghép vào báo cáo khi có
             if isinstance(data_result, str) and "Lỗi" in data_result:
                 final_answer = f"⚠️ {data_result}"
             else:
-                # Gửi cả Data rỗng cho AI để nó "chém gió" dựa trên Prompt mới
-                ans_chain = ANSWER_PROMPT | llm | StrOutputParser()
-                final_answer = ans_chain.invoke({
-                    "question": req.question,
-                    "data": str(data_result) 
-                })
-            
-            # BƯỚC 4: KIỂM TRA YÊU CẦU XUẤT FILE (sau khi có câu trả lời)
-            q_lower = req.question.lower()
-            
-            if data_result and not isinstance(data_result, str):
-                # Nếu có dữ liệu và người dùng yêu cầu xuất file
-                if "word" in q_lower or "docx" in q_lower or "văn bản" in q_lower or "xuất" in q_lower or "file" in q_lower:
-                    try:
-                        file_path = create_word_report(
-                            data=data_result, 
-                            title="BÁO CÁO TRUY VẤN HRM", 
-                            filename_prefix="baocao",
-                            question=req.question,
-                            summary=final_answer
-                        )
-                        if file_path:
-                            # Lấy tên file từ path
-                            filename = os.path.basename(file_path)
-                            download_url = f"/download/{filename}"
-                    except Exception as e:
-                        print(f"Error creating word report: {e}")
+                if learn_sql:
+                    await asyncio.to_thread(sql_templates.learn, req.question, learn_sql)
+                stages = StageGroup("chat")
+                answer_task = stages.start("answer", generate_answer(req.question, data_result, priority))
+                if not isinstance(data_result, RowSet) or len(response_data) == len(data_result):
+                    # Chỉ nhớ kết quả đầy đủ (câu hỏi nối tiếp lọc/sắp xếp trên toàn bộ dữ liệu)
+                    stages.start("cache", asyncio.to_thread(
+                        save_last_result, req.session_id, req.question, sql, response_data))
+
+                report_filename = None
+                if data_result and not isinstance(data_result, str) and is_export_request(req.question):
+                    report_filename = new_report_filename("baocao", "docx")
+                    await asyncio.to_thread(mark_report_pending, report_filename, req.question)
+                    stages.start("report", build_report_stage(data_result, req.question, report_filename, answer_task))
+
+                final_answer = await stages.result(
+                    "answer", ANSWER_STAGE_TIMEOUT,
+                    default="Dạ, em đã lấy được dữ liệu nhưng chưa kịp tóm tắt. Sếp xem dữ liệu chi tiết giúp em ạ."
+                ) + missing_note(missing)
+
+                # BƯỚC 4: BÁO CÁO (chờ thêm tối đa REPORT_STAGE_TIMEOUT, quá hạn thì file hoàn tất ở nền)
+                if report_filename:
+                    file_path = await stages.result("report", REPORT_STAGE_TIMEOUT)
+                    if file_path or stages.is_running("report"):
+                        download_url = f"/download/{sign_download(report_filename)}"
 
         return ChatResponse(
             sql=sql,
-            data=data_result,
+            data=response_data,
             answer=final_answer,
-            download_url=download_url
+            download_url=download_url,
+            total_rows=len(data_result) if isinstance(data_result, RowSet) else None,
+            missing_backends=missing or None
         )
 
+    except (AdmissionRejected, HTTPException):
+        raise
     except Exception as e:
         print(f"Server Error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ==========================================================
+# 6. BATCH ENDPOINT (Nhiều câu hỏi một lần - VD: báo cáo buổi sáng)
+# ==========================================================
+# Số lời gọi LLM / HRM chạy song song tối đa cho 1 batch
+BATCH_MAX_CONCURRENCY = int(os.environ.get("BATCH_MAX_CONCURRENCY", "8"))
+BATCH_MAX_QUESTIONS = 100
+
+
+class BatchChatRequest(BaseModel):
+    questions: List[str]
+    stream: bool = False  # True -> trả NDJSON, câu nào xong trước trả trước
+    tenant: Union[str, None] = None  # HRM của công ty nào (mặc định: header X-Tenant / HRM_DEFAULT_BACKEND)
+
+
+class BatchItemResult(BaseModel):
+    index: int
+    question: str
+    result: Union[ChatResponse, None] = None
+    error: Union[str, None] = None
+
+
+class BatchChatResponse(BaseModel):
+    results: List[BatchItemResult]
+
+
+class _BatchRunner:
+    """Chạy pipeline cho nhiều câu hỏi: sinh SQL song song, gộp SQL trùng, chạy HRM 1 lần/SQL"""
+
+    def __init__(self, max_concurrency: int, backend: Union[HrmBackend, None] = None):
+        self.llm_sem = asyncio.Semaphore(max_concurrency)
+        self.hrm_sem = asyncio.Semaphore(max_concurrency)
+        self.backend = backend or get_backend()
+        self.sql_tasks: Dict[tuple, asyncio.Task] = {}
+
+    async def _execute_once(self, sql: str, question: str = "", group: bool = False) -> Tuple[Any, Dict[str, str]]:
+        """Mỗi câu SQL (sau validate) chỉ gọi HRM 1 lần, các câu hỏi trùng SQL dùng chung kết quả"""
+        task = self.sql_tasks.get((group, sql))
+        if task is None:
+            async def _run():
+                async with self.hrm_sem:
+                    return await execute_routed(sql, PRIORITY_BATCH, question, self.backend, group)
+            task = asyncio.ensure_future(_run())
+            self.sql_tasks[(group, sql)] = task
+        return await task
+
+    async def run_one(self, index: int, question: str) -> BatchItemResult:
+        try:
+            group = is_group_question(question)
+            scope = GROUP_SCOPE if group else self.backend.id
+            local_knowledge = scope == DEFAULT_BACKEND
+            sql = await asyncio.to_thread(get_cached_sql, question, scope)
+            learn_sql = None
+            if sql is None:
+                template = await asyncio.to_thread(sql_templates.match, question) if local_knowledge else None
+                if sql_templates.should_use(template):
+                    sql = validate_sql(template.sql)
+                    metrics.incr("template.used")
+                else:
+                    async with self.llm_sem, llm_gate.slot(PRIORITY_BATCH):
+                        raw_sql = await generate_sql_text(question, entity_hints=local_knowledge)
+                    sql = validate_sql(raw_sql)
+                    if template and sql:
+                        await asyncio.to_thread(sql_templates.record_shadow, template, sql)
+                    learn_sql = sql if local_knowledge else None
+                if sql:
+                    sql, sql_periods = canonicalize_sql(sql)
+                    await asyncio.to_thread(set_cached_sql, question, sql, sql_periods, scope)
+
+            if "NO_DATA" in sql:
+                response = ChatResponse(sql=None, data=None,
+                                        answer="Xin lỗi. Tôi không có dữ liệu về vấn đề này!")
+            elif not sql:
+                response = ChatResponse(sql=sql, data=None,
+                                        answer="Xin lỗi, tôi không thể hiểu yêu cầu này.")
+            else:
+                data_result, missing = await self._execute_once(sql, question, group)
+                if isinstance(data_result, str) and "Lỗi" in data_result:
+                    final_answer = f"⚠️ {data_result}"
+                else:
+                    if learn_sql:
+                        await asyncio.to_thread(sql_templates.learn, question, learn_sql)
+                    async with self.llm_sem:
+                        final_answer = await generate_answer(question, data_result, PRIORITY_BATCH)
+                    final_answer += missing_note(missing)
+                response = ChatResponse(sql=sql, data=response_rows(data_result), answer=final_answer,
+                                        total_rows=len(data_result) if isinstance(data_result, RowSet) else None,
+                                        missing_backends=missing or None)
+
+            return BatchItemResult(index=index, question=question, result=response)
+        except Exception as e:
+            print(f"Batch item {index} error: {e}")
+            return BatchItemResult(index=index, question=question, error=str(e))
+
+
+@app.post("/chat/batch")
+async def chat_batch_endpoint(req: BatchChatRequest, request: Request):
+    """Trả lời nhiều câu hỏi một lần (kết quả theo đúng thứ tự đầu vào, lỗi trả về theo từng câu)"""
+    if not req.questions:
+        raise HTTPException(status_code=400, detail="Danh sách câu hỏi rỗng")
+    if len(req.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"Tối đa {BATCH_MAX_QUESTIONS} câu hỏi mỗi batch")
+    client_limiter.check(get_client_id(request), batch_cost(req.questions))
+
+    runner = _BatchRunner(BATCH_MAX_CONCURRENCY, get_request_backend(request, req.tenant))
+    tasks = [asyncio.ensure_future(runner.run_one(i, q)) for i, q in enumerate(req.questions)]
+
+    if req.stream:
+        async def event_stream():
+            try:
+                for finished in asyncio.as_completed(tasks):
+                    item = await finished
+                    yield json.dumps(item.model_dump(), ensure_ascii=False, default=str) + "\n"
+            finally:
+                # Client ngắt kết nối -> hủy các câu còn đang chạy
+                for task in tasks:
+                    task.cancel()
+
+        return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+    results = await asyncio.gather(*tasks)
+    return BatchChatResponse(results=results)
+
+
+# ==========================================================
+# 6.5. WATCH: CÂU HỎI THEO DÕI (SQL đóng băng, chạy định kỳ, chỉ đẩy thay đổi)
+# ==========================================================
+WATCH_SSE_POLL_SECONDS = 1.0
+WATCH_SSE_HEARTBEAT_SECONDS = 15
+
+class WatchRequest(BaseModel):
+    question: str
+    interval_seconds: int = 300
+
+class WatchResponse(BaseModel):
+    watch_id: str
+    sql: str
+    data: Any
+    answer: str
+    interval_seconds: int
+    events_url: str
+
+@app.post("/watch", response_model=WatchResponse)
+async def create_watch_endpoint(req: WatchRequest, request: Request):
+    """Đăng ký theo dõi: sinh + validate SQL 1 lần, chạy lần đầu làm mốc, sau đó scheduler chạy lại không cần LLM"""
+    client_id = get_client_id(request)
+    client_limiter.check(client_id)
+
+    # Luôn sinh mới (không lấy cache): cache giữ SQL đã thay CURDATE() bằng ngày cụ thể,
+    # còn watch cần SQL gốc để mỗi lần chạy tự tính lại theo ngày hiện tại
+    async with llm_gate.slot(PRIORITY_INTERACTIVE):
+        sql = validate_sql(await generate_sql_text(req.question))
+    if not sql or "NO_DATA" in sql:
+        raise HTTPException(status_code=400, detail="Câu hỏi này không theo dõi được (không sinh được SQL)")
+
+    data_result = await execute_sql_cached(canonicalize_sql(sql)[0], question=req.question, fresh=True)
+    if isinstance(data_result, str):
+        raise HTTPException(status_code=502, detail=data_result)
+    answer = await generate_answer(req.question, data_result)
+    data_result = data_result.records() if isinstance(data_result, RowSet) else data_result
+
+    try:
+        watch = await asyncio.to_thread(create_watch, req.question, sql, req.interval_seconds, data_result, answer,
+                                        client_id)
+    except ValueError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return WatchResponse(watch_id=watch["id"], sql=sql, data=data_result, answer=answer,
+                         interval_seconds=watch["interval"], events_url=f"/watch/{watch['id']}/events")
+
+@app.get("/watch/{watch_id}")
+async def get_watch_endpoint(watch_id: str, request: Request):
+    watch = await asyncio.to_thread(get_watch, watch_id, get_client_id(request))
+    if watch is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy câu hỏi theo dõi")
+    return {k: watch[k] for k in ("id", "question", "sql", "interval", "last_run_at", "next_run_at",
+                                  "seq", "answer", "error", "rows")}
+
+@app.delete("/watch/{watch_id}")
+async def delete_watch_endpoint(watch_id: str, request: Request):
+    if not await asyncio.to_thread(delete_watch, watch_id, get_client_id(request)):
+        raise HTTPException(status_code=404, detail="Không tìm thấy câu hỏi theo dõi")
+    return {"deleted": watch_id}
+
+@app.get("/watch/{watch_id}/events")
+async def watch_events_endpoint(watch_id: str, request: Request):
+    """Server-Sent Events: mỗi lần dữ liệu đổi đẩy 1 sự kiện {diff, answer}; hỗ trợ Last-Event-ID khi nối lại"""
+    owner = get_client_id(request)
+    if await asyncio.to_thread(get_watch, watch_id, owner) is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy câu hỏi theo dõi")
+    try:
+        last_seq = int(request.headers.get("last-event-id", "0"))
+    except ValueError:
+        last_seq = 0
+
+    async def event_stream():
+        nonlocal last_seq
+        idle = 0.0
+        while not await request.is_disconnected():
+            if await asyncio.to_thread(get_watch, watch_id) is None:
+                yield "event: deleted\ndata: {}\n\n"
+                return
+            for event in await asyncio.to_thread(get_events, watch_id, last_seq):
+                last_seq = event["seq"]
+                idle = 0.0
+                yield f"id: {event['seq']}\nevent: change\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+            if idle >= WATCH_SSE_HEARTBEAT_SECONDS:
+                idle = 0.0
+                yield ": ping\n\n"  # Giữ kết nối qua proxy
+            await asyncio.sleep(WATCH_SSE_POLL_SECONDS)
+            idle += WATCH_SSE_POLL_SECONDS
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/admin/admission")
+async def admission_status():
+    """Trạng thái hàng đợi LLM / HRM (số đang chạy, số đang chờ)"""
+    return admission_stats()
+
+
+# ==========================================================
+# 7. KHỞI ĐỘNG NHANH: WARMUP NỀN + HEALTH / READINESS
+# ==========================================================
+_startup = {"started_at": time.time(), "warmup_seconds": None, "warmup_error": None}
+_warmup_done = threading.Event()
+
+def _warmup():
+    """Import các module nặng + dựng LLM/prompt ở luồng nền, không chặn server nhận request"""
+    started = time.perf_counter()
+    try:
+        import docx  # noqa: F401
+        import pandas  # noqa: F401
+        for backend in all_backends():
+            get_hrm_session(backend)
+        get_sql_chain()
+        get_answer_chain()
+    except Exception as e:
+        _startup["warmup_error"] = str(e)
+        print(f"⚠️ Warmup lỗi: {e}")
+    finally:
+        _startup["warmup_seconds"] = round(time.perf_counter() - started, 3)
+        _warmup_done.set()
+
+async def _execute_watch_sql(sql: str) -> Any:
+    """Watch so sánh / diff trên toàn bộ bản ghi (list dict); bỏ qua cache kết quả để không che mất thay đổi"""
+    data = await execute_sql_cached(sql, PRIORITY_BATCH, fresh=True)
+    return data.records() if isinstance(data, RowSet) else data
+
+@app.on_event("startup")
+async def start_warmup():
+    threading.Thread(target=_warmup, name="warmup", daemon=True).start()
+    start_schema_refresher(execute_sql_api)
+    watch_scheduler.start(
+        _execute_watch_sql,
+        lambda question, rows: generate_answer(question, rows, PRIORITY_BATCH),
+    )
+    start_entity_refresher(execute_sql_api)
+    cache_warmer.start(warm_question)
+
+@app.get("/healthz")
+async def healthz():
+    """Tiến trình còn sống (liveness) - luôn trả về ngay"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Sẵn sàng nhận traffic (readiness): warmup xong và LLM dựng được"""
+    ready = _warmup_done.is_set() and _startup["warmup_error"] is None
+    body = {
+        "status": "ready" if ready else "starting",
+        "warmup_seconds": _startup["warmup_seconds"],
+        "error": _startup["warmup_error"],
+        "uptime_seconds": round(time.time() - _startup["started_at"], 3),
+    }
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
+
+# Token xem dữ liệu nhạy cảm ở /admin (câu hỏi gốc, SQL); không đặt -> không ai xem được
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+def is_admin(request: Request) -> bool:
+    """Header X-Admin-Token hoặc Authorization: Bearer <token> khớp ADMIN_TOKEN"""
+    if not ADMIN_TOKEN:
+        return False
+    token = request.headers.get("x-admin-token", "")
+    auth = request.headers.get("authorization", "")
+    if not token and auth.lower().startswith("bearer "):
+        token = auth[7:].strip()
+    return hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8"))
+
+@app.get("/admin/query-stats")
+async def query_stats_endpoint(request: Request, hours: float = 24, limit: int = 20):
+    """
+    Thống kê query log theo fingerprint SQL: top tổng thời gian, p95, tỉ lệ lỗi (mọi worker).
+    Câu hỏi gốc / SQL mẫu chỉ trả cho admin (ADMIN_TOKEN)
+    """
+    return await asyncio.to_thread(query_stats, hours, limit, include_details=is_admin(request))
+
+@app.get("/admin/metrics")
+async def metrics_status():
+    """Bộ đếm hiệu năng của worker hiện tại (cache, speculative SQL...)"""
+    # Một số mục duyệt cả namespace trong cache dùng chung (lịch làm nóng, template...) -> chạy ở thread
+    return await asyncio.to_thread(_metrics_snapshot)
+
+def _metrics_snapshot() -> Dict[str, Any]:
+    return {"counters": metrics.snapshot(), "speculation": speculation_stats(), "answers": answer_stats(),
+            "entities": entity_stats(), "schema": schema_service.stats(), "watches": watch_stats(),
+            "templates": template_stats(), "backends": backend_stats(),
+            "warming": warm_stats(), "answer_cache": answer_cache_stats()}
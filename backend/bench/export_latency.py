@@ -0,0 +1,42 @@
+"""
+Đo độ trễ end-to-end của câu hỏi xuất báo cáo Word (LLM/HRM giả lập, python-docx thật).
+
+Chạy trên từng phiên bản code để so sánh trước/sau:
+    python bench/export_latency.py --rows 2000 --runs 5
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+import fakes
+
+
+async def main(rows: int, runs: int, llm_latency: float):
+    fakes.FAKE_ROWS[:] = [
+        {"ho_ten": f"Nhân viên {i}", "phong_ban": "Kỹ thuật", "luong_co_ban": 10_000_000 + i}
+        for i in range(rows)
+    ]
+    api = fakes.load_api(llm_latency=llm_latency, hrm_latency=0.05)
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        latencies = []
+        for i in range(runs):
+            started = time.perf_counter()
+            res = await client.post("/chat", json={"question": f"Xuất file word danh sách nhân viên {i}"})
+            latencies.append(time.perf_counter() - started)
+            assert res.status_code == 200, res.text
+
+    print(f"rows={rows} llm_latency={llm_latency}s runs={runs}")
+    print(f"  median={statistics.median(latencies):.2f}s  min={min(latencies):.2f}s  max={max(latencies):.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.runs, args.llm_latency))
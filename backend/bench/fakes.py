@@ -0,0 +1,57 @@
+"""
+LLM / HRM giả lập cho benchmark & load test (không gọi OpenAI, không gọi HRM thật).
+
+Dùng:
+    import bench.fakes as fakes
+    api = fakes.load_api(llm_latency=0.8, hrm_latency=0.2)
+"""
+import asyncio
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+FAKE_SQL = "SELECT ho_ten, luong_co_ban FROM nhanvien"
+FAKE_ROWS = [{"ho_ten": f"Nhân viên {i}", "luong_co_ban": 10_000_000 + i * 1000} for i in range(20)]
+
+
+def make_fake_llm(latency: float):
+    """Runnable trả về SQL cố định cho prompt sinh SQL, câu trả lời cố định cho prompt trả lời
+    (nhận và bỏ qua kwargs như stop=... giống chat model thật)"""
+    from langchain_core.runnables import RunnableLambda
+
+    def _reply(prompt_value) -> str:
+        text = prompt_value.to_string() if hasattr(prompt_value, "to_string") else str(prompt_value)
+        return FAKE_SQL if "SQL OUTPUT" in text else "Dạ, đây là kết quả ạ."
+
+    def _sync(prompt_value, **kwargs):
+        time.sleep(latency)
+        return _reply(prompt_value)
+
+    async def _async(prompt_value, **kwargs):
+        await asyncio.sleep(latency)
+        return _reply(prompt_value)
+
+    return RunnableLambda(_sync, afunc=_async)
+
+
+def make_fake_hrm(latency: float):
+    def _execute(sql: str):
+        time.sleep(latency)
+        return [dict(row) for row in FAKE_ROWS]
+    return _execute
+
+
+def load_api(llm_latency: float = 0.8, hrm_latency: float = 0.2):
+    """Import backend api với LLM/HRM giả lập"""
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake-for-bench")
+    os.chdir(BACKEND_DIR)
+    import api
+    api._llm = make_fake_llm(llm_latency)
+    fake_hrm = make_fake_hrm(hrm_latency)
+    api.execute_sql_api = fake_hrm
+    api.fetch_rows = lambda sql, question="", backend=None: api.RowSet.from_records(fake_hrm(sql))  # Đường stream của execute_sql_cached
+    return api
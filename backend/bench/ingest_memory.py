@@ -0,0 +1,89 @@
+"""
+Đo RAM đỉnh (peak RSS) khi nhận kết quả HRM lớn:
+res.json() -> list dict (cách cũ) vs đọc stream -> RowSet (tuple + file tạm).
+
+Mỗi cách chạy trong 1 tiến trình con riêng để peak RSS không lẫn nhau.
+
+Chạy:  python bench/ingest_memory.py --rows 200000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD_SNIPPET = """
+import json, resource, sys, time
+sys.path.insert(0, {backend!r})
+from utils.row_stream import ingest_json
+
+mode, path = sys.argv[1], sys.argv[2]
+base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+t = time.perf_counter()
+if mode == "json":
+    with open(path, "rb") as f:
+        body = f.read()                 # requests giữ cả body (res.content)
+    data = json.loads(body)             # rồi res.json() dựng list dict
+    rows = len(data)
+    # Tóm tắt: 200 dòng đầu
+    preview = str(data[:200])
+else:
+    def chunks():
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(64 * 1024)
+                if not chunk:
+                    return
+                yield chunk
+    data = ingest_json(chunks())
+    rows = len(data)
+    preview = data.preview_text(200)
+elapsed = time.perf_counter() - t
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(rows, (peak - base) / 1024, elapsed)
+"""
+
+
+def make_payload(path: str, rows: int) -> int:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for i in range(rows):
+            if i:
+                f.write(",")
+            f.write(json.dumps({
+                "id": i,
+                "nhan_vien_id": i % 500,
+                "ho_ten": f"Nguyễn Văn {i % 500}",
+                "ngay": f"2026-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+                "check_in": "08:05:00",
+                "check_out": "17:32:00",
+                "trang_thai": "Đi muộn" if i % 7 == 0 else "Đúng giờ",
+            }, ensure_ascii=False))
+        f.write("]")
+    return os.path.getsize(path)
+
+
+def run(mode: str, path: str):
+    out = subprocess.run([sys.executable, "-c", CHILD_SNIPPET.format(backend=BACKEND_DIR), mode, path],
+                         capture_output=True, text=True, check=True)
+    rows, peak_mb, seconds = out.stdout.split()
+    return int(rows), float(peak_mb), float(seconds)
+
+
+def main(rows: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "hrm.json")
+        size = make_payload(path, rows)
+        print(f"rows={rows} body={size / 1024 / 1024:.1f} MB")
+        for label, mode in [("res.json() -> list dict (cũ)", "json"), ("stream -> RowSet", "stream")]:
+            n, peak_mb, seconds = run(mode, path)
+            print(f"  {label:<30} peak RSS +{peak_mb:>8.1f} MB  {seconds * 1000:>8.0f} ms  ({n} dòng)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200000)
+    main(parser.parse_args().rows)
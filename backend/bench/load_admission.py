@@ -0,0 +1,71 @@
+"""
+Load test admission control: 1 script bắn batch/export dồn dập + người dùng UI hỏi đều đặn.
+Kỳ vọng: độ trễ p95/p99 của người dùng UI vẫn bị chặn trên, batch bị 429 thay vì làm sập hệ thống.
+
+Chạy:  python bench/load_admission.py --flood 200 --interactive 30
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import httpx
+
+# Bench đóng vai reverse proxy (httpx ASGITransport -> peer 127.0.0.1): X-Forwarded-For giả lập IP người dùng
+os.environ.setdefault("TRUSTED_PROXIES", "127.0.0.1")
+
+import fakes  # noqa: E402
+
+
+async def _post(client, question, headers, latencies, statuses):
+    started = time.perf_counter()
+    res = await client.post("/chat", json={"question": question}, headers=headers)
+    latencies.append(time.perf_counter() - started)
+    statuses[res.status_code] = statuses.get(res.status_code, 0) + 1
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def main(flood: int, interactive: int, interval: float):
+    api = fakes.load_api()
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        flood_lat, flood_status = [], {}
+        ui_lat, ui_status = [], {}
+
+        # Batch flood: 1 client, nhiều IP giả để vượt qua token bucket -> dồn vào hàng đợi
+        flood_tasks = [
+            asyncio.create_task(_post(client, "Danh sách nhân viên", {
+                "x-priority": "batch", "x-forwarded-for": f"10.0.0.{i % 250}"
+            }, flood_lat, flood_status))
+            for i in range(flood)
+        ]
+
+        ui_tasks = []
+        for i in range(interactive):
+            ui_tasks.append(asyncio.create_task(_post(client, "Ai đi muộn hôm nay?", {
+                "x-forwarded-for": f"192.168.1.{i % 250}"
+            }, ui_lat, ui_status)))
+            await asyncio.sleep(interval)
+
+        await asyncio.gather(*flood_tasks, *ui_tasks)
+
+    print(f"Batch flood  : {flood} req, status={flood_status}")
+    print(f"Interactive  : {interactive} req, status={ui_status}")
+    print(f"  p50={statistics.median(ui_lat):.2f}s  p95={_percentile(ui_lat, 95):.2f}s  "
+          f"p99={_percentile(ui_lat, 99):.2f}s  max={max(ui_lat):.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--flood", type=int, default=200)
+    parser.add_argument("--interactive", type=int, default=30)
+    parser.add_argument("--interval", type=float, default=0.2)
+    args = parser.parse_args()
+    asyncio.run(main(args.flood, args.interactive, args.interval))
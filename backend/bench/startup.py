@@ -0,0 +1,58 @@
+"""
+Đo thời gian khởi động: import api.py, warmup nền, request đầu tiên.
+
+Chạy:  python bench/startup.py --runs 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = "import time; t=time.perf_counter(); import api; print(time.perf_counter()-t)"
+
+FIRST_REQUEST_SNIPPET = """
+import asyncio, time, sys
+sys.path.insert(0, "bench")
+t0 = time.perf_counter()
+import fakes
+api = fakes.load_api(llm_latency=0, hrm_latency=0)
+t_import = time.perf_counter() - t0
+import httpx
+
+async def main():
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        t = time.perf_counter()
+        await client.get("/healthz")
+        t_health = time.perf_counter() - t
+        t = time.perf_counter()
+        await client.post("/chat", json={"question": "Danh sách nhân viên"})
+        t_chat = time.perf_counter() - t
+    print(t_import, t_health, t_chat)
+
+asyncio.run(main())
+"""
+
+
+def _run(snippet: str) -> list:
+    env = dict(os.environ, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "sk-fake-for-bench"))
+    out = subprocess.run([sys.executable, "-c", snippet], cwd=BACKEND_DIR, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return [float(x) for x in out.strip().splitlines()[-1].split()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    imports = [_run(IMPORT_SNIPPET)[0] for _ in range(args.runs)]
+    print(f"import api           : median {statistics.median(imports) * 1000:.0f} ms")
+
+    firsts = [_run(FIRST_REQUEST_SNIPPET) for _ in range(args.runs)]
+    print(f"import (fake llm)    : median {statistics.median(r[0] for r in firsts) * 1000:.0f} ms")
+    print(f"first /healthz       : median {statistics.median(r[1] for r in firsts) * 1000:.1f} ms")
+    print(f"first /chat (cold)   : median {statistics.median(r[2] for r in firsts) * 1000:.0f} ms")
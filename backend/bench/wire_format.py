@@ -0,0 +1,74 @@
+"""
+So sánh kích thước payload và thời gian serialize của ChatResponse.data:
+list-of-dicts JSON (hiện tại) vs dạng cột + orjson / msgpack, có/không nén.
+
+Chạy:  python bench/wire_format.py --rows 10000
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.wire_format import to_columnar, encode_body, compress_body  # noqa: E402
+
+
+def make_rows(n: int):
+    return [{
+        "id": i,
+        "ho_ten": f"Nguyễn Văn {i}",
+        "email": f"nv{i}@icss.com.vn",
+        "ten_phong": "Phòng Kỹ thuật" if i % 2 else "Phòng Kinh doanh",
+        "luong_co_ban": 10_000_000 + i * 1000.0,
+        "ngay_vao_lam": "2023-05-01",
+        "trang_thai_lam_viec": "Đang làm việc",
+    } for i in range(n)]
+
+
+def timed(fn, repeat=5):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        out = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return out, best
+
+
+def main(rows: int):
+    data = make_rows(rows)
+    base = {"sql": "SELECT ...", "answer": "...", "download_url": None}
+
+    cases = []
+    body, t = timed(lambda: json.dumps({**base, "data": data}, ensure_ascii=False).encode("utf-8"))
+    cases.append(("json list-of-dicts (hiện tại)", body, t))
+    gz, tg = timed(lambda: gzip.compress(body, compresslevel=5))
+    cases.append(("json list-of-dicts + gzip", gz, t + tg))
+
+    def compact(accept="", encoding=""):
+        payload = {**base, "data": to_columnar(data), "format": "columnar"}
+        out, _ = encode_body(payload, accept)
+        return compress_body(out, encoding)[0]
+
+    for label, accept, enc in [
+        ("columnar (orjson nếu có)", "", ""),
+        ("columnar + gzip", "", "gzip"),
+        ("columnar + br", "", "br"),
+        ("columnar msgpack", "application/msgpack", ""),
+        ("columnar msgpack + gzip", "application/msgpack", "gzip"),
+    ]:
+        out, t = timed(lambda: compact(accept, enc))
+        cases.append((label, out, t))
+
+    print(f"rows={rows}")
+    for label, out, t in cases:
+        print(f"  {label:<34} {len(out) / 1024:>9.1f} KB  {t * 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    main(parser.parse_args().rows)
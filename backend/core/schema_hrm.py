@@ -70,9 +70,9 @@ BẢNG cong_viec_tien_do:
 
 BẢNG don_nghi_phep:
 - id (int)
-- nhanvien_id (int)
-- tu_ngay (date)
-- den_ngay (date)
+- nhan_vien_id (int)
+- ngay_bat_dau (date)
+- ngay_ket_thuc (date)
 - ly_do (varchar)
 - trang_thai (varchar)
 - ngay_tao (datetime)
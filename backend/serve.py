@@ -0,0 +1,62 @@
+"""
+Chạy server production nhiều worker.
+
+    python serve.py --workers 16
+
+- Có gunicorn: dùng gunicorn + UvicornWorker, preload app 1 lần ở master rồi fork
+  (các worker dùng chung trang bộ nhớ của phần import nặng).
+- Không có gunicorn (VD: Windows): dùng uvicorn --workers (mỗi worker tự import).
+Các cache dùng chung nằm ở SHARED_CACHE_PATH, báo cáo ở REPORT_DIR.
+"""
+import argparse
+import multiprocessing
+import os
+
+
+def run_gunicorn(host: str, port: int, workers: int, timeout: int):
+    from gunicorn.app.base import BaseApplication
+
+    class HRMApplication(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from api import app
+            return app
+
+    HRMApplication({
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": True,
+        "timeout": timeout,
+        "graceful_timeout": 30,
+        "keepalive": 5,
+    }).run()
+
+
+def run_uvicorn(host: str, port: int, workers: int):
+    import uvicorn
+    uvicorn.run("api:app", host=host, port=port, workers=workers)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ICS HRM SQL Chatbot - production server")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")))
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count())))
+    parser.add_argument("--timeout", type=int, default=120)
+    args = parser.parse_args()
+
+    try:
+        import gunicorn  # noqa: F401
+        run_gunicorn(args.host, args.port, args.workers, args.timeout)
+    except ImportError:
+        print("⚠️ Không có gunicorn -> dùng uvicorn --workers")
+        run_uvicorn(args.host, args.port, args.workers)
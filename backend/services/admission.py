@@ -0,0 +1,216 @@
+"""
+Kiểm soát tải (admission control) cho chatbot:
+- Token bucket theo từng client (chống 1 người/1 script bắn dồn dập); X-Forwarded-For chỉ được tin
+  khi request đến từ proxy trong TRUSTED_PROXIES (client không tự đổi header để lấy bucket mới)
+- Giới hạn số lời gọi LLM / HRM đồng thời toàn hệ thống
+- Hàng đợi có giới hạn + ưu tiên (UI tương tác > batch/xuất file)
+- Hàng đợi đầy -> trả 429 ngay kèm Retry-After
+"""
+import asyncio
+import heapq
+import ipaddress
+import itertools
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import List, Tuple, Union
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+CLIENT_RATE_PER_MIN = float(os.environ.get("CLIENT_RATE_PER_MIN", "30"))
+CLIENT_BURST = float(os.environ.get("CLIENT_BURST", "10"))
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "16"))
+HRM_MAX_CONCURRENCY = int(os.environ.get("HRM_MAX_CONCURRENCY", "16"))
+ADMISSION_MAX_WAITING = int(os.environ.get("ADMISSION_MAX_WAITING", "64"))
+ADMISSION_MAX_WAIT_SECONDS = float(os.environ.get("ADMISSION_MAX_WAIT_SECONDS", "30"))
+# IP / dải mạng của reverse proxy (nginx, load balancer), VD: TRUSTED_PROXIES=127.0.0.1,10.0.0.0/8
+TRUSTED_PROXIES = [ipaddress.ip_network(p.strip(), strict=False)
+                   for p in os.environ.get("TRUSTED_PROXIES", "").split(",") if p.strip()]
+
+
+class AdmissionRejected(Exception):
+    """Yêu cầu bị từ chối do quá tải (map sang HTTP 429)"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+# ==========================================================
+# 1. TOKEN BUCKET THEO CLIENT
+# ==========================================================
+class ClientRateLimiter:
+    """Mỗi client 1 bucket: nạp `rate_per_min` token/phút, tối đa `burst` token"""
+
+    def __init__(self, rate_per_min: float, burst: float, max_clients: int = 10000):
+        self.rate = rate_per_min / 60.0
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, client_id: str, cost: float = 1.0) -> Tuple[bool, float]:
+        """Trả về (được phép?, số giây cần chờ nếu bị chặn)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(client_id, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[client_id] = (tokens, now)
+            self._buckets.move_to_end(client_id)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+
+        if allowed:
+            return True, 0.0
+        return False, (cost - tokens) / self.rate if self.rate > 0 else 60.0
+
+    def check(self, client_id: str, cost: float = 1.0) -> None:
+        allowed, retry_after = self.try_acquire(client_id, cost)
+        if not allowed:
+            raise AdmissionRejected("Bạn gửi quá nhiều yêu cầu, vui lòng thử lại sau.", retry_after)
+
+
+def _is_trusted(address: str, proxies: List) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in proxies)
+
+
+def client_address(peer: Union[str, None], forwarded_for: Union[str, None], proxies: List = None) -> str:
+    """
+    IP client dùng cho rate limit. Chỉ đọc X-Forwarded-For khi peer là proxy tin cậy, và lấy
+    địa chỉ đầu tiên (từ phải sang) không phải proxy tin cậy - phần bên trái do client tự ghi.
+    """
+    proxies = TRUSTED_PROXIES if proxies is None else proxies
+    if not peer:
+        return "unknown"
+    if not forwarded_for or not _is_trusted(peer, proxies):
+        return peer
+    hops = [h.strip() for h in forwarded_for.split(",") if h.strip()]
+    for hop in reversed(hops):
+        if not _is_trusted(hop, proxies):
+            return hop
+    return hops[0] if hops else peer
+
+
+# ==========================================================
+# 2. CỔNG GIỚI HẠN ĐỒNG THỜI + HÀNG ĐỢI ƯU TIÊN
+# ==========================================================
+class PriorityGate:
+    """
+    Semaphore có hàng đợi ưu tiên (số nhỏ = ưu tiên cao).
+    `reserved` slot luôn dành cho traffic tương tác để batch không chiếm hết.
+    """
+
+    def __init__(self, name: str, limit: int, max_waiting: int, reserved: int = 1):
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_waiting = max_waiting
+        self.reserved = min(reserved, self.limit - 1)
+        self._active = 0
+        self._waiters = []  # heap (priority, seq, future)
+        self._seq = itertools.count()
+        self._avg_hold = 1.0  # EWMA thời gian giữ slot (giây) để ước lượng Retry-After
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    def _can_admit(self, priority: int) -> bool:
+        cap = self.limit if priority <= PRIORITY_INTERACTIVE else self.limit - self.reserved
+        return self._active < cap
+
+    def _retry_after(self) -> float:
+        return self._avg_hold * (self.waiting + 1) / self.limit
+
+    def _wake(self) -> None:
+        while self._waiters:
+            priority, _, fut = self._waiters[0]
+            if fut.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._can_admit(priority):
+                return
+            heapq.heappop(self._waiters)
+            self._active += 1
+            fut.set_result(None)
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE, timeout: float = ADMISSION_MAX_WAIT_SECONDS) -> None:
+        if not self._waiters and self._can_admit(priority):
+            self._active += 1
+            return
+
+        # Batch chỉ được dùng một nửa hàng đợi, phần còn lại dành cho UI
+        max_waiting = self.max_waiting if priority <= PRIORITY_INTERACTIVE else self.max_waiting // 2
+        if self.waiting >= max_waiting:
+            raise AdmissionRejected(f"Hệ thống đang quá tải ({self.name}), vui lòng thử lại sau.",
+                                    self._retry_after())
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        self._wake()  # Có thể vào ngay nếu còn slot dành riêng cho mức ưu tiên này
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if fut.done() and not fut.cancelled():
+                # Slot đã được cấp đúng lúc bị hủy -> trả lại
+                self.release(0.0)
+            else:
+                fut.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                raise AdmissionRejected(f"Hệ thống đang quá tải ({self.name}), vui lòng thử lại sau.",
+                                        self._retry_after())
+            raise
+
+    def release(self, held_seconds: float = None) -> None:
+        if held_seconds:
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * held_seconds
+        self._active -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_INTERACTIVE):
+        await self.acquire(priority)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def stats(self) -> dict:
+        return {"active": self._active, "waiting": self.waiting, "limit": self.limit,
+                "avg_hold_seconds": round(self._avg_hold, 3)}
+
+
+client_limiter = ClientRateLimiter(CLIENT_RATE_PER_MIN, CLIENT_BURST)
+
+
+def batch_cost(questions: List[str], burst: float = CLIENT_BURST) -> float:
+    """
+    Số token 1 batch phải trả: mỗi câu hỏi khác nhau 1 token (câu trùng dùng chung SQL / kết quả).
+    Tối đa bằng burst: batch lớn hơn burst rút cạn bucket, request sau phải chờ nạp lại.
+    """
+    distinct = {" ".join(q.lower().split()) for q in questions}
+    return float(min(max(1, len(distinct)), burst))
+
+
+llm_gate = PriorityGate("LLM", LLM_MAX_CONCURRENCY, ADMISSION_MAX_WAITING)
+hrm_gate = PriorityGate("HRM", HRM_MAX_CONCURRENCY, ADMISSION_MAX_WAITING)
+
+
+def admission_stats() -> dict:
+    return {"llm": llm_gate.stats(), "hrm": hrm_gate.stats()}
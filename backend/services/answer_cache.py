@@ -0,0 +1,133 @@
+"""
+Cache câu trả lời theo (câu hỏi đã chuẩn hóa, hash dữ liệu kết quả).
+
+Cùng câu hỏi + cùng dữ liệu (VD: 10 người hỏi "dự án nào đang tạm ngưng" khi dữ liệu chưa đổi)
+-> trả lại đúng câu trả lời đã sinh, không gọi ANSWER_PROMPT lần nữa.
+- Dữ liệu đổi -> hash đổi -> key mới (tự mất hiệu lực, không cần xóa)
+- Lưu trong cache dùng chung (SQLite) -> còn sau khi khởi động lại, mọi worker dùng chung;
+  giới hạn ANSWER_CACHE_MAX_ENTRIES bản ghi + LRU nhỏ trong RAM mỗi worker
+- Nhiều request giống hệt cùng lúc trong 1 worker -> chỉ 1 lần gọi LLM, các request còn lại chờ kết quả
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Union
+
+from services.schema_service import schema_version
+from services.shared_cache import NAMESPACE_MAX_ENTRIES, get_shared_cache, make_key
+from utils import metrics
+from utils.row_stream import RowSet
+from utils.text import normalize_question
+
+ANSWER_NS = "answer_cache"
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_TTL = int(os.environ.get("ANSWER_CACHE_TTL", str(7 * 24 * 60 * 60)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+ANSWER_MEMORY_SIZE = 512
+
+NAMESPACE_MAX_ENTRIES[ANSWER_NS] = ANSWER_CACHE_MAX_ENTRIES
+
+
+def data_hash(data: Any) -> str:
+    """Hash nội dung kết quả (RowSet duyệt dần từng dòng, kể cả phần nằm ở file tạm)"""
+    digest = hashlib.sha1()
+    if isinstance(data, RowSet):
+        digest.update(json.dumps(data.columns, ensure_ascii=False).encode("utf-8"))
+        for row in data:
+            digest.update(json.dumps(row, ensure_ascii=False, default=str).encode("utf-8"))
+            digest.update(b"\n")
+        digest.update(b"truncated" if data.truncated else b"")
+    else:
+        digest.update(json.dumps(data, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class AnswerCache:
+    def __init__(self):
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, "asyncio.Task"] = {}
+
+    def key(self, question: str, data: Any, prompt_version: str = "") -> str:
+        """
+        Key = version schema + version prompt trả lời + câu hỏi đã chuẩn hóa + hash dữ liệu.
+        Giữ nguyên mốc tương đối ("hôm nay" / "hôm qua"): câu trả lời lặp lại đúng cách nói đó,
+        nên không gộp theo ngày cụ thể như cache SQL.
+        """
+        return make_key(schema_version(), prompt_version, normalize_question(question), data_hash(data))
+
+    def _remember(self, key: str, answer: str) -> None:
+        with self._lock:
+            self._memory[key] = answer
+            self._memory.move_to_end(key)
+            while len(self._memory) > ANSWER_MEMORY_SIZE:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Union[str, None]:
+        with self._lock:
+            answer = self._memory.get(key)
+        if answer is None:
+            answer = get_shared_cache().get(ANSWER_NS, key)
+            if answer is not None:
+                self._remember(key, answer)
+        return answer
+
+    def set(self, key: str, answer: str) -> None:
+        if not answer:
+            return
+        self._remember(key, answer)
+        get_shared_cache().set(ANSWER_NS, key, answer, ttl=ANSWER_CACHE_TTL)
+        metrics.incr("answer_cache.stored")
+
+    async def get_or_generate(self, key: str, generate: Callable[[], Awaitable[str]]) -> str:
+        """Có sẵn -> trả ngay; đang sinh cho cùng key -> chờ chung; chưa có -> sinh rồi lưu (lỗi thì không lưu)"""
+        if not ANSWER_CACHE_ENABLED:
+            return await generate()
+        with self._lock:
+            answer = self._memory.get(key)
+        if answer is None:
+            answer = await asyncio.to_thread(self.get, key)  # SQLite dùng chung -> không chặn event loop
+        if answer is not None:
+            metrics.incr("answer_cache.hit")
+            return answer
+
+        task = self._inflight.get(key)
+        if task is not None:
+            metrics.incr("answer_cache.joined")
+        else:
+            metrics.incr("answer_cache.miss")
+            # Task riêng: request đầu bị hủy (timeout / ngắt kết nối) thì các request chờ chung vẫn có kết quả
+            task = asyncio.ensure_future(self._generate_and_store(key, generate))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task)
+
+    async def _generate_and_store(self, key: str, generate: Callable[[], Awaitable[str]]) -> str:
+        answer = await generate()
+        await asyncio.to_thread(self.set, key, answer)
+        return answer
+
+    def _done(self, key: str, task: "asyncio.Task") -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # Lỗi đã trả cho request đang chờ; tránh cảnh báo "never retrieved"
+
+
+answer_cache = AnswerCache()
+
+
+def answer_cache_stats() -> Dict[str, Any]:
+    hits, joined, misses = (metrics.get("answer_cache.hit"), metrics.get("answer_cache.joined"),
+                            metrics.get("answer_cache.miss"))
+    return {
+        "enabled": ANSWER_CACHE_ENABLED,
+        "stored": metrics.get("answer_cache.stored"),
+        "max_entries": ANSWER_CACHE_MAX_ENTRIES,
+        "hits": hits,
+        "joined": joined,
+        "misses": misses,
+        "hit_rate": round((hits + joined) / (hits + joined + misses), 4) if hits + joined + misses else 0.0,
+    }
@@ -0,0 +1,239 @@
+"""
+Trả lời tại chỗ (không gọi LLM lần 2) cho các kết quả đơn giản:
+- 1 con số (COUNT(*) AS total, SUM, AVG...)
+- 1 bản ghi duy nhất
+- danh sách ngắn (tên + vài cột)
+- kết quả rỗng của câu hỏi kiểm tra trạng thái (đi muộn, vắng mặt, nghỉ phép, trễ hạn) cho toàn công ty
+  -> dùng cách nói tích cực đúng như ANSWER_PROMPT quy định. Câu hỏi lọc theo người / phòng / dự án
+  thì để LLM trả lời (câu mẫu nói về cả công ty sẽ sai).
+Kết quả nhiều cột / phức tạp vẫn để LLM tóm tắt.
+"""
+import os
+import re
+from typing import Any, Dict, List, Union
+
+from services.entity_index import entity_index
+from utils import metrics
+from utils.text import fold_text
+
+SHORT_LIST_MAX = int(os.environ.get("LOCAL_ANSWER_LIST_MAX", "15"))
+RECORD_MAX_COLUMNS = 8
+LIST_MAX_COLUMNS = 3
+
+# Ý định (intent) -> có trả lời tại chỗ không. Tắt bớt qua biến môi trường, VD:
+#   LOCAL_ANSWER_DISABLED=lookup,count
+ANSWER_RENDER_CONFIG = {
+    "late": True,
+    "absent": True,
+    "leave": True,
+    "overdue": True,
+    "count": True,
+    "lookup": True,
+}
+for _intent in filter(None, os.environ.get("LOCAL_ANSWER_DISABLED", "").split(",")):
+    ANSWER_RENDER_CONFIG[_intent.strip()] = False
+
+INTENT_KEYWORDS = [
+    ("late", ("di muon", "den muon", "di tre")),
+    ("absent", ("vang mat", "nghi lam", "khong di lam", "chua cham cong")),
+    ("leave", ("nghi phep", "dang nghi")),
+    ("overdue", ("tre han", "qua han", "cham tien do", "tre deadline")),
+    ("count", ("bao nhieu", "tong so", "co may", "so luong", "dem")),
+]
+
+# Kết quả rỗng -> câu trả lời tích cực (theo ví dụ trong ANSWER_PROMPT), {when} lấy theo mốc thời gian trong câu hỏi
+EMPTY_ANSWERS = {
+    "late": "Tuyệt vời! {when} không có nhân viên nào đi muộn.",
+    "absent": "{when} toàn bộ nhân viên đều đi làm đầy đủ.",
+    "leave": "{when} không có nhân viên nào nghỉ phép.",
+    "overdue": "Tuyệt vời! {when} không có công việc hay dự án nào bị trễ hạn.",
+}
+# Câu hỏi không nêu thời gian -> mặc định
+DEFAULT_WHEN = {"late": "Hôm nay", "absent": "Hôm nay", "leave": "Hiện", "overdue": "Hiện"}
+
+# (mẫu trên câu hỏi đã bỏ dấu, cách nói trong câu trả lời)
+TIME_PHRASES = [
+    (r"hom nay", "Hôm nay"),
+    (r"hom qua", "Hôm qua"),
+    (r"hom kia", "Hôm kia"),
+    (r"ngay mai", "Ngày mai"),
+    (r"sang nay", "Sáng nay"),
+    (r"chieu nay", "Chiều nay"),
+    (r"tuan nay", "Tuần này"),
+    (r"tuan (?:truoc|qua|vua roi)", "Tuần trước"),
+    (r"tuan (?:sau|toi)", "Tuần sau"),
+    (r"thang nay", "Tháng này"),
+    (r"thang (?:truoc|qua|vua roi)", "Tháng trước"),
+    (r"thang (?:sau|toi)", "Tháng sau"),
+    (r"hien nay|hien tai|bay gio", "Hiện"),
+]
+# "nam nay" không dấu dễ nhầm với tên người (Nam) -> năm chỉ nhận dạng có dấu
+YEAR_PHRASES = [
+    (r"năm nay", "Năm nay"),
+    (r"năm (?:ngoái|trước|qua)", "Năm ngoái"),
+]
+# Mốc thời gian cụ thể (ngày 15/10, tháng 9, quý 3...) -> để LLM trả lời cho đúng mốc
+EXPLICIT_DATE = re.compile(r"\d{1,2}\s*[/-]\s*\d{1,2}|\b(?:ngay|thang|nam|tuan|quy)\s+\d")
+
+# Câu hỏi giới hạn phạm vi (phòng Marketing, dự án X, công việc của Nam...) -> câu trả lời rỗng không còn là "cả công ty"
+SCOPE_KEYWORDS = re.compile(r"\b(?:phong|bo phan|du an|nhom|team|chi nhanh|cua)\b")
+
+COLUMN_LABELS = {
+    "ho_ten": "Họ tên",
+    "ten_phong": "Phòng ban",
+    "ten_du_an": "Dự án",
+    "ten_cong_viec": "Công việc",
+    "luong_co_ban": "Lương cơ bản",
+    "chuc_vu": "Chức vụ",
+    "vai_tro": "Vai trò",
+    "email": "Email",
+    "so_dien_thoai": "Số điện thoại",
+    "check_in": "Giờ vào",
+    "check_out": "Giờ ra",
+    "han_hoan_thanh": "Hạn hoàn thành",
+    "ngay_ket_thuc": "Ngày kết thúc",
+    "trang_thai": "Trạng thái",
+    "trang_thai_duan": "Trạng thái",
+    "phan_tram": "Tiến độ",
+    "ngay_phep_con_lai": "Số ngày phép còn lại",
+    "ly_do": "Lý do",
+}
+
+COUNT_COLUMNS = ("total", "so_luong", "count", "tong")
+NOT_COUNT_COLUMNS = ("so_dien_thoai", "so_cccd", "so_tai_khoan")
+PERCENT_HINTS = ("phan_tram", "tien_do")
+NAME_COLUMNS = ("ho_ten", "ten_du_an", "ten_cong_viec", "ten_phong", "ten")
+
+
+def detect_intent(question: str) -> str:
+    folded = fold_text(question)
+    for intent, keywords in INTENT_KEYWORDS:
+        if any(re.search(rf"\b{k}\b", folded) for k in keywords):
+            return intent
+    return "lookup"
+
+
+def time_phrase(question: str, default: str) -> Union[str, None]:
+    """Mốc thời gian trong câu hỏi để dùng trong câu trả lời; None nếu mốc cụ thể / nhiều mốc (cần LLM)"""
+    folded = fold_text(question)
+    if EXPLICIT_DATE.search(folded):
+        return None
+    lowered = (question or "").lower()
+    found = {phrase for pattern, phrase in YEAR_PHRASES if re.search(rf"\b{pattern}\b", lowered)}
+    found |= {phrase for pattern, phrase in TIME_PHRASES if re.search(rf"\b(?:{pattern})\b", folded)}
+    if len(found) > 1:
+        return None
+    return found.pop() if found else default
+
+
+def _is_scoped(question: str) -> bool:
+    """Câu hỏi có lọc theo nhân viên / phòng ban / dự án (tên trong chỉ mục thực thể, từ khóa, họ tên viết hoa)"""
+    if SCOPE_KEYWORDS.search(fold_text(question)):
+        return True
+    words = re.findall(r"\w+", question or "")
+    if any(a.istitle() and b.istitle() for a, b in zip(words, words[1:])):
+        return True  # "Trần Đình Nam" khi chỉ mục chưa nạp / chưa có tên này
+    return bool(entity_index.resolve(question))
+
+
+def _empty_answer(intent: str, question: str) -> Union[str, None]:
+    template = EMPTY_ANSWERS.get(intent)
+    if template is None or _is_scoped(question):
+        return None
+    when = time_phrase(question, DEFAULT_WHEN[intent])
+    return template.format(when=when) if when else None
+
+
+def _label(column: str) -> str:
+    return COLUMN_LABELS.get(column, column.replace("_", " ").capitalize())
+
+
+def format_value(column: str, value: Any) -> str:
+    """Định dạng số kiểu Việt Nam (10.000.000), phần trăm, None -> trống"""
+    if value is None:
+        return "(trống)"
+    if isinstance(value, bool):
+        return "Có" if value else "Không"
+    if isinstance(value, (int, float)):
+        if any(h in column.lower() for h in PERCENT_HINTS):
+            return f"{value:g}%".replace(".", ",")
+        if float(value).is_integer():
+            return f"{int(value):,}".replace(",", ".")
+        return f"{value:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    return str(value)
+
+
+def _name_column(columns: List[str]) -> Union[str, None]:
+    for name in NAME_COLUMNS:
+        for col in columns:
+            if col.lower() == name or col.lower().startswith(name + "_") or col.lower().endswith("_" + name):
+                return col
+    return None
+
+
+def _is_count_column(column: str) -> bool:
+    """Cột đếm: total / so_luong / so_* hoặc COUNT(...) chưa đặt alias"""
+    name = column.lower().strip()
+    if name in NOT_COUNT_COLUMNS:
+        return False
+    return name in COUNT_COLUMNS or name.startswith("so_") or bool(re.match(r"count\s*\(", name))
+
+
+def _render_scalar(column: str, value: Any) -> str:
+    if _is_count_column(column):
+        return f"Dạ, tổng số là {format_value(column, value)}."
+    return f"Dạ, {_label(column).lower()} là {format_value(column, value)}."
+
+
+def _render_record(row: Dict) -> str:
+    lines = [f"- {_label(col)}: {format_value(col, val)}" for col, val in row.items()]
+    return "Dạ, thông tin tìm được như sau:\n" + "\n".join(lines)
+
+
+def _render_list(rows: List[Dict], name_col: str) -> str:
+    lines = []
+    for row in rows:
+        extras = [f"{_label(c)}: {format_value(c, v)}" for c, v in row.items() if c != name_col]
+        line = f"- {format_value(name_col, row.get(name_col))}"
+        if extras:
+            line += f" ({', '.join(extras)})"
+        lines.append(line)
+    return f"Dạ, có {len(rows)} kết quả:\n" + "\n".join(lines)
+
+
+def render_local_answer(question: str, data: Any) -> Union[str, None]:
+    """Trả lời bằng template nếu kết quả đủ đơn giản, None nếu cần LLM"""
+    intent = detect_intent(question)
+    if not ANSWER_RENDER_CONFIG.get(intent, False):
+        return None
+
+    if isinstance(data, dict):
+        data = [data]
+    if data is None or data == []:
+        return _empty_answer(intent, question)
+    if not isinstance(data, list) or not all(isinstance(r, dict) for r in data):
+        return None
+
+    columns = list(data[0].keys())
+    if not columns:
+        return _empty_answer(intent, question)
+
+    # 1 dòng 1 cột: con số / giá trị đơn
+    if len(data) == 1 and len(columns) == 1:
+        return _render_scalar(columns[0], data[0][columns[0]])
+
+    # 1 bản ghi
+    if len(data) == 1 and len(columns) <= RECORD_MAX_COLUMNS:
+        return _render_record(data[0])
+
+    # Danh sách ngắn có cột tên
+    name_col = _name_column(columns)
+    if name_col and len(data) <= SHORT_LIST_MAX and len(columns) <= LIST_MAX_COLUMNS:
+        return _render_list(data, name_col)
+
+    return None
+
+
+def answer_stats() -> Dict[str, Any]:
+    local, llm = metrics.get("answer.local"), metrics.get("answer.llm")
+    return {"local": local, "llm": llm, "llm_calls_avoided_ratio": metrics.ratio("answer.local", "answer.llm")}
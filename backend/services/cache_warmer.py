@@ -0,0 +1,205 @@
+"""
+Làm nóng cache trước giờ cao điểm (traffic dồn theo giờ và dễ đoán trước).
+
+VD: hỏi đi muộn ngay sau mốc 08:06, hỏi nghỉ phép sáng thứ Hai, hỏi tiến độ dự án trước họp thứ Sáu.
+
+- Mỗi câu hỏi được ghi nhận theo khung giờ (15 phút): khung hằng ngày "d:08:00" và khung theo thứ
+  "w0:08:00" (thứ Hai), lưu các ngày đã hỏi + phút hỏi sớm nhất mỗi ngày (WARM_HISTORY_DAYS ngày gần nhất)
+- Câu hỏi được hỏi trong cùng khung ở >= WARM_MIN_DAYS ngày khác nhau -> "câu hỏi cao điểm" của khung
+- Trước phút hỏi sớm nhất điển hình (trung vị) WARM_LEAD_SECONDS giây, scheduler sinh / làm mới SQL
+  và chạy sẵn trên HRM -> lấp cache câu hỏi -> SQL và SQL -> kết quả dùng chung
+- Đo hiệu quả: độ trễ request ĐẦU TIÊN của mỗi câu hỏi cao điểm trong khung, chia theo đã làm nóng / chưa
+"""
+import asyncio
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Union
+
+from services.query_cache import RESULT_CACHE_TTL
+from services.shared_cache import get_shared_cache, make_key
+from utils import metrics
+from utils.text import normalize_question
+
+DEMAND_NS = "question_demand"
+WARM_CLAIMS_NS = "warm_claims"
+WARM_DONE_NS = "warm_done"
+WARM_FIRST_NS = "warm_first_request"
+DEMAND_TTL = 60 * 24 * 60 * 60
+
+WARM_ENABLED = os.environ.get("CACHE_WARM_ENABLED", "1") == "1"
+WARM_BUCKET_MINUTES = 15
+WARM_HISTORY_DAYS = int(os.environ.get("WARM_HISTORY_DAYS", "28"))
+WARM_MIN_DAYS = int(os.environ.get("WARM_MIN_DAYS", "3"))            # Khung hằng ngày
+WARM_MIN_WEEKDAYS = int(os.environ.get("WARM_MIN_WEEKDAYS", "2"))    # Khung theo thứ (tối đa 4 lần / 28 ngày)
+# Kết quả làm nóng sống RESULT_CACHE_TTL giây kể từ lúc chạy xong (tick có thể trễ thêm WARM_TICK_SECONDS)
+# -> làm nóng trước phút hỏi ít hơn TTL để còn hạn khi request đầu tiên tới
+WARM_LEAD_SECONDS = int(os.environ.get("WARM_LEAD_SECONDS", "45"))
+WARM_TICK_SECONDS = 30
+WARM_MAX_PER_TICK = int(os.environ.get("WARM_MAX_PER_TICK", "10"))
+WARM_MAX_CONCURRENCY = 2
+
+if WARM_LEAD_SECONDS >= RESULT_CACHE_TTL:
+    raise ValueError(f"WARM_LEAD_SECONDS={WARM_LEAD_SECONDS} phải nhỏ hơn RESULT_CACHE_TTL={RESULT_CACHE_TTL}")
+
+
+def _slots(now: datetime) -> List[str]:
+    bucket = now.hour * 60 + now.minute // WARM_BUCKET_MINUTES * WARM_BUCKET_MINUTES
+    label = f"{bucket // 60:02d}:{bucket % 60:02d}"
+    return [f"d:{label}", f"w{now.weekday()}:{label}"]
+
+
+def family_key(question: str) -> str:
+    return make_key(normalize_question(question))
+
+
+def record_question(question: str, now: Union[datetime, None] = None) -> None:
+    """Ghi nhận 1 lần hỏi (ngày + phút hỏi sớm nhất trong ngày) vào khung giờ tương ứng"""
+    normalized = normalize_question(question)
+    if not normalized:
+        return
+    now = now or datetime.now()
+    today, minute = now.date().isoformat(), now.hour * 60 + now.minute
+    oldest = (now.date() - timedelta(days=WARM_HISTORY_DAYS)).isoformat()
+
+    cache, key = get_shared_cache(), make_key(normalized)
+    family = cache.get(DEMAND_NS, key) or {"days": {}}
+    family["question"] = question  # Câu gốc gần nhất (giữ dấu, "năm nay"...) để làm nóng đúng câu người dùng hỏi
+    for slot in _slots(now):
+        days = family["days"].setdefault(slot, {})
+        if minute < days.get(today, 24 * 60):
+            days[today] = minute
+        family["days"][slot] = {d: m for d, m in days.items() if d >= oldest}
+    cache.set(DEMAND_NS, key, family, ttl=DEMAND_TTL)
+
+
+def peak_plan(now: Union[datetime, None] = None) -> List[Dict[str, Any]]:
+    """
+    Các câu hỏi cao điểm của hôm nay: [{key, question, slot, days, warm_at}] (sớm trước).
+    Chỉ tính các ngày trước hôm nay (giống _current_slot): lượt hỏi hôm nay không làm đổi kế hoạch giữa ngày.
+    """
+    now = now or datetime.now()
+    weekday, oldest = f"w{now.weekday()}:", (now.date() - timedelta(days=WARM_HISTORY_DAYS)).isoformat()
+    today = now.date().isoformat()
+    midnight = datetime.combine(now.date(), datetime.min.time())
+    plan = []
+    for key, family in get_shared_cache().items(DEMAND_NS):
+        best = {}
+        for slot, days in family["days"].items():
+            if not (slot.startswith("d:") or slot.startswith(weekday)):
+                continue
+            minutes = [m for d, m in days.items() if oldest <= d < today]
+            if len(minutes) < (WARM_MIN_DAYS if slot.startswith("d:") else WARM_MIN_WEEKDAYS):
+                continue
+            bucket = slot.split(":", 1)[1]
+            warm_at = midnight + timedelta(minutes=statistics.median_low(minutes)) - timedelta(seconds=WARM_LEAD_SECONDS)
+            # Cùng khung có cả "d:" và "w:" -> giữ 1, cộng dồn số ngày
+            entry = best.setdefault(bucket, {"key": key, "question": family["question"], "slot": bucket,
+                                             "days": 0, "warm_at": warm_at})
+            entry["days"] += len(minutes)
+            entry["warm_at"] = min(entry["warm_at"], warm_at)
+        plan.extend(best.values())
+    return sorted(plan, key=lambda p: (p["warm_at"], -p["days"]))
+
+
+def _window_id(key: str, slot: str, now: datetime) -> str:
+    return f"{key}:{now.date().isoformat()}:{slot}"
+
+
+def _current_slot(key: str, now: datetime) -> Union[str, None]:
+    """Câu hỏi (key) có phải câu cao điểm của khung hiện tại không -> khung đó"""
+    family = get_shared_cache().get(DEMAND_NS, key)
+    if not family:
+        return None
+    daily, weekly = _slots(now)
+    oldest = (now.date() - timedelta(days=WARM_HISTORY_DAYS)).isoformat()
+    today = now.date().isoformat()
+    for slot, minimum in ((daily, WARM_MIN_DAYS), (weekly, WARM_MIN_WEEKDAYS)):
+        days = [d for d in family["days"].get(slot, {}) if oldest <= d < today]
+        if len(days) >= minimum:
+            return daily.split(":", 1)[1]
+    return None
+
+
+class CacheWarmer:
+    def __init__(self):
+        self._task = None
+        self._tasks = set()
+        self._semaphore = None
+
+    def start(self, warm: Callable[[str], Awaitable[Any]]) -> None:
+        """warm(question): sinh/làm mới SQL + chạy sẵn kết quả (gọi trong event loop lúc khởi động)"""
+        if self._task is None and WARM_ENABLED:
+            self._semaphore = asyncio.Semaphore(WARM_MAX_CONCURRENCY)
+            self._task = asyncio.ensure_future(self._loop(warm))
+
+    async def _warm_one(self, entry: Dict[str, Any], window_id: str, warm) -> None:
+        started = time.perf_counter()
+        try:
+            async with self._semaphore:
+                await warm(entry["question"])
+            await asyncio.to_thread(get_shared_cache().set, WARM_DONE_NS, window_id, time.time(), ttl=24 * 60 * 60)
+            metrics.incr("warm.done")
+            metrics.incr("warm.seconds", time.perf_counter() - started)
+        except Exception as e:
+            metrics.incr("warm.errors")
+            print(f"⚠️ Làm nóng cache lỗi ({entry['question']}): {e}")
+
+    async def _loop(self, warm):
+        cache = get_shared_cache()
+        while True:
+            try:
+                now = datetime.now()
+                plan = await asyncio.to_thread(peak_plan, now)  # Duyệt toàn bộ DEMAND_NS -> không chặn event loop
+                due = [p for p in plan
+                       if now - timedelta(seconds=WARM_TICK_SECONDS * 4) <= p["warm_at"] <= now]
+                for entry in sorted(due, key=lambda p: -p["days"])[:WARM_MAX_PER_TICK]:
+                    window_id = _window_id(entry["key"], entry["slot"], now)
+                    # Mỗi câu / khung / ngày chỉ 1 worker làm nóng
+                    if not await asyncio.to_thread(cache.add, WARM_CLAIMS_NS, window_id, 1, ttl=24 * 60 * 60):
+                        continue
+                    task = asyncio.ensure_future(self._warm_one(entry, window_id, warm))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+            except Exception as e:
+                print(f"⚠️ Cache warmer lỗi: {e}")
+            await asyncio.sleep(WARM_TICK_SECONDS)
+
+    def observe(self, question: str, seconds: float, now: Union[datetime, None] = None) -> None:
+        """Độ trễ request: chỉ tính request đầu tiên của câu hỏi cao điểm trong khung (mọi worker)"""
+        now = now or datetime.now()
+        key = family_key(question)
+        slot = _current_slot(key, now)
+        if slot is None:
+            return
+        window_id = _window_id(key, slot, now)
+        if not get_shared_cache().add(WARM_FIRST_NS, window_id, round(seconds, 3), ttl=24 * 60 * 60):
+            return
+        state = "warm" if get_shared_cache().get(WARM_DONE_NS, window_id) else "cold"
+        metrics.incr(f"warm.first_{state}")
+        metrics.incr(f"warm.first_{state}_seconds", seconds)
+
+
+cache_warmer = CacheWarmer()
+
+
+def warm_stats() -> Dict[str, Any]:
+    def _avg(state: str) -> Union[float, None]:
+        count = metrics.get(f"warm.first_{state}")
+        return round(metrics.get(f"warm.first_{state}_seconds") / count, 3) if count else None
+
+    plan = peak_plan()
+    return {
+        "enabled": WARM_ENABLED,
+        "families": sum(1 for _ in get_shared_cache().items(DEMAND_NS)),
+        "planned_today": [{"question": p["question"], "slot": p["slot"], "days": p["days"],
+                           "warm_at": p["warm_at"].strftime("%H:%M:%S")} for p in plan[:20]],
+        "warmed": metrics.get("warm.done"),
+        "avg_warm_seconds": round(metrics.get("warm.seconds") / metrics.get("warm.done"), 3)
+        if metrics.get("warm.done") else None,
+        "errors": metrics.get("warm.errors"),
+        # Độ trễ request đầu tiên trong khung cao điểm: đã làm nóng vs chưa (worker hiện tại)
+        "first_request_warm": {"count": metrics.get("warm.first_warm"), "avg_seconds": _avg("warm")},
+        "first_request_cold": {"count": metrics.get("warm.first_cold"), "avg_seconds": _avg("cold")},
+    }
@@ -0,0 +1,222 @@
+"""
+Chỉ mục thực thể (nhân viên, phòng ban, dự án) để đổi tên trong câu hỏi -> id TRƯỚC khi sinh SQL.
+
+- So khớp không dấu ("Tran Dinh Nam" = "Trần Đình Nam") + trigram cho lỗi gõ nhẹ
+- Nạp lại định kỳ từ HRM (snapshot lưu trong cache dùng chung cho mọi worker)
+- Kết quả đưa vào prompt để LLM sinh `id = 42` thay cho `LIKE '%...%'` (quét toàn bảng)
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Tuple, Union
+
+from services.shared_cache import get_shared_cache
+from utils import metrics
+from utils.text import normalize_question
+
+ENTITY_REFRESH_SECONDS = int(os.environ.get("ENTITY_REFRESH_SECONDS", "600"))
+ENTITY_FUZZY_THRESHOLD = float(os.environ.get("ENTITY_FUZZY_THRESHOLD", "0.75"))
+ENTITY_NS = "entity_index"
+MAX_SPAN_TOKENS = 6
+
+# loại thực thể -> (bảng, cột tên, SQL nạp dữ liệu, cột id dùng trong câu SQL)
+ENTITY_SOURCES = {
+    "nhanvien": ("nhanvien", "ho_ten", "SELECT id, ho_ten FROM nhanvien",
+                 "nhanvien.id (hoặc nhan_vien_id ở các bảng liên quan)"),
+    "phong_ban": ("phong_ban", "ten_phong", "SELECT id, ten_phong FROM phong_ban",
+                  "phong_ban.id (nhanvien.phong_ban_id, cong_viec.phong_ban_id)"),
+    "du_an": ("du_an", "ten_du_an", "SELECT id, ten_du_an FROM du_an",
+              "du_an.id (cong_viec.du_an_id)"),
+}
+
+# Tên 1 từ ("Nam", "HRM") quá dễ nhầm -> chỉ nhận khi khớp chính xác, đủ dài, không phải người
+SINGLE_TOKEN_TYPES = {"phong_ban", "du_an"}
+GENERIC_PREFIXES = {"phong", "du an", "phong ban"}
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class EntityIndex:
+    def __init__(self):
+        self._exact: Dict[str, List[Tuple[str, int, str]]] = {}   # tên không dấu -> [(loại, id, tên gốc)]
+        self._token: Dict[str, set] = {}                           # token -> {tên không dấu chứa token}
+        self._trigram: Dict[str, set] = {}                         # trigram -> {token} (từ điển token, nhỏ)
+        self.loaded_at = 0.0
+        self.size = 0
+        self._lock = threading.Lock()
+
+    # ---------- NẠP DỮ LIỆU ----------
+    def load(self, entities: Dict[str, List[Dict]]) -> None:
+        """entities: {loại: [{"id":..., "name":...}]} -> dựng chỉ mục mới rồi tráo vào"""
+        exact, token, trigram = {}, defaultdict(set), defaultdict(set)
+        size = 0
+        for etype, items in entities.items():
+            for item in items:
+                folded = normalize_question(item.get("name") or "")
+                if not folded or item.get("id") is None:
+                    continue
+                exact.setdefault(folded, []).append((etype, item["id"], item["name"]))
+                for tok in folded.split():
+                    token[tok].add(folded)
+                size += 1
+        for tok in token:
+            for tg in _trigrams(tok):
+                trigram[tg].add(tok)
+        with self._lock:
+            self._exact, self._token, self._trigram = exact, dict(token), dict(trigram)
+            self.size = size
+            self.loaded_at = time.time()
+
+    def refresh(self, execute: Callable[[str], object], force: bool = False) -> None:
+        """Nạp lại từ snapshot dùng chung (nếu còn mới) hoặc truy vấn HRM"""
+        cache = get_shared_cache()
+        snapshot = cache.get(ENTITY_NS, "snapshot")
+        if not force and snapshot and time.time() - snapshot["at"] < ENTITY_REFRESH_SECONDS:
+            if snapshot["at"] > self.loaded_at:
+                self.load(snapshot["entities"])
+            return
+
+        entities = {}
+        for etype, (_, name_col, sql, _) in ENTITY_SOURCES.items():
+            rows = execute(sql)
+            if isinstance(rows, dict):
+                rows = [rows]
+            if not isinstance(rows, list):
+                print(f"⚠️ Không nạp được thực thể {etype}: {rows}")
+                continue
+            entities[etype] = [{"id": r.get("id"), "name": r.get(name_col)} for r in rows if isinstance(r, dict)]
+        if entities:
+            self.load(entities)
+            cache.set(ENTITY_NS, "snapshot", {"at": time.time(), "entities": entities})
+            metrics.incr("entity.reloads")
+
+    # ---------- TRA CỨU ----------
+    def _correct_token(self, token: str) -> Union[str, None]:
+        """Từ không có trong tên nào (gõ sai: "orcale") -> từ gần nhất trong từ điển tên (Jaccard trigram)"""
+        grams = _trigrams(token)
+        counts = defaultdict(int)
+        for tg in grams:
+            for candidate in self._trigram.get(tg, ()):
+                counts[candidate] += 1
+        best, best_score = None, 0.0
+        for candidate, shared in counts.items():
+            score = shared / (len(grams) + len(candidate) + 2 - shared)  # số trigram của từ = len + 2
+            if score > best_score:
+                best, best_score = candidate, score
+        return best if best_score >= ENTITY_FUZZY_THRESHOLD else None
+
+    def _lookup(self, span_tokens: List[str]) -> List[Tuple[str, int, str]]:
+        span = " ".join(span_tokens)
+        hits = self._exact.get(span)
+        if hits is not None or len(span_tokens) < 2:
+            return hits or []
+        # Cụm là 1 phần của đúng 1 tên (VD: "oracle cloud" -> "oracle cloud migration")
+        postings = sorted((self._token[t] for t in span_tokens), key=len)
+        containing = [n for n in postings[0] if all(n in p for p in postings[1:]) and f" {span} " in f" {n} "]
+        if len(containing) == 1:
+            return self._exact[containing[0]]
+        return []
+
+    def resolve(self, question: str) -> List[Dict]:
+        """Tìm các thực thể được nhắc tới trong câu hỏi (ưu tiên cụm dài nhất, không chồng lấn)"""
+        started = time.perf_counter()
+        raw_tokens = normalize_question(question).split()
+        matches, used = [], set()
+
+        with self._lock:
+            if not self._exact:
+                return []
+            tokens, corrected = [], set()
+            for i, tok in enumerate(raw_tokens):
+                if tok not in self._token and len(tok) >= 4:
+                    fixed = self._correct_token(tok)
+                    if fixed:
+                        tok = fixed
+                        corrected.add(i)
+                tokens.append(tok)
+
+            for length in range(min(MAX_SPAN_TOKENS, len(tokens)), 0, -1):
+                for start in range(0, len(tokens) - length + 1):
+                    positions = set(range(start, start + length))
+                    span_tokens = tokens[start:start + length]
+                    if positions & used or any(t not in self._token for t in span_tokens):
+                        continue
+                    span = " ".join(span_tokens)
+                    if span in GENERIC_PREFIXES:
+                        continue
+
+                    hits = self._lookup(span_tokens)
+                    if length == 1:
+                        # Tên 1 từ chỉ nhận khi khớp nguyên văn (không sửa lỗi gõ)
+                        hits = [h for h in hits if h[0] in SINGLE_TOKEN_TYPES and len(span) >= 4 and not corrected & positions]
+                    if len(hits) != 1:
+                        continue  # Không thấy / trùng tên nhiều người -> để LLM dùng LIKE như cũ
+
+                    etype, entity_id, name = hits[0]
+                    score = 1.0 if span == normalize_question(name) else 0.9
+                    if corrected & positions:
+                        score -= 0.1
+                    matches.append({"type": etype, "id": entity_id, "name": name,
+                                    "span": " ".join(raw_tokens[start:start + length]), "score": round(score, 2)})
+                    used |= positions
+
+        metrics.incr("entity.resolve_calls")
+        metrics.incr("entity.resolve_ms", (time.perf_counter() - started) * 1000)
+        if matches:
+            metrics.incr("entity.resolved", len(matches))
+        return matches
+
+
+def build_entity_hint(matches: List[Dict]) -> str:
+    """Đoạn gợi ý ghép vào câu hỏi gửi LLM sinh SQL"""
+    if not matches:
+        return ""
+    lines = [
+        "",
+        "GỢI Ý THỰC THỂ (đã tra cứu sẵn trong HRM - ưu tiên dùng điều kiện `id = ...` "
+        "thay cho LIKE theo tên; riêng cột text du_an.phong_ban vẫn dùng LIKE):",
+    ]
+    for m in matches:
+        column = ENTITY_SOURCES[m["type"]][3]
+        lines.append(f'- "{m["span"]}" -> {m["name"]}: {column} = {m["id"]}')
+    return "\n".join(lines)
+
+
+entity_index = EntityIndex()
+
+
+def entity_stats() -> Dict:
+    calls = metrics.get("entity.resolve_calls")
+    return {
+        "size": entity_index.size,
+        "loaded_at": entity_index.loaded_at or None,
+        "reloads": metrics.get("entity.reloads"),
+        "resolve_calls": calls,
+        "resolved": metrics.get("entity.resolved"),
+        "avg_resolve_ms": round(metrics.get("entity.resolve_ms") / calls, 4) if calls else None,
+    }
+
+
+_refresher_started = False
+
+
+def start_entity_refresher(execute: Callable[[str], object]) -> None:
+    """Luồng nền nạp lại chỉ mục định kỳ (gọi 1 lần khi khởi động)"""
+    global _refresher_started
+    if _refresher_started:
+        return
+    _refresher_started = True
+
+    def _loop():
+        while True:
+            try:
+                entity_index.refresh(execute)
+            except Exception as e:
+                print(f"⚠️ Entity index refresh lỗi: {e}")
+            time.sleep(ENTITY_REFRESH_SECONDS)
+
+    threading.Thread(target=_loop, name="entity-index", daemon=True).start()
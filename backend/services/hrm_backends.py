@@ -0,0 +1,359 @@
+"""
+Nhiều HRM backend (mỗi công ty con 1 instance HRM) trong cùng 1 deployment.
+
+- Danh sách backend cấu hình qua HRM_BACKENDS (JSON), VD:
+    HRM_BACKENDS='{"icss": {"name": "ICSS", "url": "https://hrm.icss.com.vn/ICSS/api/execute-sql"},
+                   "abc":  {"name": "ABC",  "url": "https://hrm.abc.vn/api/execute-sql", "timeout": 20}}'
+  Không cấu hình -> 1 backend duy nhất (HRM_API_URL) như trước đây.
+- Mỗi request được định tuyến theo tenant (header X-Tenant / trường tenant), mặc định HRM_DEFAULT_BACKEND
+- Câu hỏi cấp tập đoàn ("toàn tập đoàn", "tất cả công ty"): cùng 1 SQL chạy song song trên mọi backend,
+  kết quả gộp tại chỗ (COUNT/SUM cộng dồn, MIN/MAX lấy min/max theo nhóm; còn lại nối thêm cột cong_ty),
+  rồi áp lại ORDER BY / LIMIT trên tập đã gộp
+- Backend nào quá hạn / lỗi thì bỏ qua, trả kết quả một phần kèm danh sách backend thiếu
+- Tất cả backend dùng chung 1 schema HRM (cùng phần mềm) -> dùng chung prompt / schema_version
+"""
+import json
+import os
+import re
+import threading
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Tuple, Union
+
+from utils.row_stream import RowSet
+from utils.text import fold_text
+
+HRM_API_URL = os.environ.get("HRM_API_URL", "https://hrm.icss.com.vn/ICSS/api/execute-sql")
+HRM_TIMEOUT = float(os.environ.get("HRM_TIMEOUT", "30"))
+HRM_FANOUT_TIMEOUT = float(os.environ.get("HRM_FANOUT_TIMEOUT", "20"))   # Hạn chung cho 1 lần fan-out
+GROUP_SCOPE = "*"                                                        # "tenant" của câu hỏi cấp tập đoàn
+TENANT_COLUMN = "cong_ty"
+
+GROUP_KEYWORDS = (
+    "toan tap doan", "ca tap doan", "tat ca cong ty", "tat ca cac cong ty", "cac cong ty con",
+    "toan bo cong ty con", "moi cong ty", "tung cong ty",
+)
+MERGEABLE = ("count", "sum", "min", "max")
+# Cột định danh đối tượng riêng của từng công ty: nhóm theo cột này thì không cộng dồn giữa các công ty
+ENTITY_COLUMN = re.compile(r"^(id|\w+_id|ma_\w+|ho_ten|ten_\w+|email|so_dien_thoai)$")
+OUTER_KEYWORDS = (r"[()]|\bfrom\b|\bwhere\b|\bgroup\s+by\b|\bhaving\b|\border\s+by\b|\blimit\b"
+                  r"|\bunion\b")
+
+
+class HrmBackend:
+    def __init__(self, backend_id: str, name: str, url: str, timeout: float = HRM_TIMEOUT):
+        self.id = backend_id
+        self.name = name
+        self.url = url
+        self.timeout = timeout
+        self._session = None
+        self._lock = threading.Lock()
+
+    def session(self):
+        """HTTP session riêng mỗi backend (keep-alive tới từng HRM)"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import requests
+                    self._session = requests.Session()
+        return self._session
+
+
+def _load_backends() -> Tuple[Dict[str, HrmBackend], str]:
+    raw = os.environ.get("HRM_BACKENDS", "").strip()
+    backends: Dict[str, HrmBackend] = {}
+    if raw:
+        for backend_id, conf in json.loads(raw).items():
+            backends[backend_id] = HrmBackend(backend_id, conf.get("name", backend_id), conf["url"],
+                                              float(conf.get("timeout", HRM_TIMEOUT)))
+    else:
+        backends["icss"] = HrmBackend("icss", "ICSS", HRM_API_URL)
+    default = os.environ.get("HRM_DEFAULT_BACKEND") or next(iter(backends))
+    if default not in backends:
+        raise ValueError(f"HRM_DEFAULT_BACKEND={default} không có trong HRM_BACKENDS")
+    return backends, default
+
+
+BACKENDS, DEFAULT_BACKEND = _load_backends()
+
+
+def get_backend(tenant: Union[str, None] = None) -> HrmBackend:
+    """Backend của tenant (None -> mặc định); tenant lạ -> KeyError"""
+    return BACKENDS[tenant or DEFAULT_BACKEND]
+
+
+def all_backends() -> List[HrmBackend]:
+    return list(BACKENDS.values())
+
+
+def is_group_question(question: str) -> bool:
+    """Câu hỏi gộp nhiều công ty (chỉ có nghĩa khi cấu hình > 1 backend)"""
+    if len(BACKENDS) < 2:
+        return False
+    folded = fold_text(question)
+    return any(keyword in folded for keyword in GROUP_KEYWORDS)
+
+
+# ---------- GỘP KẾT QUẢ ----------
+def _split_top_level(text: str) -> List[str]:
+    parts, depth, quoted, start = [], 0, False, 0
+    for i, char in enumerate(text):
+        if char == "'":
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and char == ",":
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [p.strip() for p in parts]
+
+
+def _label(name: str) -> str:
+    return re.sub(r"\s+", "", name.strip("`\"")).lower()
+
+
+def _flatten(sql: str) -> str:
+    """Bỏ nội dung chuỗi literal (dấu phẩy / từ khóa trong chuỗi không làm sai việc tách mệnh đề)"""
+    return re.sub(r"'(?:[^']|'')*'", "''", sql).strip().rstrip(";").strip()
+
+
+def _outer_clauses(flat: str) -> Dict[str, str]:
+    """Các mệnh đề của câu SELECT ngoài cùng: {"select": ..., "from": ..., "group by": ..., "order by": ..., "limit": ...}"""
+    depth, marks = 0, [("select", 0, 0)]
+    for m in re.finditer(OUTER_KEYWORDS, flat, re.IGNORECASE):
+        token = m.group(0)
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif depth == 0:
+            marks.append((re.sub(r"\s+", " ", token.lower()), m.start(), m.end()))
+    clauses: Dict[str, str] = {}
+    for i, (name, _, end) in enumerate(marks):
+        stop = marks[i + 1][1] if i + 1 < len(marks) else len(flat)
+        clauses.setdefault(name, flat[end:stop].strip())
+    return clauses
+
+
+def _select_items(sql: str) -> Union[List[Tuple[str, str]], None]:
+    """[(biểu thức, tên cột kết quả)] của câu SELECT ngoài cùng; None nếu không phân tích được"""
+    flat = _flatten(sql)
+    clauses = _outer_clauses(flat)
+    if "union" in clauses:
+        return None
+    match = re.match(r"select\s+(.*)", clauses["select"], re.IGNORECASE | re.DOTALL)
+    if not match or re.match(r"distinct\b", match.group(1), re.IGNORECASE):
+        return None
+    items = []
+    for item in _split_top_level(match.group(1)):
+        if item == "*" or item.endswith(".*"):
+            return None
+        alias = None if item.endswith(")") else re.match(r"(.*?\S)\s+(?:as\s+)?(`?\w+`?)$", item,
+                                                          re.IGNORECASE | re.DOTALL)
+        expression = alias.group(1) if alias else item
+        items.append((expression, _label(alias.group(2) if alias else item.split(".")[-1])))
+    return items
+
+
+def select_aggregates(sql: str) -> Union[Dict[str, Union[str, None]], None]:
+    """
+    Tên cột kết quả -> hàm gộp (count/sum/min/max/avg, None = cột thường) của câu SELECT ngoài cùng.
+    None nếu không phân tích được (DISTINCT, UNION, SELECT *...).
+    """
+    items = _select_items(sql)
+    if items is None:
+        return None
+    kinds: Dict[str, Union[str, None]] = {}
+    for expression, label in items:
+        func = re.match(r"(count|sum|min|max|avg)\s*\(", expression, re.IGNORECASE)
+        kind = None
+        if func:
+            # Chỉ gộp được khi hàm bao trọn biểu thức (COUNT(*) * 2 hay SUM(a) / SUM(b) thì không)
+            kind = func.group(1).lower() if _closes_at_end(expression, func.end() - 1) else "?"
+        kinds[label] = kind
+    return kinds
+
+
+def _closes_at_end(expression: str, open_index: int) -> bool:
+    depth = 0
+    for i in range(open_index, len(expression)):
+        if expression[i] == "(":
+            depth += 1
+        elif expression[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return i == len(expression) - 1
+    return False
+
+
+def _group_labels(sql: str) -> List[str]:
+    """Tên cột trong GROUP BY ngoài cùng (GROUP BY 1 -> tên cột kết quả thứ 1)"""
+    clause = _outer_clauses(_flatten(sql)).get("group by", "")
+    items = _select_items(sql) or []
+    labels = []
+    for item in _split_top_level(clause) if clause else []:
+        item = re.sub(r"\s+(asc|desc)$", "", item, flags=re.IGNORECASE)
+        if item.isdigit() and 0 < int(item) <= len(items):
+            labels.append(items[int(item) - 1][1])
+        else:
+            labels.append(_label(item.split(".")[-1]))
+    return labels
+
+
+def _order_and_limit(sql: str, columns: List[str]) -> Tuple[Union[List[Tuple[int, bool]], None], Union[int, None]]:
+    """
+    ORDER BY / LIMIT của câu SELECT ngoài cùng, quy về vị trí cột trong kết quả gộp:
+    ([(vị trí cột, giảm dần)], số dòng). Thứ tự None = có ORDER BY nhưng không quy được về cột nào.
+    """
+    clauses = _outer_clauses(_flatten(sql))
+    limit = None
+    numbers = re.findall(r"\d+", clauses.get("limit", ""))
+    if numbers:
+        # LIMIT n | LIMIT offset, n | LIMIT n OFFSET m
+        limit = int(numbers[1] if "," in clauses["limit"] else numbers[0])
+    if "order by" not in clauses:
+        return [], limit
+
+    items = _select_items(sql) or []
+    by_expression = {_label(expression): label for expression, label in items}
+    positions = {_label(c): i for i, c in enumerate(columns)}
+    order = []
+    for item in _split_top_level(clauses["order by"]):
+        match = re.match(r"(.*?)(?:\s+(asc|desc))?$", item, re.IGNORECASE | re.DOTALL)
+        expression, descending = match.group(1), (match.group(2) or "").lower() == "desc"
+        if expression.isdigit() and 0 < int(expression) <= len(items):
+            label = items[int(expression) - 1][1]
+        else:
+            label = by_expression.get(_label(expression), _label(expression.split(".")[-1]))
+        if label not in positions:
+            return None, limit
+        order.append((positions[label], descending))
+    return order, limit
+
+
+def _sort_value(value: Any) -> tuple:
+    """Khóa so sánh an toàn giữa kiểu khác nhau; NULL nhỏ nhất như MySQL (đầu khi ASC, cuối khi DESC)"""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (1, value)
+    try:
+        return (1, float(value))  # DECIMAL thường về dạng chuỗi "12.50"
+    except (TypeError, ValueError):
+        return (2, str(value))
+
+
+def _reorder(sql: str, merged: RowSet) -> RowSet:
+    """Áp lại ORDER BY / LIMIT trên kết quả gộp (mỗi backend chỉ sắp xếp / cắt phần của mình)"""
+    order, limit = _order_and_limit(sql, merged.columns)
+    if not order and limit is None:
+        return merged
+    if order is None:
+        return merged  # Không biết sắp theo gì -> cắt LIMIT sẽ bỏ nhầm dòng, trả đủ
+    rows = list(merged)
+    for index, descending in reversed(order):
+        rows.sort(key=lambda row: _sort_value(row[index]), reverse=descending)
+    result = RowSet(merged.columns)
+    for row in rows[:limit]:
+        result.append(dict(zip(merged.columns, row)))
+    merged.close()
+    return result.finish()
+
+
+def _as_number(value: Any) -> Union[int, float, Decimal]:
+    """Giá trị số của 1 ô tổng hợp; DECIMAL thường về dạng chuỗi "1200.50" -> Decimal (cộng không lệch số lẻ)"""
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, (int, float, Decimal)):
+        return value
+    try:
+        number = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(value)
+    if not number.is_finite():
+        raise ValueError(value)
+    return number
+
+
+def _extreme_key(value: Any) -> tuple:
+    """Khóa so sánh MIN/MAX: theo số nếu là số (kể cả chuỗi DECIMAL), còn lại theo chuỗi (ngày ISO sắp đúng)"""
+    try:
+        return (0, _as_number(value))
+    except ValueError:
+        return (1, str(value))
+
+
+def _combine(kind: str, current: Any, value: Any) -> Any:
+    """Gộp 2 ô COUNT/SUM/MIN/MAX; ValueError nếu COUNT/SUM không phải số hoặc MIN/MAX lẫn số với chữ"""
+    if kind in ("min", "max"):
+        a, b = _extreme_key(current), _extreme_key(value)
+        if a[0] != b[0]:
+            raise ValueError((current, value))
+        return current if (a <= b) == (kind == "min") else value
+    a, b = _as_number(current), _as_number(value)
+    if isinstance(a, Decimal) or isinstance(b, Decimal):
+        total = Decimal(str(a)) + Decimal(str(b))
+        # Giữ dạng chuỗi như HRM trả về (các dòng không cần gộp vẫn là chuỗi)
+        return str(total) if isinstance(current, str) or isinstance(value, str) else total
+    return a + b
+
+
+def _merge_groups(results: List[Tuple[HrmBackend, RowSet]], columns: List[str],
+                  column_kinds: List[Union[str, None]]) -> RowSet:
+    """Cộng dồn / min / max theo nhóm; ValueError nếu có ô COUNT/SUM không đổi được sang số"""
+    groups: Dict[tuple, List[Any]] = {}
+    for _, rows in results:
+        for row in rows:
+            for value, kind in zip(row, column_kinds):
+                if kind in ("count", "sum") and value is not None:
+                    _as_number(value)
+            key = tuple(v for v, k in zip(row, column_kinds) if k is None)
+            current = groups.get(key)
+            if current is None:
+                groups[key] = list(row)
+                continue
+            for i, kind in enumerate(column_kinds):
+                if kind and row[i] is not None:
+                    current[i] = row[i] if current[i] is None else _combine(kind, current[i], row[i])
+    merged = RowSet(columns)
+    for values in groups.values():
+        merged.append(dict(zip(columns, values)))
+    return merged.finish()
+
+
+def merge_results(sql: str, results: List[Tuple[HrmBackend, RowSet]]) -> RowSet:
+    """
+    Gộp kết quả cùng 1 SQL từ nhiều backend, rồi áp lại ORDER BY / LIMIT trên tập đã gộp:
+    - Cột gộp được (COUNT/SUM/MIN/MAX) nhóm theo thuộc tính chung (trạng thái, tháng...)
+      -> cộng dồn / min / max theo nhóm, theo giá trị số (DECIMAL dạng chuỗi cũng vậy)
+    - Nhóm theo đối tượng riêng của từng công ty (id, mã, họ tên, tên dự án...), danh sách chi tiết,
+      AVG, biểu thức, COUNT/SUM không phải số -> nối các dòng, thêm cột cong_ty ở đầu
+      (2 nhân viên trùng tên ở 2 công ty không bị cộng dồn)
+    """
+    merged_columns = results[0][1].columns if results else []
+    kinds = select_aggregates(sql)
+    same_columns = all(rows.columns == merged_columns for _, rows in results)
+    if kinds and same_columns and merged_columns and all(_label(c) in kinds for c in merged_columns):
+        column_kinds = [kinds[_label(c)] for c in merged_columns]
+        keys = [_label(c) for c, k in zip(merged_columns, column_kinds) if k is None] + _group_labels(sql)
+        per_entity = any(ENTITY_COLUMN.match(key) for key in keys)
+        if any(column_kinds) and all(k is None or k in MERGEABLE for k in column_kinds) and not per_entity:
+            try:
+                return _reorder(sql, _merge_groups(results, merged_columns, column_kinds))
+            except ValueError:
+                pass  # Ô tổng hợp không phải số -> không gộp, nối dòng như bên dưới
+
+    merged = RowSet([TENANT_COLUMN])
+    for backend, rows in results:
+        for record in rows.iter_records():
+            merged.append({TENANT_COLUMN: backend.name, **record})
+    return _reorder(sql, merged.finish())
+
+
+def backend_stats() -> Dict[str, Any]:
+    return {
+        "default": DEFAULT_BACKEND,
+        "backends": [{"id": b.id, "name": b.name, "timeout": b.timeout} for b in BACKENDS.values()],
+    }
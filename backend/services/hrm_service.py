@@ -1,12 +1,13 @@
 import requests
 
-HRM_API_URL = "https://hrm.icss.com.vn/ICSS/api/execute-sql"
+from services.hrm_backends import get_backend
 
-def execute_sql(sql: str):
+def execute_sql(sql: str, tenant: str = None):
+    backend = get_backend(tenant)
     payload = {"command": sql}
     headers = {"Content-Type": "application/json"}
 
-    res = requests.post(HRM_API_URL, json=payload, headers=headers, timeout=10)
+    res = requests.post(backend.url, json=payload, headers=headers, timeout=10)
     
     if res.status_code != 200:
         raise Exception("HRM API error")
@@ -0,0 +1,56 @@
+"""
+Chạy các stage độc lập của 1 request song song (sinh câu trả lời, dựng báo cáo, ghi cache...).
+
+Stage chậm hoặc lỗi không chặn response: người gọi chờ có timeout, quá hạn thì dùng giá trị
+mặc định và stage vẫn chạy tiếp ở nền (VD: báo cáo Word hoàn tất sau, /download trả 202).
+"""
+import asyncio
+import time
+from typing import Any, Dict
+
+from utils import metrics
+
+# Giữ tham chiếu tới các stage chạy nền để không bị garbage collect giữa chừng
+_background_tasks = set()
+
+
+class StageGroup:
+    def __init__(self, name: str):
+        self.name = name
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.timings: Dict[str, float] = {}
+
+    def start(self, stage: str, coro) -> asyncio.Task:
+        """Khởi chạy 1 stage ngay lập tức"""
+        started = time.perf_counter()
+        task = asyncio.ensure_future(coro)
+        self.tasks[stage] = task
+        _background_tasks.add(task)
+        task.add_done_callback(lambda t: self._on_done(stage, t, started))
+        return task
+
+    def _on_done(self, stage: str, task: asyncio.Task, started: float) -> None:
+        _background_tasks.discard(task)
+        self.timings[stage] = round(time.perf_counter() - started, 3)
+        # Tổng số lần + tổng thời gian mỗi stage -> /admin/metrics (trung bình = seconds / count)
+        metrics.incr(f"stage.{self.name}.{stage}.count")
+        metrics.incr(f"stage.{self.name}.{stage}.seconds", self.timings[stage])
+        if not task.cancelled() and task.exception() is not None:
+            print(f"⚠️ [{self.name}] Stage '{stage}' lỗi: {task.exception()}")
+
+    async def result(self, stage: str, timeout: float = None, default: Any = None) -> Any:
+        """Chờ kết quả stage; lỗi hoặc quá `timeout` giây -> trả `default` (stage không bị hủy)"""
+        task = self.tasks.get(stage)
+        if task is None:
+            return default
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ [{self.name}] Stage '{stage}' chậm hơn {timeout}s -> trả response trước")
+            return default
+        except Exception:
+            return default
+
+    def is_running(self, stage: str) -> bool:
+        task = self.tasks.get(stage)
+        return task is not None and not task.done()
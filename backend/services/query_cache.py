@@ -0,0 +1,48 @@
+"""
+Cache câu hỏi -> SQL và SQL -> kết quả (dùng chung giữa các worker).
+Key có kèm version schema: DDL thay đổi -> mọi entry cũ tự thành miss.
+Câu hỏi có mốc tương đối ("hôm nay", "tháng này") được đổi ra ngày cụ thể trước khi làm key,
+SQL lưu trong cache là SQL đã thay CURDATE()... bằng ngày cụ thể (utils/relative_dates.py).
+Key kèm scope = id HRM backend (hoặc "*" cho câu hỏi cấp tập đoàn): mỗi công ty có dữ liệu / id riêng.
+"""
+from typing import Any, Set, Union
+
+from services.hrm_backends import DEFAULT_BACKEND
+from services.schema_service import schema_version
+from services.shared_cache import get_shared_cache, make_key
+from utils.relative_dates import canonicalize_question, rollover_ttl
+
+SQL_NS = "question_sql"
+RESULT_NS = "sql_result"
+
+SQL_CACHE_TTL = 24 * 60 * 60     # SQL sinh ra ổn định -> giữ 1 ngày
+RESULT_CACHE_TTL = 60            # Dữ liệu HRM thay đổi liên tục -> chỉ giữ ngắn
+
+
+def get_cached_sql(question: str, scope: str = DEFAULT_BACKEND) -> Union[str, None]:
+    """SQL đã sinh cho câu hỏi (đã chuẩn hóa) trước đó"""
+    text, _ = canonicalize_question(question)
+    return get_shared_cache().get(SQL_NS, make_key(schema_version(), scope, text))
+
+
+def set_cached_sql(question: str, sql: str, sql_periods: Set[str] = frozenset(),
+                   scope: str = DEFAULT_BACKEND) -> None:
+    """sql_periods: các chu kỳ (day/month...) mà SQL đã chuẩn hóa phụ thuộc -> hết hạn khi sang chu kỳ mới"""
+    text, question_periods = canonicalize_question(question)
+    ttl = SQL_CACHE_TTL
+    cap = rollover_ttl(question_periods, set(sql_periods))
+    if cap is not None:
+        ttl = min(ttl, cap)
+    get_shared_cache().set(SQL_NS, make_key(schema_version(), scope, text), sql, ttl=ttl)
+
+
+def get_cached_result(sql: str, backend: str = DEFAULT_BACKEND) -> Any:
+    """Kết quả HRM của câu SQL (None nếu chưa có / đã hết hạn)"""
+    return get_shared_cache().get(RESULT_NS, make_key(schema_version(), backend, sql))
+
+
+def set_cached_result(sql: str, data: Any, backend: str = DEFAULT_BACKEND) -> None:
+    # Không cache thông báo lỗi (chuỗi) để lần sau còn thử lại
+    if isinstance(data, str):
+        return
+    get_shared_cache().set(RESULT_NS, make_key(schema_version(), backend, sql), data, ttl=RESULT_CACHE_TTL)
@@ -0,0 +1,173 @@
+"""
+Nhật ký truy vấn HRM: mỗi lần gọi execute-sql ghi 1 dòng JSON (append-only, xoay vòng theo dung lượng).
+
+Mỗi dòng: thời điểm, fingerprint SQL (bỏ literal), SQL, câu hỏi gốc, HRM backend, thời gian chạy (ms),
+số dòng, số byte, lỗi. /admin/query-stats gộp theo fingerprint: tổng thời gian, p95, tỉ lệ lỗi
+-> biết họ câu hỏi nào nên cache / tổng hợp sẵn / viết lại trước.
+
+Nhiều worker cùng ghi 1 file: mỗi dòng là 1 lần write() với O_APPEND (không xen kẽ nội dung),
+xoay vòng có khóa file (fcntl) để chỉ 1 tiến trình đổi tên.
+"""
+import json
+import math
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Union
+
+from utils.sql_normalize import sql_fingerprint
+
+try:
+    import fcntl
+except ImportError:  # Windows (máy dev) -> bỏ khóa liên tiến trình
+    fcntl = None
+
+QUERY_LOG_ENABLED = os.environ.get("QUERY_LOG_ENABLED", "1") == "1"
+QUERY_LOG_PATH = os.environ.get("QUERY_LOG_PATH", "./cache/query_log.jsonl")
+QUERY_LOG_MAX_BYTES = int(os.environ.get("QUERY_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+QUERY_LOG_BACKUPS = int(os.environ.get("QUERY_LOG_BACKUPS", "5"))
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "2000"))
+MAX_LOGGED_SQL = 4000
+MIN_CALLS_FOR_ERROR_RATE = 3
+
+_lock = threading.Lock()
+
+
+def _rotate(path: str) -> None:
+    """query_log.jsonl -> .1 -> .2 ... (bỏ file cũ nhất)"""
+    with open(f"{path}.lock", "a") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            # Tiến trình khác có thể vừa xoay xong -> kiểm tra lại
+            if not os.path.exists(path) or os.path.getsize(path) < QUERY_LOG_MAX_BYTES:
+                return
+            for index in range(QUERY_LOG_BACKUPS - 1, 0, -1):
+                if os.path.exists(f"{path}.{index}"):
+                    os.replace(f"{path}.{index}", f"{path}.{index + 1}")
+            os.replace(path, f"{path}.1")
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def log_query(sql: str, question: str = "", seconds: float = 0.0, rows: Union[int, None] = None,
+              nbytes: Union[int, None] = None, error: Union[str, None] = None,
+              backend: str = "", path: str = QUERY_LOG_PATH) -> None:
+    """Ghi 1 lần chạy SQL trên HRM (không bao giờ làm hỏng request nếu ghi lỗi)"""
+    if not QUERY_LOG_ENABLED or not sql:
+        return
+    ms = round(seconds * 1000, 1)
+    if ms >= SLOW_QUERY_MS:
+        print(f"⚠️ Query chậm {ms:.0f}ms: {sql}")
+    entry = {
+        "ts": round(time.time(), 3),
+        "fp": sql_fingerprint(sql),
+        "sql": sql[:MAX_LOGGED_SQL],
+        "question": question,
+        "backend": backend,
+        "ms": ms,
+        "rows": rows,
+        "bytes": nbytes,
+        "error": error,
+    }
+    line = (json.dumps(entry, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+    try:
+        with _lock:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            if os.path.exists(path) and os.path.getsize(path) >= QUERY_LOG_MAX_BYTES:
+                _rotate(path)
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+    except OSError as e:
+        print(f"⚠️ Không ghi được query log: {e}")
+
+
+def read_entries(since: float = 0.0, path: str = QUERY_LOG_PATH):
+    """Duyệt các dòng log (file xoay vòng cũ trước) có ts >= since"""
+    for index in range(QUERY_LOG_BACKUPS, -1, -1):
+        file_path = f"{path}.{index}" if index else path
+        try:
+            f = open(file_path, encoding="utf-8")
+        except OSError:
+            continue
+        with f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Dòng ghi dở (tiến trình chết giữa chừng)
+                if entry.get("ts", 0) >= since:
+                    yield entry
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    """Percentile kiểu nearest-rank"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def query_stats(hours: float = 24, limit: int = 20, path: str = QUERY_LOG_PATH,
+                include_details: bool = True) -> Dict[str, Any]:
+    """
+    Gộp log theo fingerprint: top theo tổng thời gian, theo p95, theo tỉ lệ lỗi.
+    include_details=False -> bỏ câu hỏi gốc và SQL mẫu (có tên nhân viên, phòng ban...), chỉ giữ fingerprint
+    """
+    since = time.time() - hours * 3600 if hours else 0.0
+    groups: Dict[str, Dict[str, Any]] = defaultdict(lambda: {
+        "latencies": [], "errors": 0, "rows": 0, "bytes": 0, "questions": Counter(), "backends": Counter(),
+        "sql": "",
+    })
+    total, oldest = 0, None
+    for entry in read_entries(since, path):
+        total += 1
+        oldest = entry["ts"] if oldest is None else min(oldest, entry["ts"])
+        group = groups[entry.get("fp") or sql_fingerprint(entry.get("sql", ""))]
+        group["latencies"].append(entry.get("ms") or 0.0)
+        group["errors"] += 1 if entry.get("error") else 0
+        group["rows"] += entry.get("rows") or 0
+        group["bytes"] += entry.get("bytes") or 0
+        if entry.get("question"):
+            group["questions"][entry["question"]] += 1
+        if entry.get("backend"):
+            group["backends"][entry["backend"]] += 1
+        group["sql"] = entry.get("sql", "")  # Ví dụ gần nhất
+
+    summaries = []
+    for fingerprint, group in groups.items():
+        latencies = sorted(group["latencies"])
+        calls = len(latencies)
+        summary = {
+            "fingerprint": fingerprint,
+            "calls": calls,
+            "total_ms": round(sum(latencies), 1),
+            "avg_ms": round(sum(latencies) / calls, 1),
+            "p50_ms": _percentile(latencies, 50),
+            "p95_ms": _percentile(latencies, 95),
+            "max_ms": latencies[-1],
+            "error_rate": round(group["errors"] / calls, 4),
+            "avg_rows": round(group["rows"] / calls, 1),
+            "total_bytes": group["bytes"],
+            "top_questions": [q for q, _ in group["questions"].most_common(3)],
+            "backends": dict(group["backends"]),
+            "example_sql": group["sql"],
+        }
+        if not include_details:
+            del summary["top_questions"], summary["example_sql"]
+        summaries.append(summary)
+
+    with_errors = [s for s in summaries if s["error_rate"] > 0 and s["calls"] >= MIN_CALLS_FOR_ERROR_RATE]
+    return {
+        "hours": hours,
+        "entries": total,
+        "fingerprints": len(summaries),
+        "oldest_ts": oldest,
+        "top_total_time": sorted(summaries, key=lambda s: -s["total_ms"])[:limit],
+        "top_p95": sorted(summaries, key=lambda s: -s["p95_ms"])[:limit],
+        "top_error_rate": sorted(with_errors, key=lambda s: (-s["error_rate"], -s["calls"]))[:limit],
+    }
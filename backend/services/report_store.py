@@ -0,0 +1,191 @@
+"""
+Thư mục báo cáo dùng chung giữa các worker: ghi file nguyên tử + chỉ mục báo cáo.
+
+Chỉ mục lưu sẵn metadata phục vụ tải file (kích thước, mtime, ETag, content type) và được
+giữ thêm 1 bản trong RAM -> /download không phải stat/đọc file để trả 304 / Range.
+Link tải là token ký HMAC có hạn dùng, không lộ tên file.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Tuple, Union
+
+from services.shared_cache import get_shared_cache
+
+EXPORT_DIR = os.environ.get("REPORT_DIR", "./static/reports")
+REPORT_NS = "reports"
+REPORT_TTL = 7 * 24 * 60 * 60
+DOWNLOAD_LINK_TTL = int(os.environ.get("DOWNLOAD_LINK_TTL", str(24 * 60 * 60)))
+LOCAL_INDEX_SIZE = 1024
+
+MEDIA_TYPES = {
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "pdf": "application/pdf",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv; charset=utf-8",
+}
+
+os.makedirs(EXPORT_DIR, exist_ok=True)
+
+_local_index: "OrderedDict[str, Dict]" = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def atomic_save(save_fn, filename: str) -> str:
+    """
+    Ghi file vào thư mục báo cáo một cách nguyên tử: ghi ra file tạm cùng thư mục
+    rồi os.replace -> worker khác không bao giờ đọc phải file ghi dở.
+    """
+    filepath = os.path.join(EXPORT_DIR, filename)
+    tmp_path = os.path.join(EXPORT_DIR, f".{filename}.{uuid.uuid4().hex}.tmp")
+    try:
+        save_fn(tmp_path)
+        os.replace(tmp_path, filepath)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return filepath
+
+
+def new_report_filename(prefix: str, ext: str) -> str:
+    return f"{prefix}_{uuid.uuid4().hex[:6]}.{ext}"
+
+
+def mark_report_pending(filename: str, question: str = "") -> None:
+    """Báo cáo đang được dựng ở nền -> /download trả 202 thay vì 404"""
+    get_shared_cache().set(REPORT_NS, filename, {
+        "filename": filename,
+        "status": "pending",
+        "question": question,
+        "created_at": time.time(),
+    }, ttl=REPORT_TTL)
+
+
+def mark_report_failed(filename: str) -> None:
+    get_shared_cache().set(REPORT_NS, filename, {"filename": filename, "status": "failed"}, ttl=REPORT_TTL)
+
+
+def media_type_for(filename: str) -> str:
+    return MEDIA_TYPES.get(filename.rsplit(".", 1)[-1].lower(), "application/octet-stream")
+
+
+def _file_etag(filepath: str) -> str:
+    """ETag mạnh = hash nội dung (báo cáo không bao giờ bị ghi đè nên chỉ tính 1 lần)"""
+    digest = hashlib.sha1()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return f'"{digest.hexdigest()[:20]}"'
+
+
+def _remember(filename: str, info: Dict) -> None:
+    with _local_lock:
+        _local_index[filename] = info
+        _local_index.move_to_end(filename)
+        while len(_local_index) > LOCAL_INDEX_SIZE:
+            _local_index.popitem(last=False)
+
+
+def forget_report(filename: str) -> None:
+    with _local_lock:
+        _local_index.pop(filename, None)
+
+
+def register_report(filepath: str, question: str = "") -> None:
+    """Ghi nhận báo cáo vào chỉ mục dùng chung (kèm metadata phục vụ tải file)"""
+    filename = os.path.basename(filepath)
+    st = os.stat(filepath)
+    info = {
+        "filename": filename,
+        "status": "ready",
+        "size": st.st_size,
+        "mtime": st.st_mtime,
+        "etag": _file_etag(filepath),
+        "media_type": media_type_for(filename),
+        "question": question,
+        "created_at": time.time(),
+    }
+    get_shared_cache().set(REPORT_NS, filename, info, ttl=REPORT_TTL)
+    _remember(filename, info)
+
+
+def get_report(filename: str) -> Union[Dict, None]:
+    """Metadata báo cáo: bản trong RAM trước, rồi tới chỉ mục dùng chung (báo cáo của worker khác)"""
+    info = _local_index.get(filename)
+    if info is not None:
+        return info
+    info = get_shared_cache().get(REPORT_NS, filename)
+    if info and info.get("status") == "ready":
+        if "etag" not in info:
+            # Báo cáo ghi nhận trước khi có ETag -> bổ sung 1 lần
+            try:
+                register_report(os.path.join(EXPORT_DIR, filename), info.get("question", ""))
+            except OSError:
+                return None
+            return _local_index.get(filename)
+        _remember(filename, info)  # Trạng thái "pending" không giữ trong RAM vì còn đổi
+    return info
+
+
+# ---------- LINK TẢI CÓ CHỮ KÝ ----------
+_secret = None
+
+
+def _download_secret() -> bytes:
+    """DOWNLOAD_SECRET, hoặc khóa ngẫu nhiên tạo 1 lần và dùng chung cho mọi worker (file cạnh cache)"""
+    global _secret
+    if _secret is None:
+        env_secret = os.environ.get("DOWNLOAD_SECRET")
+        if env_secret:
+            _secret = env_secret.encode("utf-8")
+        else:
+            path = os.path.join(os.path.dirname(os.path.abspath(get_shared_cache().path)), "download_secret")
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(uuid.uuid4().hex + uuid.uuid4().hex)
+            try:
+                os.link(tmp_path, path)  # Nguyên tử: chỉ 1 worker tạo được, các worker khác đọc lại
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(tmp_path)
+            with open(path) as f:
+                _secret = f.read().strip().encode("utf-8")
+    return _secret
+
+
+def _b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def sign_download(filename: str, ttl: int = DOWNLOAD_LINK_TTL) -> str:
+    """Token tải file: base64(tên file:hạn dùng).chữ ký"""
+    payload = _b64(f"{filename}:{int(time.time() + ttl)}".encode("utf-8"))
+    signature = _b64(hmac.new(_download_secret(), payload.encode("ascii"), hashlib.sha256).digest()[:16])
+    return f"{payload}.{signature}"
+
+
+def verify_download(token: str) -> Tuple[Union[str, None], str]:
+    """(tên file, "ok") nếu token hợp lệ; (None, "invalid" | "expired") nếu không"""
+    try:
+        payload, signature = token.split(".", 1)
+        expected = _b64(hmac.new(_download_secret(), payload.encode("ascii"), hashlib.sha256).digest()[:16])
+        if not hmac.compare_digest(signature, expected):
+            return None, "invalid"
+        filename, expires = _unb64(payload).decode("utf-8").rsplit(":", 1)
+    except (ValueError, UnicodeDecodeError):
+        return None, "invalid"
+    if int(expires) < time.time():
+        return None, "expired"
+    if "/" in filename or "\\" in filename or filename.startswith("."):
+        return None, "invalid"
+    return filename, "ok"
@@ -0,0 +1,328 @@
+"""
+Xử lý hậu kỳ trên kết quả truy vấn gần nhất (sort / filter / top-N / group).
+
+Các câu hỏi nối tiếp kiểu "sắp xếp theo lương giảm dần", "top 5", "lọc phòng Kỹ thuật",
+"đếm theo phòng ban" chỉ cần định dạng lại dữ liệu đã có -> chạy ngay trong tiến trình
+bằng pandas, không gọi LLM sinh SQL và không gọi API HRM.
+"""
+import operator
+import re
+from typing import Dict, List, Union
+
+from utils.text import fold_text
+
+# Cụm từ tiếng Việt (đã bỏ dấu) -> các mảnh tên cột có thể khớp
+COLUMN_SYNONYMS = {
+    "luong co ban": ["luong_co_ban"],
+    "thuc linh": ["thuc_linh"],
+    "luong": ["luong_co_ban", "thuc_linh", "luong"],
+    "ho ten": ["ho_ten"],
+    "ten": ["ho_ten", "ten_du_an", "ten_cong_viec", "ten_phong", "ten"],
+    "phong ban": ["ten_phong", "phong_ban"],
+    "phong": ["ten_phong", "phong_ban"],
+    "tien do": ["tien_do", "phan_tram"],
+    "phan tram": ["phan_tram", "tien_do"],
+    "han": ["han_hoan_thanh", "ngay_ket_thuc"],
+    "deadline": ["han_hoan_thanh", "ngay_ket_thuc"],
+    "ngay": ["ngay"],
+    "trang thai": ["trang_thai"],
+    "so luong": ["so_luong", "total"],
+    "gio vao": ["check_in"],
+    "check in": ["check_in"],
+    "gio ra": ["check_out"],
+    "kpi": ["diem_kpi"],
+    "phep": ["ngay_phep_con_lai"],
+    "chuc vu": ["chuc_vu"],
+    "quan ly": ["quan_ly", "lead"],
+    "uu tien": ["muc_do_uu_tien"],
+}
+
+# Danh từ chung đứng trước/sau tên cột, bỏ qua khi phân tích
+FILLER_WORDS = {
+    "cho", "toi", "minh", "em", "hay", "giup", "di", "nhe", "nha", "a", "voi", "lai",
+    "ket", "qua", "danh", "sach", "tren", "nay", "do", "cac", "nhung", "theo",
+    "nguoi", "nhan", "vien", "du", "an", "cong", "viec", "dong", "ban", "ghi", "cua",
+}
+
+COMPARE_WORDS = {
+    "tren": ">", "lon hon": ">", ">": ">", ">=": ">=",
+    "duoi": "<", "nho hon": "<", "<": "<", "<=": "<=",
+    "bang": "==", "=": "==",
+}
+
+COMPARE_OPS = {
+    ">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le, "==": operator.eq,
+}
+
+# Dấu phẩy giữa 2 chữ số là dấu thập phân ("9,5 triệu"), không tách mệnh đề
+CLAUSE_SPLIT = re.compile(r"\s*(?:(?<!\d),|,(?!\d)|;|\broi\b|\bsau do\b|\bva\b|\bthen\b)\s*")
+
+DESC_WORDS = ("giam dan", "tu cao den thap", "cao xuong thap", "tu lon den nho", "moi nhat", "desc")
+ASC_WORDS = ("tang dan", "tu thap den cao", "thap len cao", "tu nho den lon", "cu nhat", "asc")
+
+FOLLOWUP_HINTS = ("sap xep", "xep theo", "loc ", "chi lay", "chi hien", "chi xem",
+                  "chi giu", "dem theo", "thong ke theo", "nhom theo", "gom nhom theo",
+                  "giam dan", "tang dan")
+# "top 5", "cao nhất"... cũng hay gặp ở câu hỏi mới ("5 người lương cao nhất")
+# -> chỉ coi là nối tiếp khi có từ chỉ kết quả trước, hoặc không nhắc tới đối tượng / mốc thời gian mới
+RANKING_HINTS = ("top ", "dau tien", "cao nhat", "nhieu nhat", "thap nhat", "it nhat")
+REFERENCE_MARKERS = re.compile(r"\b(?:trong (?:so )?do|o tren|vua roi|vua xong|ket qua|danh sach (?:nay|tren|do))\b")
+NEW_SUBJECT_WORDS = re.compile(
+    r"\b(?:nguoi|nhan vien|du an|cong viec|phong ban|cham cong|nghi phep|bang luong|cong ty"
+    r"|hom nay|hom qua|tuan|thang|nam nay|nam ngoai)\b"
+)
+
+
+def _strip_fillers(phrase: str) -> str:
+    tokens = [t for t in phrase.split() if t not in FILLER_WORDS]
+    return " ".join(tokens)
+
+
+def resolve_column(phrase: str, columns: List[str]) -> Union[str, None]:
+    """Ánh xạ cụm từ trong câu hỏi (đã bỏ dấu) sang tên cột có trong kết quả"""
+    phrase = phrase.strip()
+    if not phrase:
+        return None
+
+    folded_cols = {c: fold_text(c) for c in columns}
+
+    # 1. Trùng tên cột (ho ten -> ho_ten)
+    for col, folded in folded_cols.items():
+        if folded == phrase.replace(" ", "_") or folded.replace("_", " ") == phrase:
+            return col
+
+    # 2. Cụm từ là tập con của tên cột (ten du an -> ten_du_an)
+    phrase_tokens = set(phrase.split())
+    for col, folded in folded_cols.items():
+        if phrase_tokens <= set(folded.split("_")):
+            return col
+
+    # 3. Từ đồng nghĩa (luong -> luong_co_ban)
+    for key in sorted(COLUMN_SYNONYMS, key=len, reverse=True):
+        if phrase == key or phrase.startswith(key + " "):
+            for fragment in COLUMN_SYNONYMS[key]:
+                for col, folded in folded_cols.items():
+                    if fragment in folded:
+                        return col
+
+    # 4. Thử lại sau khi bỏ từ đệm (luong cua nhan vien -> luong)
+    stripped = _strip_fillers(phrase)
+    if stripped and stripped != phrase:
+        return resolve_column(stripped, columns)
+    return None
+
+
+def _parse_number(text: str, unit: str) -> float:
+    value = float(text.replace(",", "."))
+    unit = (unit or "").strip()
+    if unit == "trieu":
+        value *= 1_000_000
+    elif unit in ("nghin", "ngan", "k"):
+        value *= 1_000
+    return value
+
+
+def _parse_clause(clause: str, columns: List[str], rows: List[Dict]) -> Union[List[Dict], None]:
+    """Phân tích 1 mệnh đề -> danh sách thao tác; None nếu không hiểu"""
+    ops = []
+    descending = any(w in clause for w in DESC_WORDS)
+    ascending = any(w in clause for w in ASC_WORDS)
+    body = clause
+    for w in DESC_WORDS + ASC_WORDS:
+        body = body.replace(w, " ")
+    body = re.sub(r"\s+", " ", body).strip()
+
+    # --- TOP N ---
+    m = re.match(r"^(?:lay |xem |hien thi )?top (\d+)\b(.*)$", body)
+    if not m and re.search(r"\b(?:dau tien|(?:cao|nhieu|thap|it) nhat)\b", body):
+        m = re.match(r"^(?:lay |xem |hien thi )?(\d+)\b(.*)$", body)
+    if m:
+        n = int(m.group(1))
+        rest = m.group(2)
+        lowest = re.search(r"\b(?:thap|it) nhat\b", rest) is not None
+        highest = re.search(r"\b(?:cao|nhieu) nhat\b", rest) is not None
+        rest = re.sub(r"\b(?:dau tien|(?:cao|nhieu|thap|it) nhat)\b", " ", rest).strip()
+        if _strip_fillers(rest):
+            col = resolve_column(rest, columns)
+            if not col:
+                return None
+            ops.append({"op": "sort", "column": col, "ascending": lowest or (ascending and not descending)})
+        elif descending or ascending or lowest or highest:
+            return None  # "top 5 giảm dần" nhưng không rõ cột -> để pipeline chính xử lý
+        ops.append({"op": "limit", "n": n})
+        return ops
+
+    # --- SẮP XẾP ---
+    m = re.match(r"^(?:sap xep|xep)(?: lai)?(?: theo)?\s*(.*)$", body)
+    if m or ((descending or ascending) and body.startswith("theo ")):
+        phrase = (m.group(1) if m else body[len("theo "):]).strip()
+        col = resolve_column(phrase, columns)
+        if not col:
+            return None
+        return [{"op": "sort", "column": col, "ascending": not descending}]
+
+    # --- ĐẾM / NHÓM ---
+    m = re.match(r"^(?:dem|thong ke|nhom|gom nhom|tong hop)(?: so luong)?(?: lai)? theo (.+)$", body)
+    if m:
+        col = resolve_column(m.group(1), columns)
+        if not col:
+            return None
+        return [{"op": "group_count", "column": col}]
+
+    # --- LỌC ---
+    m = re.match(r"^(?:loc|chi lay|chi hien thi|chi hien|chi xem|chi giu)(?: lai)?(?: nhung| cac)?(?: theo)? (.+)$", body)
+    if m:
+        target = m.group(1).strip()
+
+        # Lọc số: "lương trên 10 triệu", "tiến độ dưới 50%"
+        num = re.match(r"^(.+?) (tren|lon hon|>=|>|duoi|nho hon|<=|<|bang|=) (\d+(?:[.,]\d+)?)\s*(trieu|nghin|ngan|k|%)?$", target)
+        if num:
+            col = resolve_column(num.group(1), columns)
+            if not col:
+                return None
+            return [{"op": "filter_number", "column": col, "cmp": COMPARE_WORDS[num.group(2)],
+                     "value": _parse_number(num.group(3), num.group(4))}]
+
+        # Lọc chuỗi: thử cả cụm đầy đủ lẫn cụm đã bỏ từ chỉ cột ("phong ky thuat" -> "ky thuat")
+        candidates = [target]
+        for key in sorted(COLUMN_SYNONYMS, key=len, reverse=True):
+            if target.startswith(key + " "):
+                candidates.append(target[len(key) + 1:])
+                break
+        for value in candidates:
+            col = _find_value_column(value, columns, rows)
+            if col:
+                return [{"op": "filter", "column": col, "value": value}]
+        return None
+
+    # Mệnh đề chỉ gồm từ đệm ("cho tôi", "nhé") -> bỏ qua
+    if not _strip_fillers(body):
+        return []
+    return None
+
+
+def _find_value_column(value: str, columns: List[str], rows: List[Dict]) -> Union[str, None]:
+    """Tìm cột dạng chuỗi có chứa giá trị cần lọc (so khớp không dấu)"""
+    for col in columns:
+        for row in rows:
+            cell = row.get(col)
+            if isinstance(cell, str) and value in fold_text(cell):
+                return col
+    return None
+
+
+def parse_followup(question: str, columns: List[str], rows: List[Dict]) -> Union[List[Dict], None]:
+    """
+    Nhận diện câu hỏi nối tiếp chỉ định dạng lại kết quả trước.
+    Trả về danh sách thao tác, hoặc None nếu cần chạy pipeline đầy đủ
+    (câu hỏi mới, hoặc cần cột không có trong kết quả cache).
+    """
+    if not columns:
+        return None
+    folded = fold_text(question)
+    folded = re.sub(r"[?!]", " ", folded).strip()
+    if not any(hint in folded + " " for hint in FOLLOWUP_HINTS):
+        if not any(hint in folded + " " for hint in RANKING_HINTS):
+            return None
+        if not REFERENCE_MARKERS.search(folded) and NEW_SUBJECT_WORDS.search(folded):
+            return None
+    folded = REFERENCE_MARKERS.sub(" ", folded)
+
+    ops = []
+    for clause in CLAUSE_SPLIT.split(folded):
+        clause = clause.strip()
+        if not clause:
+            continue
+        clause_ops = _parse_clause(clause, columns, rows)
+        if clause_ops is None:
+            return None
+        ops.extend(clause_ops)
+
+    # Top N không kèm cột -> áp dụng sau các thao tác khác
+    ops.sort(key=lambda op: op["op"] == "limit")
+    return ops or None
+
+
+def apply_ops(rows: List[Dict], ops: List[Dict]) -> List[Dict]:
+    """Thực thi các thao tác trên kết quả cache bằng pandas"""
+    import pandas as pd  # import muộn: pandas nặng, chỉ cần khi có câu hỏi nối tiếp
+
+    df = pd.DataFrame(rows)
+    grouped = False
+
+    for op in ops:
+        kind = op["op"]
+        if kind == "filter":
+            folded = df[op["column"]].astype(str).map(fold_text)
+            df = df[folded.str.contains(op["value"], regex=False)]
+        elif kind == "filter_number":
+            values = pd.to_numeric(df[op["column"]], errors="coerce")
+            df = df[COMPARE_OPS[op["cmp"]](values, op["value"]).fillna(False)]
+        elif kind == "sort":
+            col = op["column"]
+            numeric = pd.to_numeric(df[col], errors="coerce")
+            if numeric.notna().sum() >= max(1, len(df) // 2):
+                key = lambda s: pd.to_numeric(s, errors="coerce")
+            else:
+                key = lambda s: s.astype(str).map(fold_text)
+            df = df.sort_values(col, ascending=op["ascending"], kind="mergesort",
+                                na_position="last", key=key)
+        elif kind == "group_count":
+            df = (df.groupby(op["column"], dropna=False).size()
+                    .reset_index(name="so_luong")
+                    .sort_values("so_luong", ascending=False, kind="mergesort"))
+            grouped = True
+        elif kind == "limit":
+            df = df.head(op["n"])
+
+    if not grouped:
+        # Chỉ lọc / sắp xếp / cắt dòng -> index vẫn là vị trí trong rows: trả bản ghi gốc
+        # (cột int có NULL không bị pandas đổi thành float 3.0)
+        return [rows[i] for i in df.index]
+    records = df.astype(object).where(df.notna(), None).to_dict("records")
+    return [{k: _plain(v) for k, v in r.items()} for r in records]
+
+
+def _plain(value):
+    """numpy scalar -> kiểu Python thuần; float nguyên (int bị pandas đổi vì có NULL) -> int"""
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def describe_ops(ops: List[Dict]) -> str:
+    """Mô tả ngắn gọn các thao tác đã áp dụng (dùng trong câu trả lời)"""
+    parts = []
+    for op in ops:
+        kind = op["op"]
+        if kind == "filter":
+            parts.append(f"lọc {op['column']} chứa \"{op['value']}\"")
+        elif kind == "filter_number":
+            parts.append(f"lọc {op['column']} {op['cmp']} {op['value']:g}")
+        elif kind == "sort":
+            parts.append(f"sắp xếp theo {op['column']} {'tăng dần' if op['ascending'] else 'giảm dần'}")
+        elif kind == "group_count":
+            parts.append(f"đếm theo {op['column']}")
+        elif kind == "limit":
+            parts.append(f"lấy {op['n']} dòng đầu")
+    return ", ".join(parts)
+
+
+def render_rows(rows: List[Dict], limit: int = 20) -> str:
+    """Hiển thị kết quả dạng danh sách gạch đầu dòng (không Markdown in đậm)"""
+    lines = []
+    for row in rows[:limit]:
+        lines.append("- " + ", ".join(f"{k}: {'' if v is None else v}" for k, v in row.items()))
+    if len(rows) > limit:
+        lines.append(f"- ... và {len(rows) - limit} dòng khác")
+    return "\n".join(lines)
+
+
+def answer_followup(ops: List[Dict], rows: List[Dict]) -> str:
+    """Câu trả lời cho kết quả sau xử lý hậu kỳ"""
+    if not rows:
+        return f"Sau khi {describe_ops(ops)} trên kết quả trước, không còn bản ghi nào phù hợp."
+    return (f"Dạ, em đã {describe_ops(ops)} trên kết quả trước ({len(rows)} bản ghi):\n"
+            f"{render_rows(rows)}")
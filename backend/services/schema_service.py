@@ -0,0 +1,205 @@
+"""
+Schema HRM tự động: đọc information_schema qua API execute-sql thay cho các bản chép tay.
+
+- Kết quả lưu đĩa (SCHEMA_CACHE_PATH) kèm hash nội dung -> khởi động lại không phải hỏi HRM
+- Phần SCHEMA trong prompt được sinh lại từ schema thật (chỉ các bảng chatbot dùng)
+- schema_version() = hash nội dung, được ghép vào key của mọi cache (SQL, kết quả, prompt)
+  -> đổi DDL là cache cũ tự mất hiệu lực, không cần xóa tay
+- Chưa hỏi được HRM thì dùng core/schema_hrm.py làm bản dự phòng
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Tuple, Union
+
+from core.schema_hrm import HRM_SCHEMA
+from utils import metrics
+
+SCHEMA_CACHE_PATH = os.environ.get("SCHEMA_CACHE_PATH", "./cache/schema.json")
+SCHEMA_REFRESH_SECONDS = int(os.environ.get("SCHEMA_REFRESH_SECONDS", "3600"))
+
+INTROSPECT_SQL = (
+    "SELECT TABLE_NAME AS table_name, COLUMN_NAME AS column_name, DATA_TYPE AS data_type "
+    "FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() "
+    "ORDER BY TABLE_NAME, ORDINAL_POSITION"
+)
+
+# Các bảng đưa vào prompt sinh SQL (theo nhóm nghiệp vụ)
+SCHEMA_SECTIONS = [
+    ("CHẤM CÔNG", ["cham_cong"]),
+    ("NHÂN SỰ", ["nhanvien", "phong_ban"]),
+    ("LƯƠNG & KPI", ["luong", "luu_kpi", "ngay_phep_nam"]),
+    ("NGHỈ PHÉP", ["don_nghi_phep"]),
+    ("DỰ ÁN & CÔNG VIỆC", ["du_an", "cong_viec", "cong_viec_nguoi_nhan", "cong_viec_tien_do", "cong_viec_quy_trinh"]),
+    ("TÀI LIỆU & HỆ THỐNG", ["tai_lieu", "thong_bao"]),
+]
+
+# Ghi chú nghiệp vụ cho cột (không suy ra được từ information_schema)
+COLUMN_NOTES = {
+    ("du_an", "lead_id"): "PM",
+    ("du_an", "phong_ban"): "varchar, tên phòng dạng text",
+}
+HIDDEN_COLUMNS = {("nhanvien", "mat_khau")}
+TYPED_COLUMNS = {"date", "datetime", "time", "timestamp", "float", "double", "decimal", "boolean", "tinyint"}
+
+Tables = Dict[str, List[Tuple[str, str]]]   # bảng -> [(cột, kiểu)]
+
+
+def parse_schema_text(text: str) -> Tables:
+    """Đọc schema dạng 'BẢNG x:' + '- cột (kiểu)' (core/schema_hrm.py)"""
+    tables: Tables = {}
+    current = None
+    for line in text.splitlines():
+        line = line.strip()
+        header = re.match(r"^(?:BẢNG|VIEW)\s+(\w+)", line)
+        if header:
+            current = tables.setdefault(header.group(1), [])
+            continue
+        column = re.match(r"^-\s*(\w+)(?:\s*\((\w+)\))?", line)
+        if column and current is not None:
+            current.append((column.group(1), (column.group(2) or "").lower()))
+    return tables
+
+
+def schema_hash(tables: Tables) -> str:
+    canonical = json.dumps({t: sorted(cols) for t, cols in sorted(tables.items())}, ensure_ascii=False)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:12]
+
+
+def render_schema_prompt(tables: Tables) -> str:
+    """Sinh đoạn 'SCHEMA CHI TIẾT' cho prompt từ schema thật"""
+    lines = []
+    for title, names in SCHEMA_SECTIONS:
+        present = [n for n in names if n in tables]
+        if not present:
+            continue
+        lines.append(f"-- {title} --")
+        for name in present:
+            columns = []
+            for column, dtype in tables[name]:
+                if (name, column) in HIDDEN_COLUMNS:
+                    continue
+                note = COLUMN_NOTES.get((name, column)) or (dtype if dtype in TYPED_COLUMNS else "")
+                columns.append(f"{column} ({note})" if note else column)
+            lines.append(f"BẢNG {name}: {', '.join(columns)}.")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def find_unknown_columns(rules: str, tables: Tables) -> List[str]:
+    """Tên cột `bang.cot` trong luật nghiệp vụ mà schema thật không có (VD: du_an.trang_thai_du_an)"""
+    unknown = []
+    for line in rules.splitlines():
+        if any(w in line.lower() for w in ("không dùng", "cấm")):
+            continue  # Ví dụ sai được nêu ra để cấm
+        for table, column in re.findall(r"\b([a-z_]+)\.([a-z_]+)\b", line):
+            if table in tables and column not in {c for c, _ in tables[table]}:
+                unknown.append(f"{table}.{column}")
+    return sorted(set(unknown))
+
+
+class SchemaService:
+    def __init__(self, path: str = SCHEMA_CACHE_PATH):
+        self.path = path
+        self.source = "fallback"
+        self.fetched_at = None
+        self._prompts: Dict[Tuple[str, int], str] = {}
+        self._lock = threading.Lock()
+        self._set_tables(parse_schema_text(HRM_SCHEMA))
+        self.load_from_disk()
+
+    def _set_tables(self, tables: Tables) -> None:
+        self.tables = tables
+        self.version = schema_hash(tables)
+
+    def load_from_disk(self) -> bool:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return False
+        tables = {t: [tuple(c) for c in cols] for t, cols in snapshot.get("tables", {}).items()}
+        if not tables or schema_hash(tables) != snapshot.get("version"):
+            return False  # File hỏng / sửa tay -> bỏ qua
+        with self._lock:
+            self._set_tables(tables)
+            self.source = "disk"
+            self.fetched_at = snapshot.get("fetched_at")
+        return True
+
+    def _save_to_disk(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "fetched_at": self.fetched_at, "tables": self.tables},
+                      f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def introspect(self, execute: Callable[[str], object]) -> bool:
+        """Đọc information_schema qua HRM; True nếu lấy được (và lưu lại nếu schema đổi)"""
+        rows = execute(INTROSPECT_SQL)
+        if isinstance(rows, dict):
+            rows = [rows]
+        if not isinstance(rows, list) or not rows:
+            print(f"⚠️ Không đọc được information_schema: {rows}")
+            return False
+
+        tables: Tables = {}
+        for row in rows:
+            row = {k.lower(): v for k, v in row.items()}
+            tables.setdefault(row["table_name"], []).append((row["column_name"], str(row["data_type"]).lower()))
+
+        with self._lock:
+            changed = schema_hash(tables) != self.version
+            self._set_tables(tables)
+            self.source = "hrm"
+            self.fetched_at = time.time()
+            self._save_to_disk()
+        if changed:
+            metrics.incr("schema.changes")
+        return True
+
+    def prompt(self, rules: str) -> str:
+        """Luật nghiệp vụ + schema sinh tự động (cache theo version)"""
+        key = (self.version, id(rules))
+        cached = self._prompts.get(key)
+        if cached is None:
+            for name in find_unknown_columns(rules, self.tables):
+                print(f"⚠️ Luật nghiệp vụ nhắc tới cột không có trong schema: {name}")
+            cached = f"{rules}\nSCHEMA CHI TIẾT:\n{render_schema_prompt(self.tables)}"
+            self._prompts = {key: cached}
+        return cached
+
+    def stats(self) -> Dict[str, Union[str, float, int, None]]:
+        return {"version": self.version, "source": self.source,
+                "fetched_at": self.fetched_at, "tables": len(self.tables),
+                "changes": metrics.get("schema.changes")}
+
+
+schema_service = SchemaService()
+_refresher_started = False
+
+
+def schema_version() -> str:
+    return schema_service.version
+
+
+def start_schema_refresher(execute: Callable[[str], object]) -> None:
+    """Luồng nền đọc lại information_schema định kỳ (gọi 1 lần khi khởi động)"""
+    global _refresher_started
+    if _refresher_started:
+        return
+    _refresher_started = True
+
+    def _loop():
+        while True:
+            try:
+                schema_service.introspect(execute)
+            except Exception as e:
+                print(f"⚠️ Schema refresh lỗi: {e}")
+            time.sleep(SCHEMA_REFRESH_SECONDS)
+
+    threading.Thread(target=_loop, name="schema-refresh", daemon=True).start()
@@ -0,0 +1,33 @@
+"""
+Lưu kết quả truy vấn gần nhất theo phiên chat (phục vụ câu hỏi nối tiếp).
+Lưu trong cache dùng chung để mọi worker đều đọc được.
+"""
+from typing import Dict, List, Union
+
+from services.shared_cache import get_shared_cache
+
+SESSION_NS = "session_last_result"
+SESSION_TTL = 2 * 60 * 60     # Phiên không hoạt động 2 giờ thì bỏ
+MAX_CACHED_ROWS = 5000        # Kết quả lớn hơn thì không cache (tránh tốn RAM/đĩa)
+
+
+def save_last_result(session_id: str, question: str, sql: str, data: List[Dict]) -> None:
+    """Ghi nhớ kết quả gần nhất của phiên (chỉ nhận danh sách bản ghi dạng dict)"""
+    if not session_id or not isinstance(data, list) or not data:
+        return
+    if len(data) > MAX_CACHED_ROWS or not all(isinstance(row, dict) for row in data):
+        return
+
+    get_shared_cache().set(SESSION_NS, session_id, {
+        "question": question,
+        "sql": sql,
+        "columns": list(data[0].keys()),
+        "data": data,
+    }, ttl=SESSION_TTL)
+
+
+def get_last_result(session_id: str) -> Union[Dict, None]:
+    """Lấy kết quả gần nhất của phiên (None nếu chưa có)"""
+    if not session_id:
+        return None
+    return get_shared_cache().get(SESSION_NS, session_id)
@@ -0,0 +1,136 @@
+"""
+Cache dùng chung giữa các worker (SQLite, chế độ WAL).
+
+Chạy nhiều worker uvicorn/gunicorn thì bộ nhớ mỗi tiến trình là riêng, nên các cache
+(câu hỏi -> SQL, SQL -> kết quả, kết quả gần nhất theo phiên, chỉ mục báo cáo) được
+lưu vào 1 file SQLite chung trên đĩa. SQLite WAL cho phép nhiều tiến trình đọc song song
+và ghi an toàn mà không cần dựng Redis.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Union
+
+SHARED_CACHE_PATH = os.environ.get("SHARED_CACHE_PATH", "./cache/shared_cache.db")
+MAX_ENTRIES_PER_NAMESPACE = int(os.environ.get("SHARED_CACHE_MAX_ENTRIES", "20000"))
+# Giới hạn riêng cho từng namespace (module đăng ký lúc import), còn lại dùng max_entries
+NAMESPACE_MAX_ENTRIES: Dict[str, int] = {}
+
+_MISSING = object()
+
+
+def make_key(*parts: Any) -> str:
+    """Ghép các thành phần thành khóa ngắn cố định (sha1)"""
+    raw = "\x1f".join(str(p) for p in parts)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class SharedCache:
+    """Key-value có namespace + TTL, an toàn khi nhiều tiến trình/luồng dùng chung"""
+
+    def __init__(self, path: str = SHARED_CACHE_PATH, max_entries: int = MAX_ENTRIES_PER_NAMESPACE):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    ns TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires_at REAL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (ns, key)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_updated ON cache (ns, updated_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # Mỗi luồng 1 kết nối riêng (sqlite3 không chia sẻ kết nối giữa các luồng)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, ns: str, key: str, default: Any = None) -> Any:
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM cache WHERE ns = ? AND key = ?", (ns, key)
+        ).fetchone()
+        if row is None:
+            return default
+        value, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            self.delete(ns, key)
+            return default
+        return json.loads(value)
+
+    def set(self, ns: str, key: str, value: Any, ttl: Union[float, None] = None) -> None:
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        payload = json.dumps(value, ensure_ascii=False, default=str)
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (ns, key, value, expires_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (ns, key, payload, expires_at, now),
+        )
+        # Giới hạn kích thước: thỉnh thoảng dọn bản ghi cũ nhất của namespace
+        if hash(key) % 100 == 0:
+            self.prune(ns)
+
+    def add(self, ns: str, key: str, value: Any, ttl: Union[float, None] = None) -> bool:
+        """Ghi nếu key chưa tồn tại (nguyên tử giữa các tiến trình) -> True nếu ghi được"""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("DELETE FROM cache WHERE ns = ? AND key = ? AND expires_at IS NOT NULL AND expires_at < ?",
+                     (ns, key, now))
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO cache (ns, key, value, expires_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (ns, key, json.dumps(value, ensure_ascii=False, default=str), now + ttl if ttl else None, now),
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, ns: str, key: str) -> None:
+        self._conn().execute("DELETE FROM cache WHERE ns = ? AND key = ?", (ns, key))
+
+    def prune(self, ns: str) -> None:
+        """Xóa bản ghi hết hạn và bản ghi cũ vượt quá giới hạn của namespace"""
+        conn = self._conn()
+        conn.execute("DELETE FROM cache WHERE ns = ? AND expires_at IS NOT NULL AND expires_at < ?",
+                     (ns, time.time()))
+        conn.execute("""
+            DELETE FROM cache WHERE ns = ? AND key IN (
+                SELECT key FROM cache WHERE ns = ? ORDER BY updated_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (ns, ns, NAMESPACE_MAX_ENTRIES.get(ns, self.max_entries)))
+
+    def items(self, ns: str):
+        """Duyệt toàn bộ (key, value) còn hạn của 1 namespace"""
+        rows = self._conn().execute(
+            "SELECT key, value FROM cache WHERE ns = ? AND (expires_at IS NULL OR expires_at >= ?)",
+            (ns, time.time()),
+        ).fetchall()
+        for key, value in rows:
+            yield key, json.loads(value)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_shared_cache() -> SharedCache:
+    """Cache dùng chung của tiến trình (khởi tạo lần đầu khi cần)"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SharedCache()
+    return _cache
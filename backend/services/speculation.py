@@ -0,0 +1,182 @@
+"""
+Chạy trước (speculative) SQL của câu hỏi cũ gần giống trong lúc LLM còn đang sinh SQL.
+
+- Câu hỏi mới không trùng hẳn (cache SQL miss) nhưng giống 1 câu đã trả lời >= ngưỡng
+  -> chạy ngay SQL cũ trên HRM (qua cache kết quả), song song với LLM.
+- LLM sinh xong: nếu SQL chuẩn hóa trùng SQL đã chạy trước -> dùng luôn dữ liệu (hit),
+  ngược lại bỏ kết quả đoán trước (waste).
+- Giới hạn số truy vấn lãng phí mỗi phút để không dội tải vô ích lên HRM.
+"""
+import asyncio
+import difflib
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Awaitable, Callable, Dict, Tuple, Union
+
+from services.schema_service import schema_version
+from services.shared_cache import get_shared_cache, make_key
+from utils import metrics
+from utils.sql_normalize import normalize_sql
+from utils.text import normalize_question
+
+HISTORY_NS = "question_history"
+HISTORY_TTL = 30 * 24 * 60 * 60
+HISTORY_REFRESH_SECONDS = 60
+
+SPECULATION_ENABLED = os.environ.get("SPECULATION_ENABLED", "1") == "1"
+SPECULATION_THRESHOLD = float(os.environ.get("SPECULATION_THRESHOLD", "0.8"))
+SPECULATION_MAX_WASTE_PER_MIN = int(os.environ.get("SPECULATION_MAX_WASTE_PER_MIN", "20"))
+SPECULATION_MAX_INFLIGHT = int(os.environ.get("SPECULATION_MAX_INFLIGHT", "4"))
+
+# Từ quá phổ biến, không dùng để lọc ứng viên
+STOP_TOKENS = {"cua", "la", "co", "nao", "nhung", "cac", "bao", "nhieu", "ai", "gi", "khong", "hien", "tai"}
+
+
+class QuestionHistory:
+    """Lịch sử câu hỏi -> SQL đã validate, tìm câu gần giống bằng chỉ mục token + difflib"""
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[str, str]] = {}   # key -> (câu hỏi chuẩn hóa, sql)
+        self._index = defaultdict(set)                   # token -> {key}
+        self._loaded_at = 0.0
+        self._version = schema_version()
+        self._lock = threading.Lock()
+
+    def _add_local(self, key: str, normalized: str, sql: str) -> None:
+        self._entries[key] = (normalized, sql)
+        for token in set(normalized.split()) - STOP_TOKENS:
+            self._index[token].add(key)
+
+    def add(self, question: str, sql: str) -> None:
+        normalized = normalize_question(question)
+        if not normalized or not sql:
+            return
+        key = make_key(schema_version(), normalized)
+        get_shared_cache().set(HISTORY_NS, key, {"q": normalized, "sql": sql, "v": schema_version()}, ttl=HISTORY_TTL)
+        with self._lock:
+            self._add_local(key, normalized, sql)
+
+    def _refresh(self) -> None:
+        # Schema đổi -> SQL cũ có thể sai tên cột, bỏ hết lịch sử trong RAM
+        if self._version != schema_version():
+            with self._lock:
+                self._entries.clear()
+                self._index.clear()
+                self._version = schema_version()
+                self._loaded_at = 0.0
+        # Đồng bộ lịch sử do các worker khác ghi vào cache dùng chung
+        if time.time() - self._loaded_at < HISTORY_REFRESH_SECONDS:
+            return
+        with self._lock:
+            self._loaded_at = time.time()
+            for key, value in get_shared_cache().items(HISTORY_NS):
+                if key not in self._entries and value.get("v") == schema_version():
+                    self._add_local(key, value["q"], value["sql"])
+
+    def best_match(self, question: str) -> Union[Tuple[float, str, str], None]:
+        """Câu gần giống nhất: (điểm 0..1, câu hỏi cũ, sql) hoặc None"""
+        self._refresh()
+        normalized = normalize_question(question)
+        tokens = set(normalized.split()) - STOP_TOKENS
+        with self._lock:
+            counts = defaultdict(int)
+            for token in tokens:
+                for key in self._index.get(token, ()):
+                    counts[key] += 1
+            # Chỉ chấm điểm chi tiết cho vài ứng viên chung nhiều token nhất
+            candidates = sorted(counts, key=counts.get, reverse=True)[:10]
+            best = None
+            for key in candidates:
+                old_question, sql = self._entries[key]
+                score = difflib.SequenceMatcher(None, normalized, old_question).ratio()
+                if best is None or score > best[0]:
+                    best = (score, old_question, sql)
+        return best
+
+
+class Speculation:
+    def __init__(self, sql: str, task: "asyncio.Task", score: float):
+        self.sql = sql
+        self.task = task
+        self.score = score
+        self.started = time.perf_counter()
+        self.finished = None
+
+
+class Speculator:
+    def __init__(self, history: QuestionHistory):
+        self.history = history
+        self._waste_times = deque()
+        self._inflight = 0
+
+    def _waste_budget_left(self) -> bool:
+        now = time.monotonic()
+        while self._waste_times and now - self._waste_times[0] > 60:
+            self._waste_times.popleft()
+        return len(self._waste_times) < SPECULATION_MAX_WASTE_PER_MIN
+
+    async def start(self, question: str, execute: Callable[[str], Awaitable[Any]]) -> Union[Speculation, None]:
+        """Nếu có câu cũ đủ giống -> chạy SQL của nó ngay (không chờ LLM)"""
+        if not SPECULATION_ENABLED:
+            return None
+        # Thỉnh thoảng đồng bộ lịch sử từ cache dùng chung (SQLite) -> không chạy trên event loop
+        match = await asyncio.to_thread(self.history.best_match, question)
+        if match is None or match[0] < SPECULATION_THRESHOLD:
+            return None
+        if not self._waste_budget_left() or self._inflight >= SPECULATION_MAX_INFLIGHT:
+            metrics.incr("speculation.skipped_budget")
+            return None
+
+        score, _, sql = match
+        self._inflight += 1
+        task = asyncio.ensure_future(execute(sql))
+        spec = Speculation(sql, task, score)
+
+        def _done(t):
+            self._inflight -= 1
+            spec.finished = time.perf_counter()
+            if not t.cancelled():
+                t.exception()  # tránh cảnh báo "exception was never retrieved"
+
+        task.add_done_callback(_done)
+        metrics.incr("speculation.started")
+        return spec
+
+    async def resolve(self, spec: Union[Speculation, None], sql: str) -> Tuple[bool, Any]:
+        """LLM đã sinh xong SQL: trả (True, dữ liệu) nếu đoán trúng, (False, None) nếu không"""
+        if spec is None:
+            return False, None
+
+        if sql and normalize_sql(sql) == normalize_sql(spec.sql):
+            try:
+                data = await spec.task
+            except Exception:
+                metrics.incr("speculation.error")
+                return False, None
+            metrics.incr("speculation.hit")
+            # Thời gian HRM đã chạy trùng với lúc chờ LLM = thời gian tiết kiệm được
+            overlap_end = spec.finished if spec.finished else time.perf_counter()
+            metrics.incr("speculation.saved_seconds", max(0.0, overlap_end - spec.started))
+            return True, data
+
+        spec.task.cancel()
+        self._waste_times.append(time.monotonic())
+        metrics.incr("speculation.waste")
+        return False, None
+
+
+question_history = QuestionHistory()
+speculator = Speculator(question_history)
+
+
+def speculation_stats() -> Dict[str, Any]:
+    return {
+        "started": metrics.get("speculation.started"),
+        "hit": metrics.get("speculation.hit"),
+        "waste": metrics.get("speculation.waste"),
+        "skipped_budget": metrics.get("speculation.skipped_budget"),
+        "hit_rate": metrics.ratio("speculation.hit", "speculation.waste"),
+        "saved_seconds": metrics.get("speculation.saved_seconds"),
+    }
@@ -0,0 +1,241 @@
+"""
+Template SQL tự học: các cặp câu hỏi -> SQL đã chạy thành công, chỉ khác tham số
+(tên nhân viên / dự án / phòng ban, số, ngày), được gom thành 1 "họ câu hỏi".
+
+- Câu hỏi -> mẫu: "luong cua __nhanvien__ la bao nhieu" (tên, số, ngày được bộ tách cục bộ thay bằng slot)
+- SQL -> các phần cố định + slot (literal nào lấy từ câu hỏi: id / tên thực thể, số, ngày)
+- Câu hỏi mới cùng mẫu -> điền slot ra SQL, không cần gọi LLM
+- Độ chính xác đo bằng "shadow": vẫn gọi LLM và so SQL điền sẵn với SQL của LLM;
+  chỉ dùng template thật khi đủ mẫu shadow và tỉ lệ khớp đủ cao, sau đó vẫn lấy mẫu định kỳ
+"""
+import os
+import random
+import re
+from datetime import date
+from typing import Any, Dict, List, Tuple, Union
+
+from services.entity_index import entity_index
+from services.schema_service import schema_version
+from services.shared_cache import get_shared_cache, make_key
+from utils import metrics
+from utils.sql_normalize import SQL_LITERAL, normalize_sql, sql_fingerprint
+from utils.text import fold_text, normalize_question
+
+TEMPLATE_NS = "sql_templates"
+TEMPLATE_TTL = 30 * 24 * 60 * 60
+
+TEMPLATES_ENABLED = os.environ.get("SQL_TEMPLATES_ENABLED", "1") == "1"
+TEMPLATE_MIN_SUPPORT = int(os.environ.get("TEMPLATE_MIN_SUPPORT", "3"))      # số lần học được
+TEMPLATE_MIN_VARIANTS = 2                                                    # số bộ tham số khác nhau
+TEMPLATE_MIN_SHADOW = int(os.environ.get("TEMPLATE_MIN_SHADOW", "5"))
+TEMPLATE_MIN_ACCURACY = float(os.environ.get("TEMPLATE_MIN_ACCURACY", "0.95"))
+TEMPLATE_SHADOW_RATE = float(os.environ.get("TEMPLATE_SHADOW_RATE", "0.05"))  # sau khi tin cậy
+MAX_VARIANT_HASHES = 20
+
+DATE_PATTERN = re.compile(r"\b(\d{1,2})[/-](\d{1,2})(?:[/-](\d{4}))?\b")
+NUMBER_PATTERN = re.compile(r"(?<![\w.,])(\d{1,3}(?:\.\d{3})+|\d+(?:,\d+)?)(?![\w.,]\d)")
+
+
+def _parse_number(text: str) -> Union[int, float]:
+    if re.fullmatch(r"\d{1,3}(?:\.\d{3})+", text):
+        return int(text.replace(".", ""))          # 10.000.000
+    if "," in text:
+        return float(text.replace(",", "."))       # 80,5
+    return int(text)
+
+
+def extract_slots(question: str, year: Union[int, None] = None) -> Tuple[str, Dict[str, List[Any]]]:
+    """
+    Bộ tách tham số cục bộ: (mẫu câu hỏi, {loại slot: [giá trị theo thứ tự xuất hiện]})
+    Loại slot: ngay (YYYY-MM-DD), so, nhanvien / phong_ban / du_an (id, tên)
+    """
+    year = year or date.today().year
+    values: Dict[str, List[Any]] = {"ngay": [], "so": []}
+
+    def _date(match):
+        day, month, y = int(match.group(1)), int(match.group(2)), int(match.group(3) or year)
+        try:
+            values["ngay"].append(date(y, month, day).isoformat())
+        except ValueError:
+            return match.group(0)
+        return " __ngay__ "
+
+    def _number(match):
+        values["so"].append(_parse_number(match.group(1)))
+        return " __so__ "
+
+    text = DATE_PATTERN.sub(_date, fold_text(question))
+    text = NUMBER_PATTERN.sub(_number, text)
+    text = f" {normalize_question(text)} "
+
+    found = []
+    for match in entity_index.resolve(question):
+        position = text.find(f" {match['span']} ")
+        if position >= 0:
+            found.append((position, match))
+    for position, match in sorted(found, key=lambda item: -item[0]):  # thay từ cuối lên để giữ vị trí
+        text = text[:position] + f" __{match['type']}__ " + text[position + len(match["span"]) + 2:]
+    for _, match in sorted(found, key=lambda item: item[0]):
+        values.setdefault(match["type"], []).append((match["id"], match["name"]))
+    return re.sub(r"\s+", " ", text).strip(), values
+
+
+def _bind_literal(literal: str, values: Dict[str, List[Any]]) -> Union[Dict[str, Any], None]:
+    """Literal trong SQL lấy từ tham số nào của câu hỏi (None = hằng số của template)"""
+    if literal.startswith("'"):
+        content = literal[1:-1].replace("''", "'")
+        core = content.strip("%")
+        prefix, suffix = content[:len(content) - len(content.lstrip("%"))], content[len(content.rstrip("%")):]
+        if core in values["ngay"]:
+            return {"slot": "ngay", "index": values["ngay"].index(core)}
+        for etype in ("nhanvien", "phong_ban", "du_an"):
+            for index, (_, name) in enumerate(values.get(etype, [])):
+                folded = fold_text(core)
+                if len(folded) >= 3 and (folded == fold_text(name) or folded in fold_text(name)):
+                    return {"slot": etype, "index": index, "field": "name", "prefix": prefix, "suffix": suffix}
+        return None
+
+    number = float(literal) if "." in literal else int(literal)
+    for etype in ("nhanvien", "phong_ban", "du_an"):
+        for index, (entity_id, _) in enumerate(values.get(etype, [])):
+            if str(entity_id) == str(number):
+                return {"slot": etype, "index": index, "field": "id"}
+    if number in values["so"]:
+        return {"slot": "so", "index": values["so"].index(number)}
+    return None
+
+
+def _render(parts: List[Any], values: Dict[str, List[Any]]) -> Union[str, None]:
+    out = []
+    for part in parts:
+        if isinstance(part, str):
+            out.append(part)
+            continue
+        items = values.get(part["slot"], [])
+        if part["index"] >= len(items):
+            return None
+        value = items[part["index"]]
+        if part["slot"] == "ngay":
+            out.append(f"'{value}'")
+        elif part["slot"] == "so":
+            out.append(str(value))
+        elif part["field"] == "id":
+            out.append(str(value[0]))
+        else:
+            name = str(value[1]).replace("'", "''")
+            out.append(f"'{part['prefix']}{name}{part['suffix']}'")
+    return "".join(out)
+
+
+class TemplateMatch:
+    def __init__(self, key: str, fingerprint: str, sql: str, trusted: bool):
+        self.key = key
+        self.fingerprint = fingerprint
+        self.sql = sql
+        self.trusted = trusted
+
+
+class TemplateStore:
+    def _key(self, pattern: str) -> str:
+        return make_key(schema_version(), pattern)
+
+    def learn(self, question: str, sql: str) -> bool:
+        """Ghi nhận 1 cặp câu hỏi -> SQL (SQL gốc, chưa thay CURDATE()) đã chạy thành công"""
+        if not TEMPLATES_ENABLED or not sql or "NO_DATA" in sql:
+            return False
+        pattern, values = extract_slots(question)
+        if "__" not in pattern:
+            return False  # Không có tham số -> cache câu hỏi -> SQL đã đủ
+
+        parts, last, bound = [], 0, []
+        for match in SQL_LITERAL.finditer(sql):
+            binding = _bind_literal(match.group(0), values)
+            if binding is None:
+                continue
+            parts.append(sql[last:match.start()])
+            parts.append(binding)
+            bound.append(str(_render([binding], values)))
+            last = match.end()
+        parts.append(sql[last:])
+        if not bound:
+            return False  # SQL không dùng tham số nào của câu hỏi -> không phải template
+
+        fingerprint = sql_fingerprint(sql)
+        cache, key = get_shared_cache(), self._key(pattern)
+        family = cache.get(TEMPLATE_NS, key) or {"pattern": pattern, "variants": {}}
+        entry = family["variants"].setdefault(fingerprint, {
+            "parts": parts, "support": 0, "values": [], "shadow_total": 0, "shadow_agree": 0,
+        })
+        entry["support"] += 1
+        value_key = make_key(*bound)
+        if value_key not in entry["values"]:
+            entry["values"] = (entry["values"] + [value_key])[-MAX_VARIANT_HASHES:]
+        cache.set(TEMPLATE_NS, key, family, ttl=TEMPLATE_TTL)
+        metrics.incr("template.learned")
+        return True
+
+    def match(self, question: str) -> Union[TemplateMatch, None]:
+        """Câu hỏi thuộc 1 họ đã học đủ -> SQL điền sẵn (kèm cờ đã đủ tin cậy để bỏ qua LLM chưa)"""
+        if not TEMPLATES_ENABLED:
+            return None
+        pattern, values = extract_slots(question)
+        if "__" not in pattern:
+            return None
+        key = self._key(pattern)
+        family = get_shared_cache().get(TEMPLATE_NS, key)
+        if not family:
+            return None
+
+        variants = family["variants"]
+        fingerprint = max(variants, key=lambda f: variants[f]["support"])
+        entry = variants[fingerprint]
+        total_support = sum(v["support"] for v in variants.values())
+        if (entry["support"] < TEMPLATE_MIN_SUPPORT or len(entry["values"]) < TEMPLATE_MIN_VARIANTS
+                or entry["support"] < 0.6 * total_support):
+            return None
+        sql = _render(entry["parts"], values)
+        if sql is None:
+            return None
+        trusted = (entry["shadow_total"] >= TEMPLATE_MIN_SHADOW
+                   and entry["shadow_agree"] / entry["shadow_total"] >= TEMPLATE_MIN_ACCURACY)
+        return TemplateMatch(key, fingerprint, sql, trusted)
+
+    def should_use(self, match: Union[TemplateMatch, None]) -> bool:
+        """Dùng SQL điền sẵn thay LLM? (template tin cậy, trừ lượt lấy mẫu shadow)"""
+        return bool(match and match.trusted and random.random() >= TEMPLATE_SHADOW_RATE)
+
+    def record_shadow(self, match: TemplateMatch, llm_sql: str) -> bool:
+        """So SQL điền sẵn với SQL LLM vừa sinh cho cùng câu hỏi"""
+        agree = normalize_sql(match.sql) == normalize_sql(llm_sql)
+        cache = get_shared_cache()
+        family = cache.get(TEMPLATE_NS, match.key)
+        if family and match.fingerprint in family["variants"]:
+            entry = family["variants"][match.fingerprint]
+            entry["shadow_total"] += 1
+            entry["shadow_agree"] += int(agree)
+            cache.set(TEMPLATE_NS, match.key, family, ttl=TEMPLATE_TTL)
+        metrics.incr("template.shadow")
+        metrics.incr("template.shadow_agree" if agree else "template.shadow_disagree")
+        return agree
+
+
+sql_templates = TemplateStore()
+
+
+def template_stats() -> Dict[str, Any]:
+    families = list(get_shared_cache().items(TEMPLATE_NS))
+    trusted = 0
+    for _, family in families:
+        for entry in family["variants"].values():
+            if (entry["shadow_total"] >= TEMPLATE_MIN_SHADOW
+                    and entry["shadow_agree"] / entry["shadow_total"] >= TEMPLATE_MIN_ACCURACY):
+                trusted += 1
+    return {
+        "families": len(families),
+        "trusted": trusted,
+        "learned": metrics.get("template.learned"),
+        "used": metrics.get("template.used"),
+        "shadow": metrics.get("template.shadow"),
+        "shadow_disagree": metrics.get("template.shadow_disagree"),
+        "shadow_accuracy": metrics.ratio("template.shadow_agree", "template.shadow_disagree"),
+    }
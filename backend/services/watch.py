@@ -0,0 +1,250 @@
+"""
+Câu hỏi "theo dõi" (watch): SQL được validate 1 lần rồi đóng băng, chạy lại định kỳ không cần LLM.
+
+- Kết quả không đổi (so hash) -> không gọi LLM, không phát sự kiện
+- So hash không phụ thuộc thứ tự dòng (SQL không ORDER BY)
+- Có thay đổi -> tính diff (thêm / bớt / đổi theo cột khóa), sinh lại câu trả lời, phát sự kiện;
+  kết quả quá MAX_WATCH_ROWS dòng chỉ giữ hash -> sự kiện ghi rõ diff không có (available = False)
+- Trạng thái + sự kiện lưu trong cache dùng chung: worker nào cũng phục vụ được luồng SSE,
+  mỗi lượt chạy chỉ 1 worker nhận (claim nguyên tử)
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Union
+
+from services.shared_cache import get_shared_cache
+from utils import metrics
+from utils.relative_dates import canonicalize_sql
+
+WATCH_NS = "watches"
+WATCH_EVENTS_NS = "watch_events"
+WATCH_CLAIMS_NS = "watch_claims"
+WATCH_TTL = 7 * 24 * 60 * 60
+
+WATCH_MIN_INTERVAL = int(os.environ.get("WATCH_MIN_INTERVAL", "60"))
+WATCH_MAX_ACTIVE = int(os.environ.get("WATCH_MAX_ACTIVE", "200"))
+WATCH_TICK_SECONDS = 5
+WATCH_MAX_CONCURRENCY = int(os.environ.get("WATCH_MAX_CONCURRENCY", "4"))
+MAX_EVENTS = 20
+MAX_WATCH_ROWS = 5000
+MAX_DIFF_ITEMS = 100
+
+
+def _row_hash(row: Any) -> str:
+    return hashlib.sha1(json.dumps(row, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+def rows_hash(rows: List[Dict]) -> str:
+    """Hash không phụ thuộc thứ tự dòng (SQL không ORDER BY trả cùng dữ liệu theo thứ tự khác = không đổi)"""
+    return hashlib.sha1("\n".join(sorted(_row_hash(r) for r in rows)).encode("ascii")).hexdigest()
+
+
+def _row_key_column(rows: List[Dict]) -> Union[str, None]:
+    """Cột khóa để nhận ra "cùng 1 dòng" giữa 2 lần chạy (id, rồi *_id); không có -> so cả dòng"""
+    if not rows:
+        return None
+    columns = list(rows[0].keys())
+    candidates = [c for c in columns if c == "id"] + [c for c in columns if c.endswith("_id")]
+    for column in candidates:
+        values = [r.get(column) for r in rows]
+        if None not in values and len(set(map(str, values))) == len(values):
+            return column
+    return None
+
+
+def diff_rows(before: List[Dict], after: List[Dict]) -> Dict[str, Any]:
+    """{"added": [...], "removed": [...], "changed": [{"key", "before", "after"}]} (mỗi loại tối đa MAX_DIFF_ITEMS)"""
+    key_col = _row_key_column(after) or _row_key_column(before)
+    if key_col and all(key_col in r for r in before + after):
+        old = {str(r[key_col]): r for r in before}
+        new = {str(r[key_col]): r for r in after}
+        added = [new[k] for k in new if k not in old]
+        removed = [old[k] for k in old if k not in new]
+        changed = [{"key": k, "before": old[k], "after": new[k]} for k in new if k in old and old[k] != new[k]]
+    else:
+        old = {_row_hash(r): r for r in before}
+        new = {_row_hash(r): r for r in after}
+        added = [r for h, r in new.items() if h not in old]
+        removed = [r for h, r in old.items() if h not in new]
+        changed = []
+    return {
+        "available": True,
+        "key": key_col,
+        "counts": {"added": len(added), "removed": len(removed), "changed": len(changed)},
+        "added": added[:MAX_DIFF_ITEMS],
+        "removed": removed[:MAX_DIFF_ITEMS],
+        "changed": changed[:MAX_DIFF_ITEMS],
+    }
+
+
+def _no_diff(rows: List[Dict]) -> Dict[str, Any]:
+    """Lần chạy trước quá MAX_WATCH_ROWS dòng (chỉ giữ hash) -> không tính được diff, chỉ báo có thay đổi"""
+    return {"available": False, "key": None, "row_count": len(rows),
+            "counts": None, "added": [], "removed": [], "changed": []}
+
+
+def _as_rows(data: Any) -> List[Dict]:
+    if isinstance(data, dict):
+        return [data]
+    return data if isinstance(data, list) else []
+
+
+# ---------- LƯU TRỮ ----------
+def create_watch(question: str, sql: str, interval: int, rows: Any, answer: str,
+                 owner: str = "") -> Dict[str, Any]:
+    cache = get_shared_cache()
+    if sum(1 for _ in cache.items(WATCH_NS)) >= WATCH_MAX_ACTIVE:
+        raise ValueError(f"Đã đạt tối đa {WATCH_MAX_ACTIVE} câu hỏi theo dõi")
+    now = time.time()
+    rows = _as_rows(rows)
+    watch = {
+        "id": uuid.uuid4().hex[:12],
+        "question": question,
+        "sql": sql,                     # SQL gốc (CURDATE()...) -> mỗi lần chạy chuẩn hóa theo ngày mới
+        "interval": max(WATCH_MIN_INTERVAL, int(interval)),
+        "owner": owner,
+        "created_at": now,
+        "last_run_at": now,
+        "next_run_at": now + max(WATCH_MIN_INTERVAL, int(interval)),
+        "seq": 0,
+        "hash": rows_hash(rows),
+        "rows": rows if len(rows) <= MAX_WATCH_ROWS else None,  # None -> lần đổi sau không có diff
+        "answer": answer,
+        "error": None,
+    }
+    cache.set(WATCH_NS, watch["id"], watch, ttl=WATCH_TTL)
+    cache.set(WATCH_EVENTS_NS, watch["id"], [], ttl=WATCH_TTL)
+    metrics.incr("watch.created")
+    return watch
+
+
+def get_watch(watch_id: str, owner: Union[str, None] = None) -> Union[Dict[str, Any], None]:
+    """owner khác None -> chỉ trả watch của đúng client đã tạo (người khác thấy như không tồn tại)"""
+    watch = get_shared_cache().get(WATCH_NS, watch_id)
+    if watch is None or (owner is not None and watch.get("owner") != owner):
+        return None
+    return watch
+
+
+def delete_watch(watch_id: str, owner: Union[str, None] = None) -> bool:
+    cache = get_shared_cache()
+    if get_watch(watch_id, owner) is None:
+        return False
+    cache.delete(WATCH_NS, watch_id)
+    cache.delete(WATCH_EVENTS_NS, watch_id)
+    return True
+
+
+def get_events(watch_id: str, after_seq: int = 0) -> List[Dict[str, Any]]:
+    events = get_shared_cache().get(WATCH_EVENTS_NS, watch_id) or []
+    return [e for e in events if e["seq"] > after_seq]
+
+
+# ---------- CHẠY ĐỊNH KỲ ----------
+async def run_watch(watch: Dict[str, Any],
+                    execute: Callable[[str], Awaitable[Any]],
+                    answer: Callable[[str, Any], Awaitable[str]]) -> Dict[str, Any]:
+    """Chạy lại SQL đóng băng; chỉ sinh câu trả lời + phát sự kiện khi dữ liệu đổi"""
+    cache = get_shared_cache()
+    now = time.time()
+    watch["last_run_at"] = now
+    watch["next_run_at"] = now + watch["interval"]
+    metrics.incr("watch.runs")
+
+    data = await execute(canonicalize_sql(watch["sql"])[0])
+    if isinstance(data, str):
+        watch["error"] = data  # Lỗi HRM -> giữ kết quả cũ, lượt sau thử lại
+        metrics.incr("watch.errors")
+    else:
+        rows = _as_rows(data)
+        watch["error"] = None
+        new_hash = rows_hash(rows)
+        if new_hash == watch["hash"]:
+            metrics.incr("watch.unchanged")   # Mỗi lượt không đổi = bớt 2 lần gọi LLM so với hỏi lại
+        else:
+            diff = diff_rows(watch["rows"], rows) if watch["rows"] is not None else _no_diff(rows)
+            watch["answer"] = await answer(watch["question"], rows)
+            watch["hash"] = new_hash
+            watch["rows"] = rows if len(rows) <= MAX_WATCH_ROWS else None
+            watch["seq"] += 1
+            event = {"seq": watch["seq"], "at": now, "diff": diff, "answer": watch["answer"]}
+            await asyncio.to_thread(_append_event, cache, watch["id"], event)
+            metrics.incr("watch.changed")
+
+    await asyncio.to_thread(_save_if_exists, cache, watch)
+    return watch
+
+
+def _append_event(cache, watch_id: str, event: Dict[str, Any]) -> None:
+    events = cache.get(WATCH_EVENTS_NS, watch_id) or []
+    events.append(event)
+    cache.set(WATCH_EVENTS_NS, watch_id, events[-MAX_EVENTS:], ttl=WATCH_TTL)
+
+
+def _save_if_exists(cache, watch: Dict[str, Any]) -> None:
+    if cache.get(WATCH_NS, watch["id"]) is not None:  # Chưa bị xóa trong lúc chạy
+        cache.set(WATCH_NS, watch["id"], watch, ttl=WATCH_TTL)
+
+
+class WatchScheduler:
+    def __init__(self):
+        self._task = None
+        self._running = set()
+        self._tasks = set()  # Giữ tham chiếu để task chạy nền không bị thu gom
+        self._semaphore = None
+
+    def start(self, execute: Callable[[str], Awaitable[Any]],
+              answer: Callable[[str, Any], Awaitable[str]]) -> None:
+        """Gọi trong event loop lúc khởi động (mỗi worker 1 scheduler, lượt chạy được chia qua claim)"""
+        if self._task is None:
+            self._semaphore = asyncio.Semaphore(WATCH_MAX_CONCURRENCY)
+            self._task = asyncio.ensure_future(self._loop(execute, answer))
+
+    async def _run_claimed(self, watch, execute, answer):
+        try:
+            async with self._semaphore:
+                await run_watch(watch, execute, answer)
+        except Exception as e:
+            print(f"⚠️ Watch {watch['id']} lỗi: {e}")
+        finally:
+            self._running.discard(watch["id"])
+
+    def _claim_due(self, now: float) -> List[Dict[str, Any]]:
+        """Các watch tới lượt chạy mà worker này giành được (đọc / ghi SQLite -> gọi trong thread)"""
+        cache, claimed = get_shared_cache(), []
+        for watch_id, watch in list(cache.items(WATCH_NS)):
+            if watch["next_run_at"] > now or watch_id in self._running:
+                continue
+            # Mỗi lượt (next_run_at) chỉ 1 worker được chạy
+            if cache.add(WATCH_CLAIMS_NS, f"{watch_id}:{watch['next_run_at']}", 1, ttl=watch["interval"]):
+                claimed.append(watch)
+        return claimed
+
+    async def _loop(self, execute, answer):
+        while True:
+            try:
+                for watch in await asyncio.to_thread(self._claim_due, time.time()):
+                    self._running.add(watch["id"])
+                    task = asyncio.ensure_future(self._run_claimed(watch, execute, answer))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+            except Exception as e:
+                print(f"⚠️ Watch scheduler lỗi: {e}")
+            await asyncio.sleep(WATCH_TICK_SECONDS)
+
+
+watch_scheduler = WatchScheduler()
+
+
+def watch_stats() -> Dict[str, Any]:
+    return {
+        "active": sum(1 for _ in get_shared_cache().items(WATCH_NS)),
+        "runs": metrics.get("watch.runs"),
+        "changed": metrics.get("watch.changed"),
+        "unchanged": metrics.get("watch.unchanged"),
+        "errors": metrics.get("watch.errors"),
+    }
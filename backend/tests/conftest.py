@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+# Cache / log dùng thư mục tạm riêng cho mỗi lần chạy test (không đụng ./cache của server)
+_TMP = tempfile.mkdtemp(prefix="chatbot_tests_")
+os.environ.setdefault("SHARED_CACHE_PATH", os.path.join(_TMP, "shared_cache.db"))
+os.environ.setdefault("SCHEMA_CACHE_PATH", os.path.join(_TMP, "schema.json"))
+os.environ.setdefault("QUERY_LOG_PATH", os.path.join(_TMP, "query_log.jsonl"))
+os.environ.setdefault("REPORT_DIR", os.path.join(_TMP, "reports"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
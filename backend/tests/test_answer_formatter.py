@@ -0,0 +1,52 @@
+from services.answer_formatter import format_value, render_local_answer
+from services.entity_index import entity_index
+
+
+def test_empty_answer_uses_time_phrase_from_question():
+    assert render_local_answer("Hôm qua ai đi muộn?", []) == "Tuyệt vời! Hôm qua không có nhân viên nào đi muộn."
+    assert render_local_answer("Tuần trước ai nghỉ làm?", []) == "Tuần trước toàn bộ nhân viên đều đi làm đầy đủ."
+
+
+def test_empty_answer_defaults_to_today():
+    assert render_local_answer("Ai đi muộn?", []) == "Tuyệt vời! Hôm nay không có nhân viên nào đi muộn."
+    assert render_local_answer("Ai nghỉ phép?", []) == "Hiện không có nhân viên nào nghỉ phép."
+
+
+def test_explicit_date_goes_to_llm():
+    assert render_local_answer("Ai đi muộn ngày 15/10?", []) is None
+
+
+def test_lookup_scalar_is_not_a_total():
+    assert render_local_answer("Lương cơ bản của Nam là bao nhiêu?",
+                               [{"luong_co_ban": 12_000_000}]) == "Dạ, lương cơ bản là 12.000.000."
+    assert render_local_answer("Tiến độ dự án X là bao nhiêu?", [{"phan_tram": 45.5}]) == "Dạ, tiến độ là 45,5%."
+
+
+def test_count_scalar():
+    assert render_local_answer("Có bao nhiêu nhân viên?", [{"total": 120}]) == "Dạ, tổng số là 120."
+    assert render_local_answer("Có bao nhiêu nhân viên?", [{"COUNT(*)": 120}]) == "Dạ, tổng số là 120."
+
+
+def test_dem_matches_whole_word_only():
+    assert render_local_answer("demo số điện thoại", [{"so_dien_thoai": "0901"}]) == "Dạ, số điện thoại là 0901."
+
+
+def test_format_value():
+    assert format_value("luong", 10_000_000) == "10.000.000"
+    assert format_value("luong", 1234.5) == "1.234,50"
+    assert format_value("x", None) == "(trống)"
+
+
+def test_scoped_empty_result_goes_to_llm():
+    assert render_local_answer("phòng Marketing hôm nay ai đi muộn", []) is None
+    assert render_local_answer("Trần Đình Nam có công việc nào trễ hạn không", []) is None
+    assert render_local_answer("dự án Oracle có việc nào quá hạn không", []) is None
+
+
+def test_scoped_by_indexed_name_goes_to_llm():
+    entity_index.load({"nhanvien": [{"id": 7, "name": "Trần Đình Nam"}]})
+    try:
+        assert render_local_answer("tran dinh nam hom qua co di muon khong", []) is None
+        assert render_local_answer("hôm qua ai đi muộn", []) == "Tuyệt vời! Hôm qua không có nhân viên nào đi muộn."
+    finally:
+        entity_index.load({})
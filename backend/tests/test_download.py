@@ -0,0 +1,53 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-fake-for-tests")
+
+import api  # noqa: E402
+from services.report_store import EXPORT_DIR, register_report, sign_download  # noqa: E402
+
+CONTENT = b"%PDF-1.4 bao cao thu\n" * 64
+
+
+@pytest.fixture(scope="module")
+def link():
+    filepath = os.path.join(EXPORT_DIR, "bao_cao_test.pdf")
+    with open(filepath, "wb") as f:
+        f.write(CONTENT)
+    register_report(filepath)
+    return f"/download/{sign_download('bao_cao_test.pdf')}"
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(api.app)
+
+
+def test_full_get_returns_whole_file(client, link):
+    resp = client.get(link)
+    assert resp.status_code == 200
+    assert resp.content == CONTENT
+    assert resp.headers["content-type"] == "application/pdf"
+    assert resp.headers["etag"]
+    assert "bao_cao_test.pdf" in resp.headers["content-disposition"]
+
+
+def test_head_returns_headers_without_body(client, link):
+    resp = client.head(link)
+    assert resp.status_code == 200
+    assert resp.content == b""
+    assert resp.headers["content-length"] == str(len(CONTENT))
+
+
+def test_range_and_conditional_requests(client, link):
+    resp = client.get(link, headers={"Range": "bytes=0-9"})
+    assert resp.status_code == 206
+    assert resp.content == CONTENT[:10]
+    etag = client.head(link).headers["etag"]
+    assert client.get(link, headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_bad_token_is_404(client):
+    assert client.get("/download/khong-hop-le.abc").status_code == 404
@@ -0,0 +1,73 @@
+from services.hrm_backends import HrmBackend, merge_results, select_aggregates
+from utils.row_stream import RowSet
+
+A = HrmBackend("a", "Công ty A", "http://a")
+B = HrmBackend("b", "Công ty B", "http://b")
+
+
+def _merge(sql, rows_a, rows_b):
+    merged = merge_results(sql, [(A, RowSet.from_records(rows_a)), (B, RowSet.from_records(rows_b))])
+    return merged.columns, list(merged)
+
+
+def test_select_aggregates():
+    assert select_aggregates("SELECT trang_thai, COUNT(*) AS so, SUM(a) / SUM(b) r FROM t GROUP BY trang_thai") == {
+        "trang_thai": None, "so": "count", "r": "?"}
+    assert select_aggregates("SELECT * FROM t") is None
+
+
+def test_counts_are_summed_per_shared_group():
+    columns, rows = _merge("SELECT trang_thai, COUNT(*) AS so FROM du_an GROUP BY trang_thai",
+                           [{"trang_thai": "Mở", "so": 3}, {"trang_thai": "Đóng", "so": 1}],
+                           [{"trang_thai": "Đóng", "so": 5}])
+    assert columns == ["trang_thai", "so"]
+    assert sorted(rows) == [("Mở", 3), ("Đóng", 6)]
+
+
+def test_same_name_in_two_companies_is_not_summed():
+    columns, rows = _merge("SELECT nv.ho_ten, COUNT(*) AS so_viec FROM nhan_vien nv GROUP BY nv.id, nv.ho_ten",
+                           [{"ho_ten": "Nguyễn Văn An", "so_viec": 3}],
+                           [{"ho_ten": "Nguyễn Văn An", "so_viec": 4}])
+    assert columns == ["cong_ty", "ho_ten", "so_viec"]
+    assert sorted(rows) == [("Công ty A", "Nguyễn Văn An", 3), ("Công ty B", "Nguyễn Văn An", 4)]
+
+
+def test_order_by_and_limit_are_reapplied():
+    columns, rows = _merge("SELECT ho_ten, luong FROM nhan_vien ORDER BY luong DESC LIMIT 2",
+                           [{"ho_ten": "a", "luong": 10}, {"ho_ten": "b", "luong": 5}],
+                           [{"ho_ten": "c", "luong": 12}, {"ho_ten": "d", "luong": 1}])
+    assert rows == [("Công ty B", "c", 12), ("Công ty A", "a", 10)]
+
+
+def test_positional_order_on_merged_groups():
+    _, rows = _merge("SELECT trang_thai, COUNT(*) AS so FROM du_an GROUP BY trang_thai ORDER BY 2 DESC LIMIT 1",
+                     [{"trang_thai": "Mở", "so": 3}, {"trang_thai": "Đóng", "so": 1}],
+                     [{"trang_thai": "Đóng", "so": 5}])
+    assert rows == [("Đóng", 6)]
+
+
+def test_decimal_string_sums_are_added_exactly():
+    _, rows = _merge("SELECT phong_ban, SUM(luong) AS tong_luong FROM nhan_vien GROUP BY phong_ban",
+                     [{"phong_ban": "Kế toán", "tong_luong": "1200.50"}, {"phong_ban": "IT", "tong_luong": "10.10"}],
+                     [{"phong_ban": "Kế toán", "tong_luong": "300.00"}])
+    assert sorted(rows) == [("IT", "10.10"), ("Kế toán", "1500.50")]
+
+
+def test_decimal_string_extremes_compare_as_numbers():
+    _, rows = _merge("SELECT MAX(luong) AS cao_nhat, MIN(luong) AS thap_nhat FROM nhan_vien",
+                     [{"cao_nhat": "9000.00", "thap_nhat": "500.00"}],
+                     [{"cao_nhat": "12000.00", "thap_nhat": "80.00"}])
+    assert rows == [("12000.00", "80.00")]
+
+
+def test_date_extremes_compare_as_text():
+    _, rows = _merge("SELECT MAX(ngay_vao_lam) AS moi_nhat FROM nhan_vien",
+                     [{"moi_nhat": "2024-03-01"}], [{"moi_nhat": "2025-01-15"}])
+    assert rows == [("2025-01-15",)]
+
+
+def test_non_numeric_sum_is_not_merged():
+    columns, rows = _merge("SELECT trang_thai, SUM(gio) AS tong FROM cham_cong GROUP BY trang_thai",
+                           [{"trang_thai": "Đủ", "tong": "n/a"}], [{"trang_thai": "Đủ", "tong": "8.00"}])
+    assert columns == ["cong_ty", "trang_thai", "tong"]
+    assert sorted(rows) == [("Công ty A", "Đủ", "n/a"), ("Công ty B", "Đủ", "8.00")]
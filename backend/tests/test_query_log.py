@@ -0,0 +1,30 @@
+import os
+
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-fake-for-tests")
+
+import api  # noqa: E402
+from services.query_log import log_query, query_stats  # noqa: E402
+
+
+def test_stats_without_details_drop_questions_and_sql(tmp_path):
+    path = str(tmp_path / "query_log.jsonl")
+    log_query("SELECT * FROM nhanvien WHERE ho_ten = 'Trần Đình Nam'", "lương của Trần Đình Nam", 0.1, path=path)
+    full = query_stats(path=path)["top_total_time"][0]
+    assert full["top_questions"] == ["lương của Trần Đình Nam"] and "Nam" in full["example_sql"]
+    public = query_stats(path=path, include_details=False)["top_total_time"][0]
+    assert "top_questions" not in public and "example_sql" not in public
+    assert public["calls"] == 1 and "Nam" not in public["fingerprint"]
+
+
+def test_endpoint_shows_details_only_to_admin(monkeypatch):
+    api.log_query("SELECT id FROM nhanvien WHERE ho_ten = 'An'", "An là ai", 0.1)
+    client = TestClient(api.app)
+    monkeypatch.setattr(api, "ADMIN_TOKEN", "bi-mat")
+    anonymous = client.get("/admin/query-stats").json()["top_total_time"]
+    assert anonymous and all("example_sql" not in s for s in anonymous)
+    wrong = client.get("/admin/query-stats", headers={"X-Admin-Token": "sai"}).json()["top_total_time"]
+    assert all("example_sql" not in s for s in wrong)
+    admin = client.get("/admin/query-stats", headers={"Authorization": "Bearer bi-mat"}).json()["top_total_time"]
+    assert all("example_sql" in s for s in admin)
@@ -0,0 +1,36 @@
+from datetime import date, datetime
+
+from utils.relative_dates import canonicalize_question, canonicalize_sql, rollover_ttl
+
+TODAY = date(2026, 10, 17)
+
+
+def test_today_and_yesterday_share_a_key():
+    today, periods = canonicalize_question("Hôm nay ai đi muộn?", TODAY)
+    yesterday, _ = canonicalize_question("Hôm qua ai đi muộn?", date(2026, 10, 18))
+    assert today == yesterday == "ngay 2026-10-17 ai di muon"
+    assert periods == {"day"}
+
+
+def test_year_needs_diacritics():
+    text, periods = canonicalize_question("Năm nay có bao nhiêu dự án?", TODAY)
+    assert text.startswith("nam 2026") and periods == {"year"}
+    text, periods = canonicalize_question("Lương của Nam nay bao nhiêu", TODAY)
+    assert "2026" not in text and not periods
+
+
+def test_canonicalize_sql_skips_string_literals():
+    sql, periods = canonicalize_sql("SELECT * FROM cc WHERE ngay = CURDATE() AND ghi_chu <> 'CURDATE()'", TODAY)
+    assert sql == "SELECT * FROM cc WHERE ngay = '2026-10-17' AND ghi_chu <> 'CURDATE()'"
+    assert periods == {"day"}
+
+
+def test_month_part():
+    sql, periods = canonicalize_sql("SELECT 1 WHERE MONTH(ngay) = MONTH(CURDATE())", TODAY)
+    assert sql == "SELECT 1 WHERE MONTH(ngay) = 10" and periods == {"month"}
+
+
+def test_rollover_ttl():
+    now = datetime(2026, 10, 17, 23, 0)
+    assert rollover_ttl(set(), {"day"}, now) == 3600
+    assert rollover_ttl({"day"}, {"day"}, now) is None
@@ -0,0 +1,53 @@
+from services.result_ops import apply_ops, parse_followup
+
+COLUMNS = ["ho_ten", "luong_co_ban", "ten_phong"]
+ROWS = [
+    {"ho_ten": "Nguyễn Văn An", "luong_co_ban": 12_000_000, "ten_phong": "Kỹ thuật"},
+    {"ho_ten": "Trần Thị Bình", "luong_co_ban": 9_000_000, "ten_phong": "Kế toán"},
+    {"ho_ten": "Lê Văn Cường", "luong_co_ban": 9_800_000, "ten_phong": "Kỹ thuật"},
+]
+
+
+def test_decimal_comma_is_not_a_clause_separator():
+    ops = parse_followup("chỉ lấy lương trên 9,5 triệu", COLUMNS, ROWS)
+    assert ops == [{"op": "filter_number", "column": "luong_co_ban", "cmp": ">", "value": 9_500_000}]
+    assert [r["ho_ten"] for r in apply_ops(ROWS, ops)] == ["Nguyễn Văn An", "Lê Văn Cường"]
+
+
+def test_comma_still_splits_clauses():
+    ops = parse_followup("lọc phòng kỹ thuật, sắp xếp theo lương giảm dần", COLUMNS, ROWS)
+    assert [op["op"] for op in ops] == ["filter", "sort"]
+    assert [r["ho_ten"] for r in apply_ops(ROWS, ops)] == ["Nguyễn Văn An", "Lê Văn Cường"]
+
+
+def test_top_n_on_previous_result():
+    ops = parse_followup("top 2 lương cao nhất", COLUMNS, ROWS)
+    assert ops == [{"op": "sort", "column": "luong_co_ban", "ascending": False}, {"op": "limit", "n": 2}]
+
+
+def test_fresh_ranking_question_is_not_a_followup():
+    assert parse_followup("5 người lương cao nhất", COLUMNS, ROWS) is None
+    assert parse_followup("top 5 nhân viên đi muộn tháng này", COLUMNS, ROWS) is None
+
+
+def test_reference_marker_keeps_ranking_followup():
+    ops = parse_followup("trong đó 2 người lương cao nhất", COLUMNS, ROWS)
+    assert ops == [{"op": "sort", "column": "luong_co_ban", "ascending": False}, {"op": "limit", "n": 2}]
+
+
+def test_unrelated_question_is_not_a_followup():
+    assert parse_followup("Ai đi muộn hôm nay?", COLUMNS, ROWS) is None
+
+
+def test_int_column_with_nulls_stays_int():
+    rows = [{"ho_ten": "An", "so_ngay": 3}, {"ho_ten": "Bình", "so_ngay": None}, {"ho_ten": "Chi", "so_ngay": 5}]
+    result = apply_ops(rows, [{"op": "sort", "column": "so_ngay", "ascending": False}])
+    assert result == [{"ho_ten": "Chi", "so_ngay": 5}, {"ho_ten": "An", "so_ngay": 3}, {"ho_ten": "Bình", "so_ngay": None}]
+    assert type(result[1]["so_ngay"]) is int
+
+
+def test_group_count_returns_plain_values():
+    rows = [{"so_ngay": 3}, {"so_ngay": None}, {"so_ngay": 3}]
+    result = apply_ops(rows, [{"op": "group_count", "column": "so_ngay"}])
+    assert result == [{"so_ngay": 3, "so_luong": 2}, {"so_ngay": None, "so_luong": 1}]
+    assert type(result[0]["so_ngay"]) is int and type(result[0]["so_luong"]) is int
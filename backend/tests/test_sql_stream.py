@@ -0,0 +1,50 @@
+from utils.sql_stream import SqlStreamDetector, find_statement_end
+
+
+def _statement(text: str) -> str:
+    detector = SqlStreamDetector()
+    detector.feed(text)
+    return detector.statement()
+
+
+def test_semicolon_inside_string_is_not_the_end():
+    text = "SELECT * FROM t WHERE ghi_chu = 'a;b'; Giải thích"
+    assert _statement(text) == "SELECT * FROM t WHERE ghi_chu = 'a;b'"
+
+
+def test_blank_line_after_trailing_comma_does_not_end():
+    assert _statement("SELECT a,\n\nb FROM t") == "SELECT a,\n\nb FROM t"
+
+
+def test_blank_line_after_keyword_does_not_end():
+    assert _statement("SELECT a FROM t WHERE\n\nx = 1\n\nGiải thích") == "SELECT a FROM t WHERE\n\nx = 1"
+
+
+def test_blank_line_before_explanation_ends():
+    assert _statement("SELECT a FROM t\n\nGiải thích: lấy cột a") == "SELECT a FROM t"
+
+
+def test_continuation_keywords():
+    for keyword in ("OFFSET 10", "DESC", "NULL", "USING (id)", "INTERVAL 1 DAY"):
+        text = f"SELECT a FROM t\n\n{keyword}\n\nGhi chú"
+        assert _statement(text) == f"SELECT a FROM t\n\n{keyword}"
+
+
+def test_code_fence():
+    assert _statement("```sql\nSELECT 1\n```\nGiải thích") == "SELECT 1"
+
+
+def test_incomplete_stream_waits():
+    assert find_statement_end("SELECT a FROM t WHERE x = 'a") is None
+
+
+def test_semicolon_inside_comments_is_not_the_end():
+    text = "SELECT id -- lấy id; tên\nFROM nhan_vien WHERE id = 1; Giải thích"
+    assert find_statement_end(text) == text.index("; Giải") + 1
+    assert _statement("SELECT id /* id; tên */ FROM nhan_vien;") == "SELECT id /* id; tên */ FROM nhan_vien"
+    assert _statement("SELECT id # ghi chú; x\nFROM t;") == "SELECT id # ghi chú; x\nFROM t"
+
+
+def test_unfinished_comment_waits():
+    assert find_statement_end("SELECT id -- lấy id;") is None
+    assert find_statement_end("SELECT id /* lấy; ") is None
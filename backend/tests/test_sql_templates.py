@@ -0,0 +1,21 @@
+from services.sql_templates import extract_slots, sql_templates
+
+
+def test_extract_slots():
+    pattern, values = extract_slots("Nhân viên đi muộn ngày 15/10 quá 30 phút", year=2026)
+    assert pattern == "nhan vien di muon ngay __ngay__ qua __so__ phut"
+    assert values["ngay"] == ["2026-10-15"] and values["so"] == [30]
+
+
+def test_learn_then_match_fills_the_slot():
+    for n in (5, 10, 3):
+        assert sql_templates.learn(f"top {n} nhân viên thâm niên lâu nhất",
+                                   f"SELECT ho_ten FROM nhan_vien ORDER BY ngay_vao_lam LIMIT {n}")
+    match = sql_templates.match("top 7 nhân viên thâm niên lâu nhất")
+    assert match is not None
+    assert match.sql == "SELECT ho_ten FROM nhan_vien ORDER BY ngay_vao_lam LIMIT 7"
+    assert not match.trusted  # Chưa đủ mẫu shadow
+
+
+def test_question_without_parameters_is_not_learned():
+    assert not sql_templates.learn("danh sách phòng ban", "SELECT * FROM phong_ban")
@@ -0,0 +1,43 @@
+import asyncio
+
+from services import watch as watch_module
+from services.watch import create_watch, diff_rows, rows_hash, run_watch
+
+ROWS = [{"id": 1, "ho_ten": "An"}, {"id": 2, "ho_ten": "Bình"}]
+
+
+def _run(watch, rows):
+    async def execute(sql):
+        return rows
+
+    async def answer(question, data):
+        return f"{len(data)} dòng"
+
+    return asyncio.run(run_watch(watch, execute, answer))
+
+
+def test_hash_ignores_row_order():
+    assert rows_hash(ROWS) == rows_hash(list(reversed(ROWS)))
+    assert rows_hash(ROWS) != rows_hash(ROWS[:1])
+
+
+def test_reordered_rows_are_not_a_change():
+    watch = create_watch("ai", "SELECT id, ho_ten FROM nhanvien", 60, ROWS, "2 dòng")
+    assert _run(watch, list(reversed(ROWS)))["seq"] == 0
+
+
+def test_keyed_diff():
+    diff = diff_rows(ROWS, [{"id": 2, "ho_ten": "Bình Minh"}, {"id": 3, "ho_ten": "Chi"}])
+    assert diff["available"] and diff["key"] == "id"
+    assert diff["counts"] == {"added": 1, "removed": 1, "changed": 1}
+
+
+def test_large_result_reports_no_diff(monkeypatch):
+    monkeypatch.setattr(watch_module, "MAX_WATCH_ROWS", 1)
+    watch = create_watch("ai", "SELECT id, ho_ten FROM nhanvien", 60, ROWS, "2 dòng")
+    assert watch["rows"] is None
+    watch = _run(watch, ROWS + [{"id": 3, "ho_ten": "Chi"}])
+    events = watch_module.get_events(watch["id"])
+    assert watch["seq"] == 1
+    assert events[-1]["diff"]["available"] is False
+    assert events[-1]["diff"]["added"] == []
@@ -0,0 +1,38 @@
+import gzip
+import json
+
+from utils.wire_format import compress_body, encode_body, to_columnar
+
+
+def test_to_columnar_fills_missing_columns():
+    assert to_columnar([{"a": 1}, {"a": 2, "b": 3}]) == {"columns": ["a", "b"], "rows": [[1, None], [2, 3]]}
+    assert to_columnar("Lỗi") == "Lỗi"
+
+
+def test_encode_body_json_by_default():
+    body, media_type = encode_body({"answer": "Dạ"}, "")
+    assert media_type == "application/json" and json.loads(body) == {"answer": "Dạ"}
+
+
+def test_small_bodies_are_not_compressed():
+    assert compress_body(b"{}", "gzip, br") == (b"{}", None)
+
+
+def test_gzip_when_requested():
+    body = json.dumps({"rows": list(range(5000))}).encode()
+    compressed, encoding = compress_body(body, "gzip")
+    assert encoding == "gzip" and gzip.decompress(compressed) == body
+
+
+def test_q_zero_encodings_are_refused():
+    body = json.dumps({"rows": list(range(5000))}).encode()
+    assert compress_body(body, "br;q=0, gzip")[1] == "gzip"
+    assert compress_body(body, "br;q=0, gzip;q=0") == (body, None)
+    assert compress_body(body, "gzip;q=0.0, *")[1] == "br"
+    assert compress_body(body, "*;q=0") == (body, None)
+    assert compress_body(body, "identity") == (body, None)
+
+
+def test_brotli_preferred_when_accepted():
+    body = json.dumps({"rows": list(range(5000))}).encode()
+    assert compress_body(body, "gzip, deflate, br;q=0.5")[1] == "br"
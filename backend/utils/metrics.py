@@ -0,0 +1,30 @@
+"""
+Bộ đếm metrics đơn giản trong tiến trình (xem qua /admin/metrics).
+"""
+import threading
+from collections import defaultdict
+from typing import Dict
+
+_counters: Dict[str, float] = defaultdict(float)
+_lock = threading.Lock()
+
+
+def incr(name: str, value: float = 1) -> None:
+    with _lock:
+        _counters[name] += value
+
+
+def get(name: str) -> float:
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def snapshot() -> Dict[str, float]:
+    with _lock:
+        return {k: round(v, 3) for k, v in sorted(_counters.items())}
+
+
+def ratio(hits: str, misses: str) -> float:
+    """Tỉ lệ hits / (hits + misses), 0 nếu chưa có dữ liệu"""
+    h, m = get(hits), get(misses)
+    return round(h / (h + m), 4) if h + m else 0.0
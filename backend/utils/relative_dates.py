@@ -0,0 +1,135 @@
+"""
+Chuẩn hóa mốc thời gian tương đối ("hôm nay", "tháng này", CURDATE()...) thành ngày cụ thể,
+để câu hỏi / SQL phụ thuộc ngày vẫn cache được an toàn:
+
+- "hôm nay ai đi muộn" (17/10)  -> "ngay 2026-10-17 ai di muon"  (= "hôm qua ai đi muộn" ngày 18/10)
+- `WHERE ngay = CURDATE()`      -> `WHERE ngay = '2026-10-17'`
+- `MONTH(CURRENT_DATE())`       -> `10`
+
+Mỗi hàm trả kèm tập "chu kỳ" (day/week/month/year) mà kết quả phụ thuộc, để tính lúc hết hạn.
+"""
+import re
+from datetime import date, datetime, timedelta
+from typing import Set, Tuple, Union
+
+from utils.text import normalize_question
+
+PERIOD_ORDER = {"day": 0, "week": 1, "month": 2, "year": 3}
+
+
+def _shift_month(d: date, months: int) -> date:
+    index = d.year * 12 + d.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _day(today: date, offset: int) -> str:
+    return f"ngay {(today + timedelta(days=offset)).isoformat()}"
+
+
+def _week(today: date, offset: int) -> str:
+    year, week, _ = (today + timedelta(weeks=offset)).isocalendar()
+    return f"tuan {year}-w{week:02d}"
+
+
+def _month(today: date, offset: int) -> str:
+    return f"thang {_shift_month(today, offset).strftime('%Y-%m')}"
+
+
+def _year(today: date, offset: int) -> str:
+    return f"nam {today.year + offset}"
+
+
+# (mẫu trên câu hỏi đã bỏ dấu, chu kỳ, hàm sinh mốc cụ thể, độ lệch)
+QUESTION_PATTERNS = [
+    (r"hom nay", "day", _day, 0),
+    (r"hom qua", "day", _day, -1),
+    (r"hom kia", "day", _day, -2),
+    (r"ngay mai", "day", _day, 1),
+    (r"tuan nay", "week", _week, 0),
+    (r"tuan (?:truoc|qua|vua roi)", "week", _week, -1),
+    (r"tuan (?:sau|toi)", "week", _week, 1),
+    (r"thang nay", "month", _month, 0),
+    (r"thang (?:truoc|qua|vua roi)", "month", _month, -1),
+    (r"thang (?:sau|toi)", "month", _month, 1),
+]
+# "nam nay" không dấu dễ nhầm với tên người (Nam) -> năm chỉ nhận dạng có dấu
+YEAR_PATTERNS = [
+    (r"năm nay", 0),
+    (r"năm (?:ngoái|trước|qua)", -1),
+    (r"năm (?:sau|tới)", 1),
+]
+
+_TODAY = r"(?:CURDATE\s*\(\s*\)|CURRENT_DATE(?:\s*\(\s*\))?(?!\w)|DATE\s*\(\s*NOW\s*\(\s*\)\s*\))"
+SQL_PART_OF_TODAY = re.compile(r"\b(YEAR|MONTH|DAY)\s*\(\s*(?:" + _TODAY + r"|NOW\s*\(\s*\))\s*\)", re.IGNORECASE)
+SQL_TODAY = re.compile(r"\b" + _TODAY, re.IGNORECASE)
+
+
+def canonicalize_question(question: str, today: Union[date, None] = None) -> Tuple[str, Set[str]]:
+    """Câu hỏi đã chuẩn hóa, mốc tương đối đổi thành ngày/tuần/tháng/năm cụ thể"""
+    today = today or date.today()
+    periods = set()
+
+    text = (question or "").lower()
+    for pattern, offset in YEAR_PATTERNS:
+        text, n = re.subn(rf"\b{pattern}\b", _year(today, offset), text)
+        if n:
+            periods.add("year")
+
+    text = normalize_question(text)
+    for pattern, period, render, offset in QUESTION_PATTERNS:
+        text, n = re.subn(rf"\b{pattern}\b", render(today, offset), text)
+        if n:
+            periods.add(period)
+    return text, periods
+
+
+def canonicalize_sql(sql: str, today: Union[date, None] = None) -> Tuple[str, Set[str]]:
+    """Thay CURDATE()/CURRENT_DATE/MONTH(CURDATE())... bằng giá trị cụ thể (không đụng tới chuỗi '...')"""
+    if not sql:
+        return sql, set()
+    today = today or date.today()
+    periods = set()
+
+    def _part(match):
+        part = match.group(1).upper()
+        periods.add({"YEAR": "year", "MONTH": "month", "DAY": "day"}[part])
+        return str({"YEAR": today.year, "MONTH": today.month, "DAY": today.day}[part])
+
+    def _today(match):
+        periods.add("day")
+        return f"'{today.isoformat()}'"
+
+    parts = re.split(r"('(?:[^']|'')*')", sql)
+    for i in range(0, len(parts), 2):
+        parts[i] = SQL_TODAY.sub(_today, SQL_PART_OF_TODAY.sub(_part, parts[i]))
+    return "".join(parts), periods
+
+
+def seconds_until_rollover(period: str, now: Union[datetime, None] = None) -> float:
+    """Số giây tới khi sang ngày / tuần / tháng / năm mới"""
+    now = now or datetime.now()
+    today = now.date()
+    if period == "day":
+        boundary = today + timedelta(days=1)
+    elif period == "week":
+        boundary = today + timedelta(days=7 - today.weekday())
+    elif period == "month":
+        boundary = _shift_month(today, 1)
+    else:
+        boundary = date(today.year + 1, 1, 1)
+    return (datetime.combine(boundary, datetime.min.time()) - now).total_seconds()
+
+
+def rollover_ttl(question_periods: Set[str], sql_periods: Set[str],
+                 now: Union[datetime, None] = None) -> Union[float, None]:
+    """
+    TTL tối đa cho SQL đã chuẩn hóa, cache theo câu hỏi đã chuẩn hóa:
+    SQL phụ thuộc chu kỳ ngắn hơn chu kỳ đã ghim trong câu hỏi (VD "ai đang nghỉ phép" -> CURDATE())
+    thì phải hết hạn khi chu kỳ đó kết thúc. None = không cần giới hạn.
+    """
+    if not sql_periods:
+        return None
+    sql_finest = min(sql_periods, key=PERIOD_ORDER.get)
+    if question_periods and PERIOD_ORDER[min(question_periods, key=PERIOD_ORDER.get)] <= PERIOD_ORDER[sql_finest]:
+        return None
+    return seconds_until_rollover(sql_finest, now)
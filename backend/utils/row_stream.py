@@ -0,0 +1,260 @@
+"""
+Đọc kết quả HRM dạng stream, giới hạn bộ nhớ.
+
+- JSON mảng được parse dần theo từng chunk HTTP (không giữ cả body + cả list dict trong RAM)
+- Mỗi dòng lưu dạng tuple + 1 header cột dùng chung (dict mỗi dòng tốn gấp ~3 lần)
+- Vượt ngưỡng dòng / byte -> phần còn lại ghi ra file tạm (JSON lines), đọc lại bằng iterator
+- Vượt trần HRM_MAX_ROWS -> dừng đọc, đánh dấu truncated
+
+Phía sau (tóm tắt, xuất Word, trả về client) duyệt RowSet như iterator / lấy trang đầu.
+"""
+import codecs
+import json
+import os
+import tempfile
+import weakref
+from typing import Any, Dict, Iterable, Iterator, List, Union
+
+HRM_INLINE_MAX_ROWS = int(os.environ.get("HRM_INLINE_MAX_ROWS", "5000"))
+HRM_INLINE_MAX_BYTES = int(os.environ.get("HRM_INLINE_MAX_BYTES", str(8 * 1024 * 1024)))
+HRM_MAX_ROWS = int(os.environ.get("HRM_MAX_ROWS", "500000"))
+HRM_SPILL_DIR = os.environ.get("HRM_SPILL_DIR") or None   # None -> thư mục tạm của hệ thống
+
+_WHITESPACE = " \t\r\n"
+
+
+def iter_json_items(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """
+    Duyệt từng phần tử của 1 mảng JSON khi body còn đang tải về.
+    Body là 1 object (không phải mảng) -> trả object đó như 1 phần tử.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf, state = "", "start"    # start -> items -> done | single
+
+    def _parse(final: bool):
+        nonlocal state
+        pos, items = 0, []
+        while True:
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            if pos >= len(buf):
+                break
+            char = buf[pos]
+            if state == "start":
+                if char == "[":
+                    state, pos = "items", pos + 1
+                    continue
+                if char == "\ufeff":
+                    pos += 1
+                    continue
+                if char != "{":
+                    raise ValueError("Body không phải JSON mảng / object")
+                state = "single"    # Object đơn -> đợi đủ body rồi parse 1 lần
+                break
+            if state in ("done", "single"):
+                break
+            if char == "]":
+                state, pos = "done", pos + 1
+                continue
+            if char == ",":
+                pos += 1
+                continue
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                break       # Phần tử chưa tải hết -> chờ chunk sau
+            if end == len(buf) and not final and not isinstance(item, (dict, list)):
+                break       # Số ở cuối buffer có thể còn chữ số ở chunk sau
+            items.append(item)
+            pos = end
+        return pos, items
+
+    for chunk in chunks:
+        buf += utf8.decode(chunk)
+        if state == "single":
+            continue
+        pos, items = _parse(final=False)
+        buf = buf[pos:]
+        yield from items
+
+    buf += utf8.decode(b"", final=True)
+    if state == "single":
+        yield json.loads(buf)
+        return
+    pos, items = _parse(final=True)
+    yield from items
+    if state != "done":
+        raise ValueError("Mảng JSON bị cắt giữa chừng")
+    if buf[pos:].strip():
+        raise ValueError("Dữ liệu thừa sau mảng JSON")
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class RowSet:
+    """Kết quả SQL: header cột + các dòng tuple, phần vượt ngưỡng nằm ở file tạm"""
+
+    def __init__(self, columns: Union[List[str], None] = None,
+                 inline_rows: int = HRM_INLINE_MAX_ROWS, inline_bytes: int = HRM_INLINE_MAX_BYTES,
+                 max_rows: int = HRM_MAX_ROWS):
+        self.columns: List[str] = list(columns or [])
+        self._index = {c: i for i, c in enumerate(self.columns)}
+        self._rows: List[tuple] = []
+        self._count = 0
+        self._spill = None
+        self._spill_path = None
+        self._finalizer = None
+        self.inline_rows = inline_rows
+        self.inline_bytes = inline_bytes
+        self.max_rows = max_rows
+        self.nbytes = 0             # Số byte body đã đọc từ HRM
+        self.truncated = False
+
+    # ---------- GHI ----------
+    def _to_tuple(self, item: Any) -> tuple:
+        if not isinstance(item, dict):
+            item = {"value": item}
+        columns = self.columns
+        if len(item) == len(columns):
+            try:
+                return tuple([item[c] for c in columns])
+            except KeyError:
+                pass
+        for key in item:
+            if key not in self._index:      # Cột mới giữa chừng -> dòng cũ ngắn hơn, đọc ra thì bù None
+                self._index[key] = len(columns)
+                columns.append(key)
+        return tuple([item.get(c) for c in columns])
+
+    def append(self, item: Any) -> bool:
+        """Thêm 1 dòng (dict); False khi đã chạm trần max_rows"""
+        if self._count >= self.max_rows:
+            self.truncated = True
+            return False
+        row = self._to_tuple(item)
+        if self._spill is None and (len(self._rows) >= self.inline_rows or self.nbytes > self.inline_bytes):
+            fd, self._spill_path = tempfile.mkstemp(prefix="hrm_rows_", suffix=".jsonl", dir=HRM_SPILL_DIR)
+            self._spill = os.fdopen(fd, "w", encoding="utf-8")
+            self._finalizer = weakref.finalize(self, _remove_file, self._spill_path)
+        if self._spill is None:
+            self._rows.append(row)
+        else:
+            self._spill.write(json.dumps(row, ensure_ascii=False, default=str))
+            self._spill.write("\n")
+        self._count += 1
+        return True
+
+    def finish(self) -> "RowSet":
+        if self._spill is not None and not self._spill.closed:
+            self._spill.close()
+        return self
+
+    def close(self) -> None:
+        """Xóa file tạm (nếu có); tự gọi khi RowSet bị thu gom"""
+        self.finish()
+        if self._finalizer is not None:
+            self._finalizer()
+
+    # ---------- ĐỌC ----------
+    @property
+    def spilled(self) -> bool:
+        return self._spill_path is not None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __bool__(self) -> bool:
+        return self._count > 0
+
+    def __iter__(self) -> Iterator[tuple]:
+        """Duyệt mọi dòng (tuple đủ số cột), lần lượt phần trong RAM rồi file tạm"""
+        width = len(self.columns)
+        for row in self._rows:
+            yield row if len(row) == width else row + (None,) * (width - len(row))
+        if self._spill_path is None:
+            return
+        self.finish()
+        with open(self._spill_path, encoding="utf-8") as f:
+            for line in f:
+                row = tuple(json.loads(line))
+                yield row if len(row) == width else row + (None,) * (width - len(row))
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        columns = self.columns
+        for row in self:
+            yield dict(zip(columns, row))
+
+    def records(self, limit: Union[int, None] = None) -> List[Dict[str, Any]]:
+        """Các dòng đầu dạng dict (None = tất cả)"""
+        out = []
+        for record in self.iter_records():
+            if limit is not None and len(out) >= limit:
+                break
+            out.append(record)
+        return out
+
+    def page(self, offset: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
+        out = []
+        for i, record in enumerate(self.iter_records()):
+            if i >= offset + limit:
+                break
+            if i >= offset:
+                out.append(record)
+        return out
+
+    def preview_text(self, limit: int) -> str:
+        """Dữ liệu đưa vào prompt: tối đa `limit` dòng đầu + ghi chú tổng số dòng"""
+        text = str(self.records(limit))
+        if self._count > limit or self.truncated:
+            total = f"hơn {self._count}" if self.truncated else str(self._count)
+            text += f"\n(Chỉ hiển thị {limit} dòng đầu / tổng {total} dòng)"
+        return text
+
+    # ---------- CACHE ----------
+    def to_compact(self) -> Dict[str, Any]:
+        return {"columns": self.columns, "rows": [list(r) for r in self]}
+
+    @classmethod
+    def from_records(cls, data: Any) -> "RowSet":
+        rows = cls()
+        for item in ([data] if isinstance(data, dict) else data or []):
+            rows.append(item)
+        return rows.finish()
+
+    @classmethod
+    def from_cached(cls, value: Any) -> "RowSet":
+        """Giá trị trong cache kết quả: dạng gọn {columns, rows} hoặc list dict (bản ghi cũ)"""
+        if isinstance(value, dict) and set(value) == {"columns", "rows"}:
+            rows = cls(value["columns"], inline_rows=len(value["rows"]) + 1)
+            rows._rows = [tuple(r) for r in value["rows"]]
+            rows._count = len(rows._rows)
+            return rows
+        return cls.from_records(value)
+
+
+def ingest_json(chunks: Iterable[bytes], **limits: Any) -> RowSet:
+    """Body JSON (theo chunk) -> RowSet; dừng đọc sớm khi chạm trần số dòng"""
+    rows = RowSet(**limits)
+
+    def _counted():
+        for chunk in chunks:
+            rows.nbytes += len(chunk)
+            yield chunk
+
+    try:
+        for item in iter_json_items(_counted()):
+            if not rows.append(item):
+                break
+    except BaseException:
+        rows.close()
+        raise
+    return rows.finish()
+
@@ -0,0 +1,37 @@
+import re
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Chuẩn hóa SQL để so sánh 2 câu có cùng ý nghĩa:
+    bỏ dấu ; cuối, gộp khoảng trắng, viết thường phần ngoài chuỗi ký tự ('...').
+    """
+    if not sql:
+        return ""
+    sql = sql.strip().rstrip(";").strip()
+    parts = re.split(r"('(?:[^']|'')*')", sql)
+    out = []
+    for i, part in enumerate(parts):
+        if i % 2 == 1:
+            out.append(part)  # Giữ nguyên literal (tên người, trạng thái có phân biệt hoa thường)
+        else:
+            part = re.sub(r"\s+", " ", part.lower())
+            part = re.sub(r"\s*([(),=<>])\s*", r"\1", part)
+            out.append(part)
+    return "".join(out).strip()
+
+
+# Literal trong SQL: chuỗi '...' ('' là dấu nháy escape) hoặc số đứng riêng (không dính tên cột như t1)
+SQL_LITERAL = re.compile(r"'(?:[^']|'')*'|(?<![\w.])\d+(?:\.\d+)?(?![\w.])")
+
+
+def sql_fingerprint(sql: str) -> str:
+    """
+    Dấu vân tay của câu SQL: bỏ hết literal (tên người, ngày, số...) -> các câu chỉ khác
+    tham số có cùng fingerprint. VD: ... WHERE ho_ten LIKE '%Nam%' LIMIT 5 -> ... like ? limit ?
+    """
+    normalized = normalize_sql(sql)
+    if not normalized:
+        return ""
+    fingerprint = SQL_LITERAL.sub("?", normalized)
+    return re.sub(r"\(\?(?:,\?)+\)", "(?)", fingerprint)  # IN (1,2,3) ~ IN (1)
@@ -0,0 +1,113 @@
+import re
+from typing import Union
+
+# Dòng tiếp theo bắt đầu bằng các từ này thì vẫn là phần của câu SQL
+SQL_CONTINUATION = re.compile(
+    r"^\s*(?:(?:select|from|where|join|left|right|inner|outer|cross|group|order|by|having|limit|offset|"
+    r"and|or|union|all|with|on|using|case|when|then|else|end|as|asc|desc|not|in|is|null|exists|between|"
+    r"like|distinct|interval)\b|--|\(|\))",
+    re.IGNORECASE,
+)
+# Câu lệnh chưa thể kết thúc nếu phần trước dòng trống dừng ở dấu phẩy / toán tử / từ khóa cần vế sau
+SQL_INCOMPLETE_TAIL = re.compile(
+    r"(?:[,(=<>+\-*/%]|\b(?:select|from|where|join|left|right|inner|outer|cross|group|order|by|having|"
+    r"limit|offset|and|or|union|all|with|on|using|case|when|then|else|as|not|in|is|exists|between|"
+    r"like|distinct|interval))\s*$",
+    re.IGNORECASE,
+)
+
+
+def find_statement_end(text: str, finished: bool = False) -> Union[int, None]:
+    """
+    Tìm vị trí kết thúc câu SQL đầu tiên trong output (đang stream) của LLM.
+    Trả về index kết thúc, hoặc None nếu câu lệnh chưa hoàn chỉnh.
+
+    Dấu hiệu kết thúc: dấu ; ngoài chuỗi và comment (--, #, /* */), dấu đóng ```, hoặc dòng trống mà dòng sau
+    không còn là SQL (LLM bắt đầu giải thích) và phần trước đó đã có thể là câu lệnh hoàn chỉnh
+    (không dừng ở dấu phẩy, toán tử hay từ khóa cần vế sau).
+    """
+    start = 0
+    stripped = text.lstrip()
+    if stripped.startswith("NO_DATA"):
+        return len(text) - len(stripped) + len("NO_DATA")
+    if stripped.startswith("```"):
+        newline = text.find("\n", len(text) - len(stripped))
+        if newline == -1:
+            return None
+        start = newline + 1
+
+    quote = None
+    depth = 0
+    seen_sql = False
+    i = start
+    n = len(text)
+    while i < n:
+        c = text[i]
+        if quote:
+            if c == quote:
+                if i + 1 >= n and not finished:
+                    return None  # Có thể là '' (escape), chờ thêm ký tự
+                if i + 1 < n and text[i + 1] == quote:
+                    i += 1
+                else:
+                    quote = None
+        elif text.startswith("--", i) or c == "#":
+            newline = text.find("\n", i)
+            if newline == -1:
+                return None  # Comment chưa hết dòng (dấu ; trong comment không tính)
+            i = newline  # Ký tự xuống dòng xét ở vòng sau (dòng trống vẫn là dấu hiệu kết thúc)
+            continue
+        elif text.startswith("/*", i):
+            close = text.find("*/", i + 2)
+            if close == -1:
+                return None
+            i = close + 2
+            continue
+        elif text.startswith("```", i):
+            if seen_sql:
+                return i
+        elif c in ("'", '"'):
+            quote = c
+        elif c == ";":
+            return i + 1
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth = max(0, depth - 1)
+        elif (c == "\n" and seen_sql and depth == 0 and text.startswith("\n\n", i)
+              and not SQL_INCOMPLETE_TAIL.search(text[start:i])):
+            rest = text[i:].lstrip()
+            if not finished and not re.match(r"^\S+\s", rest):
+                return None  # Chưa đủ 1 từ của dòng sau để biết còn là SQL hay không
+            if not rest:
+                return i
+            if not SQL_CONTINUATION.match(rest):
+                return i
+        if not c.isspace():
+            seen_sql = True
+        i += 1
+    return None
+
+
+class SqlStreamDetector:
+    """Nhận từng chunk output của LLM, báo ngay khi đã có đủ 1 câu SQL hoàn chỉnh"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.end = None
+
+    def feed(self, chunk: str) -> bool:
+        if self.end is not None:
+            return True
+        self.buffer += chunk
+        self.end = find_statement_end(self.buffer)
+        return self.end is not None
+
+    def statement(self) -> str:
+        """Câu SQL (đã bỏ ```sql, dấu ; và phần giải thích phía sau)"""
+        end = self.end if self.end is not None else find_statement_end(self.buffer, finished=True)
+        text = self.buffer[:end] if end is not None else self.buffer
+        text = text.strip()
+        if text.startswith("```"):
+            text = text.split("\n", 1)[1] if "\n" in text else ""
+        return text.replace("```", "").strip().rstrip(";").strip()
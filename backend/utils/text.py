@@ -0,0 +1,19 @@
+import re
+import unicodedata
+
+
+def fold_text(text: str) -> str:
+    """Bỏ dấu tiếng Việt, viết thường và gộp khoảng trắng (Trần Đình Nam -> tran dinh nam)"""
+    if text is None:
+        return ""
+    text = str(text).replace("đ", "d").replace("Đ", "D")
+    text = unicodedata.normalize("NFD", text)
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    return re.sub(r"\s+", " ", text.lower()).strip()
+
+
+def normalize_question(text: str) -> str:
+    """Chuẩn hóa câu hỏi để so khớp: bỏ dấu, bỏ ký tự câu (?, !, ...)"""
+    folded = fold_text(text)
+    folded = re.sub(r"[^\w%'\s]", " ", folded)
+    return re.sub(r"\s+", " ", folded).strip()
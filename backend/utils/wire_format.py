@@ -0,0 +1,92 @@
+"""
+Định dạng response gọn cho ChatResponse.data (opt-in):
+- Dạng cột {columns, rows}: không lặp lại tên cột ở mỗi dòng
+- Serialize nhanh bằng orjson, hoặc MessagePack nếu client gửi Accept: application/msgpack
+- Nén gzip/brotli khi body lớn hơn ngưỡng và client hỗ trợ (Accept-Encoding)
+orjson / msgpack / brotli là tùy chọn: không cài thì tự lùi về json / gzip.
+"""
+import gzip
+import json
+import os
+from typing import Any, Dict, Tuple, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - tùy môi trường
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "4096"))
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+def to_columnar(data: Any) -> Any:
+    """[{a:1,b:2},{a:3,b:4}] -> {"columns": [a,b], "rows": [[1,2],[3,4]]}; dạng khác giữ nguyên"""
+    if not isinstance(data, list) or not data or not all(isinstance(r, dict) for r in data):
+        return data
+    columns = list(data[0].keys())
+    known = set(columns)
+    for row in data:
+        # Các dòng không cùng bộ cột -> gom đủ cột, thiếu thì null
+        for key in row:
+            if key not in known:
+                known.add(key)
+                columns.append(key)
+    return {"columns": columns, "rows": [[row.get(c) for c in columns] for row in data]}
+
+
+def encode_body(payload: Dict, accept: str = "") -> Tuple[bytes, str]:
+    """Serialize theo Accept: MessagePack nếu được yêu cầu, mặc định JSON (orjson nếu có)"""
+    accept = (accept or "").lower()
+    if msgpack is not None and any(t in accept for t in MSGPACK_TYPES):
+        return msgpack.packb(payload, use_bin_type=True, default=str), "application/msgpack"
+    if orjson is not None:
+        return orjson.dumps(payload, default=str), "application/json"
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str)
+    return body.encode("utf-8"), "application/json"
+
+
+def _accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """Accept-Encoding -> {encoding: q}; thiếu q coi như 1, q không hợp lệ coi như 0"""
+    accepted = {}
+    for part in (accept_encoding or "").lower().split(","):
+        token, _, params = part.partition(";")
+        token = token.strip()
+        if not token:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[token] = q
+    return accepted
+
+
+def _accepts(accepted: Dict[str, float], encoding: str) -> bool:
+    """Client nhận encoding này? (q=0 là từ chối; "*" áp dụng cho encoding không nêu tên)"""
+    return accepted.get(encoding, accepted.get("*", 0.0)) > 0
+
+
+def compress_body(body: bytes, accept_encoding: str = "") -> Tuple[bytes, Union[str, None]]:
+    """Nén nếu body đủ lớn và client chấp nhận (q > 0): ưu tiên brotli, sau đó gzip"""
+    if len(body) < COMPRESS_MIN_BYTES:
+        return body, None
+    accepted = _accepted_encodings(accept_encoding)
+    if brotli is not None and _accepts(accepted, "br"):
+        return brotli.compress(body, quality=5), "br"
+    if _accepts(accepted, "gzip"):
+        return gzip.compress(body, compresslevel=5), "gzip"
+    return body, None
@@ -3,6 +3,9 @@ import "./App.css";
 
 const API_URL = `${import.meta.env.VITE_API_BASE}/chat`;
 
+// Mã phiên chat: backend dùng để xử lý câu hỏi nối tiếp trên kết quả trước
+const SESSION_ID = crypto.randomUUID();
+
 
 
 interface Message {
@@ -53,7 +56,7 @@ export default function App() {
       const res = await fetch(API_URL, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ question: messageText }),
+        body: JSON.stringify({ question: messageText, session_id: SESSION_ID }),
       });
 
       const data = await res.json();